@@ -10,6 +10,8 @@ from typing import List, Dict, Any, Optional
 from .rag_agent import RAGAgent
 from services.image_service import ImageService
 from services.document_service import DocumentService
+from services.llm_scheduler import get_llm_scheduler
+from services.llm_cache import get_llm_cache
 import config
 
 class ConversationManager:
@@ -72,7 +74,7 @@ class ConversationManager:
             llm_model: 指定使用的LLM模型 (可選)
             
         Yields:
-            逐字串流的回應內容
+            LLM 產生的回應片段，最後為 {"__FINAL_RESPONSE__": 完整回應字典}
         """
         if chat_history is None:
             chat_history = []
@@ -89,32 +91,40 @@ class ConversationManager:
                 query_type = "rag_search"
                 print(f"📍 預設查詢類型: {query_type}")
             
-            # 先獲取完整回應
-            full_response = self.get_response(user_input, chat_history, force_query_type, llm_model)
-            answer = full_response.get("answer", "")
-            
-            # 模擬串流效果：逐字元輸出（保持格式）
-            import time
-            buffer = ""
-            for char in answer:
-                buffer += char
-                yield char
-                
-                # 在標點符號和換行符後稍微暫停，讓顯示更自然
-                if char in "。！？\n：；，":
-                    time.sleep(0.01)  # 從0.03進一步縮短為0.01
-                else:
-                    time.sleep(0.001)  # 從0.005縮短為0.001
+            if query_type == "rag_search":
+                # RAG 查詢：檢索完成後直接轉送 LLM 串流的 token
+                print("📚 執行 RAG 檢索（串流）...")
+                full_response = {
+                    "answer": "",
+                    "images": [],
+                    "source_documents": [],
+                    "query_type": query_type,
+                    "confidence": 0.0
+                }
+                for chunk in self.rag_agent.search_and_answer_stream(user_input, chat_history, llm_model):
+                    if isinstance(chunk, dict):
+                        full_response.update(chunk)
+                    else:
+                        yield chunk
                 
+                # 獲取相關圖片
+                if full_response.get("source_documents"):
+                    full_response["images"] = self.image_service.get_related_images(
+                        full_response["source_documents"], query=user_input
+                    )
+                print(f"✅ 回應生成完成，類型: {query_type}")
+            else:
+                # 其他類型（工具代理）沒有 token 串流，取得完整回應後一次輸出
+                full_response = self.get_response(user_input, chat_history, force_query_type, llm_model)
+                yield full_response.get("answer", "")
+            
             # 最後返回完整的回應數據（用於後續處理）
             yield {"__FINAL_RESPONSE__": full_response}
             
         except Exception as e:
             error_msg = f"抱歉，處理您的問題時發生錯誤：{e}"
             print(f"❌ 錯誤: {e}")
-            for char in error_msg:
-                yield char
-                time.sleep(0.001)  # 從0.005縮短為0.001
+            yield error_msg
 
     def get_response(self, user_input: str, chat_history: List[Dict] = None, force_query_type: str = None, llm_model: str = None) -> Dict[str, Any]:
         """
@@ -217,7 +227,7 @@ class ConversationManager:
             # 獲取模型狀態
             model_status = self.rag_agent.get_model_status()
             
-            return {
+            status = {
                 "database": db_status,
                 "model": model_status,
                 "agents": {
@@ -227,8 +237,17 @@ class ConversationManager:
                 "services": {
                     "image_service": "運行中",
                     "document_service": "運行中"
-                }
+                },
+                "llm_scheduler": get_llm_scheduler().get_metrics(),
+                "llm_cache": get_llm_cache().get_stats()
             }
+            if self.langchain_agent:
+                if self.langchain_agent.router:
+                    status["intent_router"] = self.langchain_agent.router.get_stats()
+                status["tools"] = self.langchain_agent.tool_manager.get_metrics()
+                status["tool_loading"] = self.langchain_agent.tool_manager.get_load_stats()
+                status["tool_cache"] = self.langchain_agent.tool_manager.cache.get_stats()
+            return status
         except Exception as e:
             return {"error": str(e)}
     
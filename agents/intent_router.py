@@ -0,0 +1,237 @@
+"""
+意圖路由器 - 在 ReAct Agent 之前以規則（必要時加上 embedding 相似度）判斷查詢應使用的工具
+格式完整的工具查詢（SPC 五個條件、IP、EDC XML、四則運算、時間、詳細資料查看）直接執行工具，
+省下 Agent 選擇工具與整理答案的 LLM 往返；信心度不足或多個工具分數接近時返回 None，交由 Agent 處理
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import re
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+import config
+
+_IP = re.compile(r'(?<![\d.])(\d{1,3}(?:\.\d{1,3}){3})(?![\d.])')
+_FACTORY = re.compile(r'\b(TFT6|CF6|LCD6|USL)\b', re.IGNORECASE)
+_MACHINE = re.compile(r'\b([A-Z]{4}\d{4})\b')
+_NUMBER = r'\d+(?:\.\d+)?'
+_ARITHMETIC = re.compile(
+    rf'^\s*(?:請|幫我)?(?:計算|算一下|算)?\s*[:：]?\s*({_NUMBER})\s*'
+    rf'(\+|＋|-|－|\*|×|/|÷|加上|加|減去|減|乘以|乘|除以|除)\s*({_NUMBER})\s*'
+    r'(?:=|＝)?\s*(?:等於多少|等於幾|是多少|多少)?\s*[?？。]?\s*$'
+)
+_TIME = re.compile(r'現在(?:幾點|時間|是幾點)|幾點了|今天(?:日期|幾號|星期幾|是幾月幾號)|目前時間|what time|current time', re.IGNORECASE)
+_DETAIL_TYPE = re.compile(r'type\s*[:：]\s*(spc|trx|all)', re.IGNORECASE)
+_DETAIL_WORDS = ("詳細資料", "詳細記錄", "詳細內容", "明細")
+
+# 規則無法判斷時，以 embedding 相似度比對的範例語句
+# （只列出可直接以原始查詢作為輸入的工具；IP 與詳細資料查看需要特定輸入格式，只由規則路由）
+ROUTE_EXAMPLES = {
+    "spc_query": ["SPC 資料沒有進 CHART", "玻璃上報後 SPC CHART 沒有點", "SPC 沒有進CHART 幫我查原因"],
+    "edc_format_check": ["EDC XML 格式檢查", "EDC 檔案格式規範", "幫我驗證 EDC XML 欄位"],
+    "edc_query": ["EDC 檔案上傳失敗", "EDC 系統狀態", "EDC 上傳問題診斷"],
+    "calculation": ["幫我計算 15 加 27", "100 除以 4 等於多少"],
+    "current_time": ["現在幾點", "今天日期是什麼"],
+}
+
+class IntentRouter:
+    """規則式意圖路由器（可選 embedding 相似度作為第二層）"""
+
+    def __init__(self, tools: Dict[str, Any], use_embedding: Optional[bool] = None):
+        """
+        Args:
+            tools: ToolManager.tools（工具名稱 -> 工具實例），只會路由到其中存在的工具
+            use_embedding: 是否啟用 embedding 相似度路由（預設讀取 INTENT_ROUTER_USE_EMBEDDING）
+        """
+        self.tools = tools
+        self.threshold = getattr(config, "INTENT_ROUTER_THRESHOLD", 0.8)
+        self.margin = getattr(config, "INTENT_ROUTER_MARGIN", 0.1)
+        self.use_embedding = getattr(config, "INTENT_ROUTER_USE_EMBEDDING", False) if use_embedding is None else use_embedding
+        self.embedding_threshold = getattr(config, "INTENT_ROUTER_EMBEDDING_THRESHOLD", 0.8)
+
+        self._example_vectors: Optional[np.ndarray] = None
+        self._example_tools: List[str] = []
+        self._embedding_lock = threading.Lock()
+
+        self._stats = {"routed": 0, "fallback": 0, "ambiguous": 0}
+        self._stats_lock = threading.Lock()
+
+    # ---- 規則 ----
+
+    def _rule_spc(self, query: str) -> List[Tuple[str, float, str, str]]:
+        spc_tool = self.tools.get("spc_query")
+        if spc_tool is None:
+            return []
+        upper = query.upper()
+        info = spc_tool._extract_spc_info(query)
+        missing = spc_tool._check_required_spc_conditions(info)
+        if not missing and ("SPC" in upper or "CHART" in upper):
+            return [("spc_query", 0.95, query, "SPC 五個條件完整")]
+        if "SPC" in upper and ("CHART" in upper or "沒有進" in query):
+            # 條件不完整時工具會列出缺少的欄位，不需要 LLM
+            return [("spc_query", 0.85, query, f"SPC 未進 CHART 查詢（缺少 {len(missing)} 個條件）")]
+        return []
+
+    def _rule_detail_viewer(self, query: str) -> List[Tuple[str, float, str, str]]:
+        match = _DETAIL_TYPE.search(query)
+        if match:
+            return [("spc_detail_viewer", 0.97, f"type:{match.group(1).lower()}", "明確指定 type")]
+        upper = query.upper()
+        if any(word in query for word in _DETAIL_WORDS) and ("SPC" in upper or "TRX" in upper):
+            if "全部" in query or "所有" in query or ("SPC" in upper and "TRX" in upper):
+                detail_type = "all"
+            else:
+                detail_type = "trx" if "TRX" in upper else "spc"
+            return [("spc_detail_viewer", 0.85, f"type:{detail_type}", "查看 SPC/TRX 詳細資料")]
+        return []
+
+    def _rule_edc(self, query: str) -> List[Tuple[str, float, str, str]]:
+        if "<?xml" in query and "<EDC>" in query:
+            return [("edc_format_check", 0.97, query, "包含 EDC XML 內容")]
+        upper = query.upper()
+        if "EDC" not in upper or _IP.search(query):
+            return []
+        if any(word in upper for word in ("格式", "XML", "規範", "欄位")):
+            return [("edc_format_check", 0.85, query, "EDC 格式問題")]
+        if any(word in query for word in ("上傳", "檔案", "系統", "狀態")) and not any(word in upper for word in ("設定", "配置", "GET")):
+            return [("edc_query", 0.8, query, "EDC 上傳/系統狀態問題")]
+        return []
+
+    def _rule_ip_config(self, query: str) -> List[Tuple[str, float, str, str]]:
+        stripped = query.strip()
+        upper = stripped.upper()
+        factory_match = _FACTORY.search(stripped)
+        factory = factory_match.group(1).upper() if factory_match else None
+        config_words = any(word in upper for word in ("設定", "配置", "GET"))
+
+        ip_match = _IP.search(stripped)
+        if ip_match:
+            ip = ip_match.group(1)
+            tool_input = f"{factory} {ip}" if factory else ip
+            remainder = upper.replace(ip, "").replace(factory or "", "").strip(" \t?？。,，")
+            if not remainder:
+                return [("ip_edc_config_check", 0.95, tool_input, "僅包含廠別與 IP")]
+            if "EDC" in upper or config_words:
+                return [("ip_edc_config_check", 0.9, tool_input, "IP 與 EDC 設定關鍵詞")]
+            return [("ip_edc_config_check", 0.6, tool_input, "包含 IP")]
+
+        machine_match = _MACHINE.search(upper)
+        if machine_match and "SPC" not in upper and "CHART" not in upper:
+            machine = machine_match.group(1)
+            tool_input = f"{factory} {machine}" if factory else machine
+            remainder = upper.replace(machine, "").replace(factory or "", "").strip(" \t?？。,，")
+            if not remainder:
+                return [("ip_edc_config_check", 0.9, tool_input, "僅包含廠別與機台名稱")]
+            if "EDC" in upper and config_words:
+                return [("ip_edc_config_check", 0.85, tool_input, "機台名稱與 EDC 設定關鍵詞")]
+        return []
+
+    def _rule_calculation(self, query: str) -> List[Tuple[str, float, str, str]]:
+        if _ARITHMETIC.match(query):
+            return [("calculation", 0.95, query, "兩個數字的四則運算")]
+        return []
+
+    def _rule_time(self, query: str) -> List[Tuple[str, float, str, str]]:
+        if _TIME.search(query) and not re.search(r'\d', query) and len(query.strip()) <= 20:
+            return [("current_time", 0.9, query, "詢問目前時間/日期")]
+        return []
+
+    def _rule_candidates(self, query: str) -> List[Tuple[str, float, str, str]]:
+        candidates = []
+        for rule in (self._rule_spc, self._rule_detail_viewer, self._rule_edc,
+                     self._rule_ip_config, self._rule_calculation, self._rule_time):
+            candidates.extend(c for c in rule(query) if c[0] in self.tools)
+        return candidates
+
+    # ---- embedding ----
+
+    def _embedding_candidates(self, query: str) -> List[Tuple[str, float, str, str]]:
+        """以範例語句的最高餘弦相似度作為各工具分數"""
+        from embedding_service import get_embedding_service
+
+        embedding_service = get_embedding_service()
+        if self._example_vectors is None:
+            with self._embedding_lock:
+                if self._example_vectors is None:
+                    tools, examples = [], []
+                    for tool_name, tool_examples in ROUTE_EXAMPLES.items():
+                        if tool_name in self.tools:
+                            tools.extend([tool_name] * len(tool_examples))
+                            examples.extend(tool_examples)
+                    self._example_tools = tools
+                    self._example_vectors = np.asarray(embedding_service.encode(examples), dtype=np.float32)
+
+        if not self._example_tools:
+            return []
+        query_vector = np.asarray(embedding_service.encode([query])[0], dtype=np.float32)
+        similarities = self._example_vectors @ query_vector
+
+        best: Dict[str, float] = {}
+        for tool_name, similarity in zip(self._example_tools, similarities):
+            best[tool_name] = max(best.get(tool_name, -1.0), float(similarity))
+        return [(tool_name, score, query, "embedding 相似度") for tool_name, score in best.items()]
+
+    # ---- 路由 ----
+
+    def _decide(self, candidates: List[Tuple[str, float, str, str]], threshold: float, method: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """
+        依信心度門檻與差距選出工具
+
+        Returns:
+            (路由決策或 None, 是否因分數接近而放棄)
+        """
+        # 同一工具只保留最高分
+        best: Dict[str, Tuple[str, float, str, str]] = {}
+        for candidate in candidates:
+            if candidate[0] not in best or candidate[1] > best[candidate[0]][1]:
+                best[candidate[0]] = candidate
+        ranked = sorted(best.values(), key=lambda c: c[1], reverse=True)
+        if not ranked or ranked[0][1] < threshold:
+            return None, False
+        if len(ranked) > 1 and ranked[0][1] - ranked[1][1] < self.margin:
+            return None, True
+
+        tool_name, confidence, tool_input, reason = ranked[0]
+        return {
+            "tool": tool_name,
+            "tool_input": tool_input,
+            "confidence": round(confidence, 3),
+            "method": method,
+            "reason": reason,
+        }, False
+
+    def route(self, query: str) -> Optional[Dict[str, Any]]:
+        """
+        判斷查詢應直接執行的工具
+
+        Returns:
+            {"tool", "tool_input", "confidence", "method", "reason"}；無法確定時返回 None（交由 Agent）
+        """
+        decision, ambiguous = self._decide(self._rule_candidates(query), self.threshold, "rule")
+
+        if decision is None and not ambiguous and self.use_embedding:
+            try:
+                decision, ambiguous = self._decide(self._embedding_candidates(query), self.embedding_threshold, "embedding")
+            except Exception as e:
+                print(f"⚠️ embedding 意圖路由失敗，交由 Agent 處理: {e}")
+
+        with self._stats_lock:
+            if decision is not None:
+                self._stats["routed"] += 1
+            else:
+                self._stats["fallback"] += 1
+                if ambiguous:
+                    self._stats["ambiguous"] += 1
+        return decision
+
+    def get_stats(self) -> Dict[str, Any]:
+        """路由統計：直接執行工具與交由 Agent 的次數"""
+        with self._stats_lock:
+            total = self._stats["routed"] + self._stats["fallback"]
+            return {
+                **self._stats,
+                "route_rate": round(self._stats["routed"] / total, 3) if total else 0.0,
+            }
@@ -4,37 +4,158 @@ LangChain 智能代理 - 使用 LLM 自動規劃和執行任務
 
 from langchain.agents import AgentExecutor, create_react_agent
 from langchain_core.prompts import PromptTemplate
+from langchain_core.messages import SystemMessage, HumanMessage, ToolMessage
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
 from langchain_openai import ChatOpenAI
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Iterator, Tuple
 import sys
 import os
+import time
+import hashlib
+import threading
 
 # 將專案根目錄加入 sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config
 from tools.tool_manager import ToolManager
+from agents.intent_router import IntentRouter
+from services.llm_scheduler import get_llm_scheduler, is_quota_exceeded, PRIORITY_INTERACTIVE
+from services.llm_cache import get_llm_cache, normalize_text
+
+# 排程器改用降級模型時，於 generation_info 標記實際使用的模型
+DEGRADED_MODEL_KEY = "degraded_model"
+
+class LangChainLLMCache(BaseCache):
+    """
+    LangChain 快取介面，存取與 LLMService 共用的 LLM 回應快取
+    指紋為 llm_string（模型與所有參數）加上正規化後的提示詞；
+    llm_string 只含請求的模型，因此由降級模型產生的回應不寫入快取
+    """
+    
+    def _key(self, prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\n{normalize_text(prompt)}".encode("utf-8")).hexdigest()
+    
+    def lookup(self, prompt: str, llm_string: str):
+        cached = get_llm_cache().get_by_key(self._key(prompt, llm_string), source="langchain")
+        if cached is None:
+            return None
+        try:
+            return loads(cached)
+        except Exception:
+            return None
+    
+    def update(self, prompt: str, llm_string: str, return_val) -> None:
+        if any((generation.generation_info or {}).get(DEGRADED_MODEL_KEY) for generation in return_val):
+            return
+        get_llm_cache().put_by_key(self._key(prompt, llm_string), "langchain", dumps(return_val))
+    
+    def clear(self, **kwargs) -> None:
+        get_llm_cache().clear()
+
+def create_chat_model(model: str, temperature: float = 0.1, max_tokens: int = 4000) -> "ScheduledChatOpenAI":
+    """建立經過排程器的 ChatOpenAI；temperature 不超過快取門檻時使用共用的回應快取"""
+    cache = LangChainLLMCache() if get_llm_cache().cacheable(temperature) else None
+    return ScheduledChatOpenAI(
+        api_key=config.API_KEY,
+        base_url=config.get_api_url(model),
+        model=model,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        cache=cache
+    )
+
+class ScheduledChatOpenAI(ChatOpenAI):
+    """
+    經過 LLM 排程器的 ChatOpenAI：每次呼叫先取得執行名額，
+    接近每日額度時以降級模型送出；每日額度用盡時改用降級模型重試一次
+    """
+    
+    priority: int = PRIORITY_INTERACTIVE
+    
+    def _report_error(self, model: str, error: Exception) -> bool:
+        """回報 429 給排程器，返回是否應改用降級模型重試"""
+        scheduler = get_llm_scheduler()
+        if is_quota_exceeded(str(error)):
+            scheduler.report_quota_exceeded(model)
+            return scheduler.resolve_model(model) != model
+        if "429" in str(error):
+            scheduler.report_rate_limited(model)
+        return False
+    
+    def _mark_degraded(self, generation, used_model: str):
+        """降級模型產生的結果加上標記，讓 LangChainLLMCache 不以原模型的指紋寫入快取"""
+        if used_model != self.model_name:
+            generation.generation_info = {**(generation.generation_info or {}), DEGRADED_MODEL_KEY: used_model}
+    
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        scheduler = get_llm_scheduler()
+        model = self.model_name
+        while True:
+            with scheduler.slot(model, self.priority) as used_model:
+                try:
+                    result = super()._generate(messages, stop=stop, run_manager=run_manager, model=used_model, **kwargs)
+                    for generation in result.generations:
+                        self._mark_degraded(generation, used_model)
+                    return result
+                except Exception as e:
+                    if not self._report_error(used_model, e):
+                        raise
+            model = used_model
+    
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator:
+        scheduler = get_llm_scheduler()
+        with scheduler.slot(self.model_name, self.priority) as used_model:
+            try:
+                first = True
+                for chunk in super()._stream(messages, stop=stop, run_manager=run_manager, model=used_model, **kwargs):
+                    # 只標記第一個片段（合併片段時字串值會串接）
+                    if first:
+                        self._mark_degraded(chunk, used_model)
+                        first = False
+                    yield chunk
+            except Exception as e:
+                self._report_error(used_model, e)
+                raise
 
 class LangChainAgent:
     """基於 LangChain 的智能代理"""
     
     def __init__(self):
         self.tool_manager = ToolManager()
-        self.llm = ChatOpenAI(
-            api_key=config.API_KEY,
-            base_url=config.get_api_url(),
-            model=getattr(config, "INNOAI_DEFAULT_MODEL", "gpt-4"),
-            temperature=0.1,
-            max_tokens=4000  # 增加最大輸出長度
-        )
         self.tools = self.tool_manager.get_langchain_tools()
-        self.agent_executor = self._create_agent()
+        # 格式完整的工具查詢直接執行工具，不進入 ReAct 迴圈
+        self.router = IntentRouter(self.tool_manager.tools) if getattr(config, "INTENT_ROUTER_ENABLED", True) else None
+        
+        # 每個模型的 (LLM, AgentExecutor)：建立一次後由所有請求共用（兩者皆無每次執行的狀態），
+        # 切換模型不需重建，不同模型的並行請求也不會互相覆寫
+        self._executors: Dict[str, Tuple[ChatOpenAI, AgentExecutor]] = {}
+        self._executors_lock = threading.Lock()
+        
+        # "react"：ReAct 文字格式，每輪一個工具；"tool_calling"：OpenAI tool calls，同一輪可並行執行多個工具
+        self.agent_mode = getattr(config, "AGENT_MODE", "react")
+        self.default_model = getattr(config, "INNOAI_DEFAULT_MODEL", "gpt-4")
+        self.llm, self.agent_executor = self._get_executor(self.default_model)
         print("🤖 LangChain 智能代理初始化完成")
     
+    def _get_executor(self, model: str) -> Tuple[ChatOpenAI, AgentExecutor]:
+        """取得（必要時建立）指定模型的 LLM 與 AgentExecutor"""
+        pair = self._executors.get(model)
+        if pair is None:
+            with self._executors_lock:
+                pair = self._executors.get(model)
+                if pair is None:
+                    llm = create_chat_model(model, temperature=0.1, max_tokens=4000)  # 增加最大輸出長度
+                    pair = (llm, self._create_agent(llm))
+                    self._executors[model] = pair
+                    print(f"🔧 已建立模型 {model} 的 Agent")
+        return pair
+    
     def _create_tools(self) -> List:
         """創建工具列表 (已由 ToolManager 處理)"""
         return self.tool_manager.get_langchain_tools()
     
-    def _create_agent(self) -> AgentExecutor:
+    def _create_agent(self, llm: ChatOpenAI) -> AgentExecutor:
         """創建 LangChain Agent"""
         
         # 自定義 prompt 模板 - 使用繁體中文，並加強格式約束
@@ -69,7 +190,7 @@ Thought:{agent_scratchpad}"""
         
         # 創建 ReAct agent
         agent = create_react_agent(
-            llm=self.llm,
+            llm=llm,
             tools=self.tools,
             prompt=prompt
         )
@@ -78,13 +199,58 @@ Thought:{agent_scratchpad}"""
             agent=agent,
             tools=self.tools,
             verbose=True,
-            max_iterations=5,
+            max_iterations=getattr(config, "AGENT_MAX_ITERATIONS", 5),
             handle_parsing_errors=True,
             return_intermediate_steps=True,
-            max_execution_time=None
+            max_execution_time=getattr(config, "AGENT_MAX_EXECUTION_TIME", None)
             # 移除 early_stopping_method 參數，避免模型兼容性問題
         )
     
+    def _run_tool_calling(self, llm: ChatOpenAI, query: str) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        tool_calling 模式：模型在同一輪可要求多個獨立工具，這些工具並行執行後一起回傳觀察結果
+        
+        Returns:
+            (最終回答, 執行步驟)
+        """
+        bound_llm = llm.bind_tools(self.tools)
+        messages = [
+            SystemMessage(content="你是製造系統的助理，請使用繁體中文回答。"
+                                  "需要多項互相獨立的檢查時，請在同一輪同時呼叫所有需要的工具，不要逐一呼叫。"),
+            HumanMessage(content=query)
+        ]
+        steps = []
+        max_turns = getattr(config, "AGENT_MAX_ITERATIONS", 5)
+        # 與 ReAct 模式相同的總執行時間上限（None 表示不限制）
+        max_time = getattr(config, "AGENT_MAX_EXECUTION_TIME", None)
+        deadline = time.monotonic() + max_time if max_time else None
+        
+        for turn in range(1, max_turns + 1):
+            if deadline is not None and time.monotonic() >= deadline:
+                print(f"⏰ tool_calling Agent 超過 {max_time:g} 秒執行時間上限，於第 {turn} 輪前停止")
+                return (f"⏰ 已超過執行時間上限（{max_time:g} 秒），停止處理。"
+                        f"已執行 {len(steps)} 個工具，請參考執行步驟或縮小問題範圍後重試。"), steps
+            ai_message = bound_llm.invoke(messages)
+            messages.append(ai_message)
+            if not ai_message.tool_calls:
+                print(f"✅ tool_calling Agent 於第 {turn} 輪完成，共執行 {len(steps)} 個工具")
+                return ai_message.content, steps
+            
+            calls = []
+            for tool_call in ai_message.tool_calls:
+                args = tool_call.get("args") or {}
+                calls.append((tool_call["name"], str(args.get("query", "")) if isinstance(args, dict) else str(args)))
+            print(f"🛠️ 第 {turn} 輪並行執行 {len(calls)} 個工具: {', '.join(name for name, _ in calls)}")
+            
+            observations = self.tool_manager.execute_tools(calls)
+            for tool_call, (name, tool_input), observation in zip(ai_message.tool_calls, calls, observations):
+                messages.append(ToolMessage(content=observation, tool_call_id=tool_call["id"]))
+                steps.append({"tool": name, "input": tool_input, "output": observation})
+        
+        # 達到輪數上限：不再提供工具，請模型根據已取得的結果作答
+        print(f"⚠️ tool_calling Agent 達到 {max_turns} 輪上限，根據現有工具結果作答")
+        return llm.invoke(messages).content, steps
+    
     def solve_problem(self, query: str, llm_model: str = None) -> Dict[str, Any]:
         """
         使用 LLM 自動規劃並解決問題
@@ -97,55 +263,47 @@ Thought:{agent_scratchpad}"""
             解決方案和執行過程
         """
         try:
-            # 如果指定了模型，臨時更新LLM
-            original_model = self.llm.model_name
-            original_llm = self.llm  # 保存原始LLM引用
-            
-            if llm_model and llm_model != original_model:
-                print(f"🔄 切換模型: {original_model} → {llm_model}")
-                # 創建新的LLM實例而不是修改現有的
-                temp_llm = ChatOpenAI(
-                    api_key=config.API_KEY,
-                    base_url=config.get_api_url(llm_model),
-                    model=llm_model,
-                    temperature=0.1,
-                    max_tokens=4000
-                )
-                # 暫時替換
-                self.llm = temp_llm
-                # 重新創建agent executor
-                self.agent_executor = self._create_agent()
+            # 使用此請求的模型對應的 Agent（區域變數，不修改共用的 self.llm）
+            llm, agent_executor = self._get_executor(llm_model or self.default_model)
             
-            print(f"🤖 LangChain Agent 處理問題 (模型: {self.llm.model_name}): {query}")
+            print(f"🤖 LangChain Agent 處理問題 (模型: {llm.model_name}): {query}")
             
-            # 特殊處理 SPC 查詢 - 直接調用工具避免截斷
-            if "SPC" in query and ("進CHART" in query or "沒有進" in query or "CHART" in query):
-                print("🔍 檢測到 SPC 查詢，直接使用工具避免輸出截斷")
-                spc_result = self.tool_manager.execute_tool("spc_query", query)
-                current_model = llm_model or self.llm.model_name
+            # 意圖路由：能確定工具時直接執行（同時避免 SPC 工具輸出被 LLM 截斷），無法確定時交由 Agent
+            decision = self.router.route(query) if self.router else None
+            if decision:
+                print(f"🧭 意圖路由至 {decision['tool']}（信心度 {decision['confidence']}，{decision['reason']}），略過 ReAct 迴圈")
+                tool_result = self.tool_manager.execute_tool(decision["tool"], decision["tool_input"])
+                current_model = llm.model_name
                 model_prefix = f"**{current_model.upper()}**: "
                 return {
-                    "answer": model_prefix + spc_result,
-                    "confidence": 0.9,
-                    "source": "direct_spc_tool",
-                    "execution_steps": [{"tool": "spc_query", "input": query, "output": spc_result}],
+                    "answer": model_prefix + tool_result,
+                    "confidence": decision["confidence"],
+                    "source": "intent_router",
+                    "execution_steps": [{"tool": decision["tool"], "input": decision["tool_input"], "output": tool_result}],
                     "total_steps": 1,
-                    "model_used": current_model
+                    "model_used": current_model,
+                    "routing": decision
                 }
             
-            # 執行 agent
-            result = self.agent_executor.invoke({"input": query})
-            
-            # 提取執行步驟
-            steps = []
-            if "intermediate_steps" in result:
-                for step in result["intermediate_steps"]:
-                    action, observation = step
-                    steps.append({
-                        "tool": action.tool,
-                        "input": action.tool_input,
-                        "output": observation
-                    })
+            if self.agent_mode == "tool_calling":
+                output, steps = self._run_tool_calling(llm, query)
+                source = "langchain_tool_calling"
+            else:
+                # 執行 agent
+                result = agent_executor.invoke({"input": query})
+                output = result["output"]
+                source = "langchain_agent"
+                
+                # 提取執行步驟
+                steps = []
+                if "intermediate_steps" in result:
+                    for step in result["intermediate_steps"]:
+                        action, observation = step
+                        steps.append({
+                            "tool": action.tool,
+                            "input": action.tool_input,
+                            "output": observation
+                        })
             
             # 檢查是否有 SPC 工具被調用且輸出被截斷
             for step in steps:
@@ -155,7 +313,7 @@ Thought:{agent_scratchpad}"""
                     if "TFT6" in full_output and ("CF6" not in full_output or "LCD6" not in full_output or "USL" not in full_output):
                         print("⚠️ 檢測到 SPC 工具輸出被截斷，使用完整輸出")
                         complete_output = self.tool_manager.execute_tool("spc_query", query)
-                        current_model = llm_model or self.llm.model_name
+                        current_model = llm.model_name
                         model_prefix = f"**{current_model.upper()}**: "
                         return {
                             "answer": model_prefix + complete_output,
@@ -167,9 +325,9 @@ Thought:{agent_scratchpad}"""
                         }
                     # 如果工具輸出完整，但 LLM 回答簡化了，直接返回工具輸出
                     elif "TFT6" in full_output and "CF6" in full_output and "LCD6" in full_output and "USL" in full_output:
-                        if len(result["output"]) < len(full_output) * 0.7:  # 如果 LLM 回答明顯比工具輸出短
+                        if len(output) < len(full_output) * 0.7:  # 如果 LLM 回答明顯比工具輸出短
                             print("⚠️ 檢測到 LLM 簡化了 SPC 工具輸出，返回完整工具回應")
-                            current_model = llm_model or self.llm.model_name
+                            current_model = llm.model_name
                             model_prefix = f"**{current_model.upper()}**: "
                             return {
                                 "answer": model_prefix + full_output,
@@ -180,22 +338,16 @@ Thought:{agent_scratchpad}"""
                                 "model_used": current_model
                             }
             
-            current_model = self.llm.model_name
+            current_model = llm.model_name
             
             # 構建帶模型名稱的回答
             model_prefix = f"**{current_model.upper()}**: "
-            final_answer = model_prefix + result["output"]
-            
-            # 恢復原始模型（如果有改變）
-            if llm_model and llm_model != original_model:
-                print(f"🔄 恢復模型: {llm_model} → {original_model}")
-                self.llm = original_llm
-                self.agent_executor = self._create_agent()
+            final_answer = model_prefix + output
             
             return {
                 "answer": final_answer,
                 "confidence": 0.8,
-                "source": "langchain_agent",
+                "source": source,
                 "execution_steps": steps,
                 "total_steps": len(steps),
                 "model_used": current_model
@@ -6,12 +6,22 @@ import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from typing import List, Dict, Any
-import chromadb
-from chromadb.config import Settings
+from typing import List, Dict, Any, Tuple, Iterator, Union
+import numpy as np
 import config
-from embedding_service import get_embedding_service
+from embedding_service import get_embedding_service, mmr_select
 from services.llm_service import LLMService
+from services.bm25_service import get_bm25_index, reciprocal_rank_fusion
+from services.rerank_service import get_rerank_service
+from services.token_service import count_tokens, truncate_to_tokens, compact_text
+from services.vector_collections import classify_query
+from services.vector_store import open_vector_store
+
+def _normalize_scores(scores: List[float]) -> np.ndarray:
+    """將分數正規化至 0~1（與餘弦相似度同一尺度，供 MMR 作為相關性）"""
+    scores = np.array(scores, dtype=np.float32)
+    spread = float(scores.max() - scores.min())
+    return (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
 
 class RAGAgent:
     """RAG 代理 - 知識庫檢索和回答生成"""
@@ -20,15 +30,10 @@ class RAGAgent:
         try:
             # 初始化向量資料庫
             print("📚 初始化 RAG 代理...")
-            self.chroma_client = chromadb.PersistentClient(
-                path=config.VECTOR_DB_PATH,
-                settings=Settings(anonymized_telemetry=False)
-            )
-            
-            # 獲取 collection
+            # 獲取向量儲存（Chroma 或本地索引，啟用分片時為各領域 collection 的組合）
             try:
-                self.collection = self.chroma_client.get_collection("documents")
-                print(f"✅ 連接到現有 collection，文檔數量: {self.collection.count()}")
+                self.collection = open_vector_store(create=False)
+                print(f"✅ 連接到現有向量儲存（{self.collection.describe()}），文檔數量: {self.collection.count()}")
             except:
                 print("⚠️  未找到現有 collection，請先執行 document_processor.py")
                 self.collection = None
@@ -39,6 +44,13 @@ class RAGAgent:
             # 初始化 LLM 服務
             self.llm_service = LLMService()
             
+            # 初始化 BM25 關鍵詞索引（混合檢索使用）
+            self.bm25_index = get_bm25_index()
+            print(f"✅ BM25 索引載入完成，文字塊數量: {len(self.bm25_index)}")
+            
+            # 初始化重排序服務（選用，載入失敗時自動停用）
+            self.rerank_service = get_rerank_service() if getattr(config, "RERANK_ENABLED", False) else None
+            
             print("✅ RAG 代理初始化完成")
             
         except Exception as e:
@@ -65,9 +77,8 @@ class RAGAgent:
             }
         
         try:
-            # 1. 向量檢索
-            print(f"🔍 搜尋相關文檔: {query[:50]}...")
-            search_results = self._search_documents(query, n_results=5)
+            # 1-2. 檢索、過濾與排序
+            search_results, relevant_docs = self.retrieve_documents(query)
             
             if not search_results["documents"] or not search_results["documents"][0]:
                 return {
@@ -76,34 +87,8 @@ class RAGAgent:
                     "confidence": 0.0
                 }
             
-            # 2. 組織檢索結果並加入相似度過濾
-            relevant_docs = []
-            for i, (doc, metadata, distance) in enumerate(zip(
-                search_results["documents"][0],
-                search_results["metadatas"][0],
-                search_results["distances"][0] if "distances" in search_results else [0] * len(search_results["documents"][0])
-            )):
-                # 檢查相似度門檻
-                if distance > config.SIMILARITY_THRESHOLD:
-                    print(f"📄 過濾文檔：距離 {distance:.3f} > 門檻 {config.SIMILARITY_THRESHOLD}")
-                    continue
-                    
-                relevant_docs.append({
-                    "content": doc,
-                    "metadata": metadata,
-                    "distance": distance,
-                    "source_file": metadata.get("source_file", "Unknown"),
-                    "title": metadata.get("title", ""),
-                    "chunk_index": metadata.get("chunk_index", 0),
-                    "images": metadata.get("images", "").split("|") if metadata.get("images") else []
-                })
-            
-            # 按相似度排序（距離越小越前面）
-            relevant_docs.sort(key=lambda x: x.get("distance", float('inf')))
-            print(f"📄 過濾後文檔數量：{len(relevant_docs)}（門檻: {config.SIMILARITY_THRESHOLD}）")
-            
             # 3. 生成回答
-            answer = self._generate_answer(query, relevant_docs, chat_history, llm_model)
+            answer, token_usage, used_model = self._generate_answer(query, relevant_docs, chat_history, llm_model)
             
             # 4. 計算信心度
             confidence = self._calculate_confidence(search_results, relevant_docs)
@@ -111,7 +96,9 @@ class RAGAgent:
             return {
                 "answer": answer,
                 "source_documents": relevant_docs,
-                "confidence": confidence
+                "confidence": confidence,
+                "token_usage": token_usage,
+                "model": used_model
             }
             
         except Exception as e:
@@ -125,19 +112,171 @@ class RAGAgent:
                 "confidence": 0.0
             }
     
-    def _search_documents(self, query: str, n_results: int = 5) -> Dict[str, Any]:
-        """搜尋相關文檔"""
+    def search_and_answer_stream(self, query: str, chat_history: List[Dict] = None, llm_model: str = None) -> Iterator[Union[str, Dict[str, Any]]]:
+        """
+        搜尋知識庫並串流生成回答（檢索完成後逐段輸出 LLM 產生的 token）
+        
+        Yields:
+            回答文字片段；最後輸出與 search_and_answer 相同格式的結果字典（answer 為完整回答）
+        """
+        if not self.collection:
+            result = self.search_and_answer(query, chat_history, llm_model)
+            yield result["answer"]
+            yield result
+            return
+        
+        try:
+            search_results, relevant_docs = self.retrieve_documents(query)
+            
+            if not search_results["documents"] or not search_results["documents"][0]:
+                answer = "抱歉，我在知識庫中沒有找到相關資訊。請嘗試其他問題或確認問題表達。"
+                yield answer
+                yield {"answer": answer, "source_documents": [], "confidence": 0.0}
+                return
+            
+            prompt, token_usage = self._assemble_prompt(query, relevant_docs, chat_history)
+            
+            # 模型名稱前綴使用實際回答的模型（接近額度時排程器可能改用降級模型），在第一個片段前輸出
+            meta = {"model": llm_model or config.INNOAI_DEFAULT_MODEL}
+            parts = []
+            for delta in self.llm_service.generate_response_stream(prompt, model=llm_model, meta=meta):
+                if not parts:
+                    parts.append(f"**{meta['model'].upper()}**: ")
+                    yield parts[0]
+                parts.append(delta)
+                yield delta
+            
+            yield {
+                "answer": "".join(parts),
+                "source_documents": relevant_docs,
+                "confidence": self._calculate_confidence(search_results, relevant_docs),
+                "token_usage": token_usage,
+                "model": meta["model"]
+            }
+            
+        except Exception as e:
+            error_str = str(e)
+            print(f"❌ RAG 搜尋錯誤: {error_str}")
+            answer = f"❌ RAG 系統錯誤：{error_str}"
+            yield answer
+            yield {"answer": answer, "source_documents": [], "confidence": 0.0}
+    
+    def retrieve_documents(self, query: str) -> Tuple[Dict[str, Any], List[Dict]]:
+        """
+        檢索相關文檔：向量/混合檢索 → 相似度過濾 → 重排序 → MMR 去重
+        
+        Args:
+            query: 用戶查詢
+            
+        Returns:
+            (原始檢索結果, 送入上下文的相關文檔列表)
+        """
+        use_mmr = getattr(config, "MMR_ENABLED", False)
+        
+        # 1. 檢索（啟用重排序或 MMR 時多取候選）
+        print(f"🔍 搜尋相關文檔: {query[:50]}...")
+        n_results = 5
+        if self.rerank_service:
+            n_results = max(n_results, getattr(config, "RERANK_CANDIDATES", 30))
+        if use_mmr:
+            n_results = max(n_results, getattr(config, "MMR_FETCH_K", 20))
+        search_results = self._search_documents(query, n_results=n_results, include_embeddings=use_mmr)
+        
+        if not search_results["documents"] or not search_results["documents"][0]:
+            return search_results, []
+        
+        # 2. 組織檢索結果並加入相似度過濾
+        relevant_docs = []
+        embeddings = {}
+        lexical_hits = search_results.get("lexical_hits", [[False] * len(search_results["documents"][0])])[0]
+        rrf_scores = search_results["rrf_scores"][0] if search_results.get("rrf_scores") else None
+        for i, (doc, metadata, distance) in enumerate(zip(
+            search_results["documents"][0],
+            search_results["metadatas"][0],
+            search_results["distances"][0] if "distances" in search_results else [0] * len(search_results["documents"][0])
+        )):
+            # 檢查相似度門檻（BM25 排名最前的精確比對結果不受向量距離門檻限制）
+            if distance > config.SIMILARITY_THRESHOLD and not lexical_hits[i]:
+                print(f"📄 過濾文檔：距離 {distance:.3f} > 門檻 {config.SIMILARITY_THRESHOLD}")
+                continue
+                
+            relevant_docs.append({
+                "content": doc,
+                "metadata": metadata,
+                "distance": distance,
+                "source_file": metadata.get("source_file", "Unknown"),
+                "title": metadata.get("title", ""),
+                "chunk_index": metadata.get("chunk_index", 0),
+                "images": metadata.get("images", "").split("|") if metadata.get("images") else []
+            })
+            if rrf_scores is not None:
+                relevant_docs[-1]["rrf_score"] = rrf_scores[i]
+            if use_mmr:
+                embeddings[id(relevant_docs[-1])] = search_results["embeddings"][0][i]
+        
+        # 混合檢索保留融合排序（僅 BM25 命中的精確比對向量距離可能較大）；純向量檢索按距離排序（越小越前面）
+        if rrf_scores is not None:
+            relevant_docs.sort(key=lambda d: d["rrf_score"], reverse=True)
+        else:
+            relevant_docs.sort(key=lambda d: d.get("distance", float('inf')))
+        print(f"📄 過濾後文檔數量：{len(relevant_docs)}（門檻: {config.SIMILARITY_THRESHOLD}）")
+        
+        # 3. 重排序全部候選（超出延遲預算時保留原排序）；啟用 MMR 時保留整個排序後的候選池
+        reranked = False
+        if self.rerank_service and relevant_docs:
+            top_k = len(relevant_docs) if use_mmr else getattr(config, "RERANK_TOP_K", 3)
+            relevant_docs, rerank_info = self.rerank_service.rerank(query, relevant_docs, top_k=top_k)
+            reranked = rerank_info.get("reranked", False)
+        
+        # 4. MMR 去除近似重複的文字塊（重疊分塊、重複的樣板段落）
+        if use_mmr and len(relevant_docs) > 1:
+            # 以重排序分數或融合分數作為相關性；純向量檢索時使用與查詢的餘弦相似度
+            relevance = None
+            if reranked:
+                relevance = _normalize_scores([doc["rerank_score"] for doc in relevant_docs])
+            elif rrf_scores is not None:
+                relevance = _normalize_scores([doc["rrf_score"] for doc in relevant_docs])
+            selected = mmr_select(
+                search_results["query_embeddings"][0],
+                [embeddings[id(doc)] for doc in relevant_docs],
+                k=getattr(config, "RERANK_TOP_K", 3) if reranked else getattr(config, "MMR_TOP_K", 3),
+                lambda_mult=getattr(config, "MMR_LAMBDA", 0.5),
+                relevance=relevance
+            )
+            print(f"🧩 MMR 選取 {len(selected)}/{len(relevant_docs)} 個文字塊（lambda: {getattr(config, 'MMR_LAMBDA', 0.5)}）")
+            relevant_docs = [relevant_docs[i] for i in selected]
+        
+        return search_results, relevant_docs
+    
+    def _search_documents(self, query: str, n_results: int = 5, mode: str = None, include_embeddings: bool = False) -> Dict[str, Any]:
+        """
+        搜尋相關文檔
+        
+        Args:
+            query: 用戶查詢
+            n_results: 返回數量
+            mode: 檢索模式 "vector" 或 "hybrid"（預設使用 config.RETRIEVAL_MODE）
+            include_embeddings: 是否一併返回文字塊與查詢的 embedding（MMR 使用）
+            
+        Returns:
+            Chroma query 格式的結果（hybrid 模式另含 lexical_hits 欄位：是否為 BM25 排名最前的結果；
+            rrf_scores 欄位：融合分數，結果已依此排序）
+        """
         try:
+            mode = mode or getattr(config, "RETRIEVAL_MODE", "vector")
+            include = ["documents", "metadatas", "distances"] + (["embeddings"] if include_embeddings else [])
+            
             # 生成查詢向量
             query_embedding = self.embedding_service.encode([query])
             
-            # 執行向量搜尋
-            results = self.collection.query(
-                query_embeddings=query_embedding,
-                n_results=n_results,
-                include=["documents", "metadatas", "distances"]
-            )
+            if mode != "hybrid":
+                # 執行向量搜尋
+                results = self._query_collection(query, query_embedding, n_results, include)
+            else:
+                results = self._hybrid_search(query, query_embedding, n_results, include)
             
+            if include_embeddings:
+                results["query_embeddings"] = query_embedding
             return results
             
         except Exception as e:
@@ -147,34 +286,147 @@ class RAGAgent:
             # 直接向上拋出錯誤，讓上層處理
             raise
     
-    def _generate_answer(self, query: str, relevant_docs: List[Dict], chat_history: List[Dict] = None, llm_model: str = None) -> str:
-        """使用檢索到的文檔生成回答"""
+    def _query_collection(self, query: str, query_embedding: List[List[float]], n_results: int, include: List[str]) -> Dict[str, Any]:
+        """
+        向量查詢；分片模式下先只查詢查詢所屬領域的分片，
+        無法分類或最佳結果未達相似度門檻時，查詢全部分片並依距離合併
+        """
+        if not getattr(self.collection, "sharded", False):
+            return self.collection.query(query_embeddings=query_embedding, n_results=n_results, include=include)
+        
+        domain = classify_query(query)
+        if domain:
+            results = self.collection.query(query_embeddings=query_embedding, n_results=n_results,
+                                            include=include, domains=[domain])
+            distances = results["distances"][0] if results.get("distances") else []
+            if distances and distances[0] <= config.SIMILARITY_THRESHOLD:
+                print(f"🗂️ 查詢領域: {domain}")
+                return results
+        return self.collection.query(query_embeddings=query_embedding, n_results=n_results, include=include)
+    
+    def _hybrid_search(self, query: str, query_embedding: List[List[float]], n_results: int, include: List[str]) -> Dict[str, Any]:
+        """BM25 + 向量檢索，以倒數排名融合（RRF）合併結果"""
+        candidates = max(n_results, getattr(config, "HYBRID_CANDIDATES", 20))
+        
+        # 向量檢索候選
+        vector_results = self._query_collection(query, query_embedding, candidates, include)
+        vector_ids = vector_results["ids"][0] if vector_results.get("ids") else []
+        
+        # 關鍵詞檢索候選（索引檔可能已由 document_processor.py 更新）
+        self.bm25_index.reload_if_changed()
+        bm25_hits = self.bm25_index.search(query, top_k=candidates)
+        bm25_ids = [chunk_id for chunk_id, _ in bm25_hits]
+        
+        if not bm25_ids:
+            # 向量候選多取了 candidates 筆，只返回 n_results 筆
+            for key in ("ids", "documents", "metadatas", "distances", "embeddings"):
+                if vector_results.get(key) is not None:
+                    vector_results[key] = [vector_results[key][0][:n_results]]
+            return vector_results
+        
+        fused = reciprocal_rank_fusion([vector_ids, bm25_ids], k=getattr(config, "RRF_K", 60))[:n_results]
+        fused_ids = [chunk_id for chunk_id, _ in fused]
+        rrf_scores = dict(fused)
+        
+        # 整理向量檢索已取回的內容
+        records = {}
+        for i, chunk_id in enumerate(vector_ids):
+            records[chunk_id] = (
+                vector_results["documents"][0][i],
+                vector_results["metadatas"][0][i],
+                vector_results["distances"][0][i],
+                vector_results["embeddings"][0][i] if "embeddings" in include else None,
+            )
+        
+        # 補取僅由 BM25 命中的文字塊，並以 embedding 計算餘弦距離
+        missing_ids = [chunk_id for chunk_id in fused_ids if chunk_id not in records]
+        if missing_ids:
+            extra = self.collection.get(ids=missing_ids, include=["documents", "metadatas", "embeddings"])
+            query_vec = np.asarray(query_embedding[0], dtype=np.float32)
+            for chunk_id, doc, metadata, embedding in zip(extra["ids"], extra["documents"], extra["metadatas"], extra["embeddings"]):
+                distance = 1.0 - float(np.dot(query_vec, np.asarray(embedding, dtype=np.float32)))
+                records[chunk_id] = (doc, metadata, distance, embedding)
+        
+        # 索引中可能殘留已刪除的文字塊，略過
+        fused_ids = [chunk_id for chunk_id in fused_ids if chunk_id in records]
+        # 只有 BM25 排名最前的結果（精確比對）不受向量距離門檻限制
+        bm25_id_set = set(bm25_ids[:getattr(config, "HYBRID_LEXICAL_BYPASS_TOP_N", 3)])
+        print(f"🔀 混合檢索：向量 {len(vector_ids)} 筆、BM25 {len(bm25_ids)} 筆，融合後取 {len(fused_ids)} 筆")
+        
+        results = {
+            "ids": [fused_ids],
+            "documents": [[records[chunk_id][0] for chunk_id in fused_ids]],
+            "metadatas": [[records[chunk_id][1] for chunk_id in fused_ids]],
+            "distances": [[records[chunk_id][2] for chunk_id in fused_ids]],
+            "lexical_hits": [[chunk_id in bm25_id_set for chunk_id in fused_ids]],
+            "rrf_scores": [[rrf_scores[chunk_id] for chunk_id in fused_ids]],
+        }
+        if "embeddings" in include:
+            results["embeddings"] = [[records[chunk_id][3] for chunk_id in fused_ids]]
+        return results
+    
+    def _generate_answer(self, query: str, relevant_docs: List[Dict], chat_history: List[Dict] = None, llm_model: str = None) -> Tuple[str, Dict[str, int], str]:
+        """使用檢索到的文檔生成回答，返回 (回答, token 用量, 實際使用的模型)"""
+        used_model = llm_model or config.INNOAI_DEFAULT_MODEL
         try:
-            # 構建上下文
-            context = self._build_context(relevant_docs)
-            
-            # 構建提示詞
-            prompt = self._build_prompt(query, context, chat_history)
+            # 在 token 預算內構建提示詞
+            prompt, token_usage = self._assemble_prompt(query, relevant_docs, chat_history)
             
-            # 生成回答（使用指定的模型）
-            answer = self.llm_service.generate_response(prompt, model=llm_model)
+            # 生成回答（使用指定的模型；接近額度時排程器可能改用降級模型）
+            meta = {}
+            answer = self.llm_service.generate_response(prompt, model=llm_model, meta=meta)
             
-            # 添加模型名稱前綴
-            used_model = llm_model or config.INNOAI_DEFAULT_MODEL
+            # 添加模型名稱前綴（實際回答的模型）
+            used_model = meta.get("model", used_model)
             model_prefix = f"**{used_model.upper()}**: "
             final_answer = model_prefix + answer
             
-            return final_answer
+            return final_answer, token_usage, used_model
             
         except Exception as e:
             print(f"回答生成錯誤: {e}")
-            return "抱歉，生成回答時發生錯誤。"
+            return "抱歉，生成回答時發生錯誤。", {}, used_model
+    
+    def _assemble_prompt(self, query: str, relevant_docs: List[Dict], chat_history: List[Dict] = None) -> Tuple[str, Dict[str, int]]:
+        """
+        在 config.RAG_PROMPT_TOKEN_BUDGET 內組裝提示詞：
+        先放入固定模板、用戶問題與（已壓縮的）對話歷史，剩餘額度再分配給檢索文檔
+        
+        Returns:
+            (提示詞, token 用量統計)
+        """
+        budget = getattr(config, "RAG_PROMPT_TOKEN_BUDGET", 6000)
+        
+        history_text = self._build_history(chat_history)
+        base_tokens = count_tokens(self._build_prompt(query, "", history_text=history_text))
+        context = self._build_context(relevant_docs, token_budget=max(budget - base_tokens, 0))
+        prompt = self._build_prompt(query, context, history_text=history_text)
+        
+        token_usage = {
+            "prompt_tokens": count_tokens(prompt),
+            "context_tokens": count_tokens(context),
+            "history_tokens": count_tokens(history_text),
+            "budget": budget,
+        }
+        print(f"🧮 提示詞 tokens: {token_usage['prompt_tokens']}/{budget}"
+              f"（文檔 {token_usage['context_tokens']}，歷史 {token_usage['history_tokens']}）")
+        return prompt, token_usage
     
-    def _build_context(self, relevant_docs: List[Dict]) -> str:
-        """構建上下文資訊"""
+    def _build_context(self, relevant_docs: List[Dict], token_budget: int = None) -> str:
+        """
+        構建上下文資訊
+        
+        Args:
+            relevant_docs: 相關文檔（依相關性排序）
+            token_budget: 上下文 token 上限（None 表示不限制）；最後一個放不下的文檔會被截斷
+        """
         context_parts = []
+        separator = "\n" + "="*50
+        remaining = token_budget - count_tokens(separator) if token_budget is not None else None
+        max_docs = getattr(config, "RAG_CONTEXT_MAX_DOCS", 3)
+        min_partial = getattr(config, "RAG_CONTEXT_MIN_PARTIAL_TOKENS", 100)
         
-        for i, doc in enumerate(relevant_docs[:3]):  # 只使用前3個最相關的文檔
+        for i, doc in enumerate(relevant_docs[:max_docs]):  # 只使用前幾個最相關的文檔
             source = doc.get("source_file", "Unknown")
             title = doc.get("title", "")
             content = doc.get("content", "")
@@ -183,14 +435,55 @@ class RAGAgent:
             context_part += f"來源: {source}\n"
             if title:
                 context_part += f"標題: {title}\n"
-            context_part += f"內容: {content}\n"
             
+            if remaining is not None:
+                header_tokens = count_tokens(context_part) + 2
+                part_tokens = header_tokens + count_tokens(content)
+                if part_tokens > remaining:
+                    # 剩餘額度太少就不放入半截文檔
+                    if remaining - header_tokens < min_partial:
+                        break
+                    content = truncate_to_tokens(content, remaining - header_tokens - 1) + "…"
+                    part_tokens = remaining
+                remaining -= part_tokens
+            
+            context_part += f"內容: {content}\n"
             context_parts.append(context_part)
         
-        return "\n" + "="*50 + "\n".join(context_parts)
+        return separator + "\n".join(context_parts)
+    
+    def _build_history(self, chat_history: List[Dict] = None) -> str:
+        """
+        構建對話歷史：只取最近幾條訊息，過長的訊息（如含 XML 的 SPC 工具輸出）先壓縮，
+        並由新到舊放入直到 config.RAG_HISTORY_TOKEN_BUDGET 用完
+        """
+        if not chat_history:
+            return ""
+        
+        history_budget = getattr(config, "RAG_HISTORY_TOKEN_BUDGET", 1000)
+        message_limit = getattr(config, "RAG_HISTORY_MESSAGE_MAX_TOKENS", 400)
+        
+        lines = []
+        used = 0
+        for msg in reversed(chat_history[-getattr(config, "RAG_HISTORY_MESSAGES", 3):]):
+            role = "用戶" if msg["role"] == "user" else "助手"
+            line = f"{role}: {compact_text(str(msg['content']), message_limit)}"
+            line_tokens = count_tokens(line)
+            if used + line_tokens > history_budget:
+                break
+            lines.insert(0, line)
+            used += line_tokens
+        
+        if not lines:
+            return ""
+        return "\n對話歷史：\n" + "\n".join(lines) + "\n"
     
-    def _build_prompt(self, query: str, context: str, chat_history: List[Dict] = None) -> str:
-        """構建 LLM 提示詞"""
+    def _build_prompt(self, query: str, context: str, chat_history: List[Dict] = None, history_text: str = None) -> str:
+        """構建 LLM 提示詞（history_text 為已構建的對話歷史，優先於 chat_history）"""
+        if history_text is None:
+            history_text = self._build_history(chat_history)
+        history_section = history_text + "\n" if history_text else ""
+        
         prompt = f"""你是一個專業的技術文檔助手。請根據提供的文檔內容回答用戶的問題。
 
 規則：
@@ -203,18 +496,9 @@ class RAGAgent:
 相關文檔內容：
 {context}
 
-用戶問題：{query}
+{history_section}用戶問題：{query}
 
 請提供詳細且准確的回答："""
-
-        # 如果有對話歷史，添加上下文
-        if chat_history and len(chat_history) > 0:
-            history_context = "\n對話歷史：\n"
-            for msg in chat_history[-3:]:  # 只使用最近3條對話
-                role = "用戶" if msg["role"] == "user" else "助手"
-                history_context += f"{role}: {msg['content']}\n"
-            
-            prompt = prompt.replace("用戶問題：", history_context + "\n用戶問題：")
         
         return prompt
     
@@ -265,7 +549,9 @@ class RAGAgent:
             return {
                 "status": "正常",
                 "count": count,
-                "collection_name": "documents"
+                "collection_name": "documents",
+                "backend": self.collection.describe(),
+                "sharded": getattr(self.collection, "sharded", False)
             }
         except Exception as e:
             return {"status": "錯誤", "error": str(e)}
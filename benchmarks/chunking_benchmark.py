@@ -0,0 +1,91 @@
+"""
+分塊效能評估
+比較舊版字串累加分塊與 chunking 模組各策略在長文檔上的耗時與文字塊大小分佈
+
+執行方式:
+  # 以合成長文檔測試（依倍數放大）
+  python benchmarks/chunking_benchmark.py --scales 1,10,50
+  # 以 Dataset 中的 DOCX 測試
+  python benchmarks/chunking_benchmark.py --docx dataset/SPC_AFF_Diff_GAP.docx
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+from typing import List
+
+# 將專案根目錄加入 sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import config
+from chunking import chunk_document, CHUNKING_METHODS
+from services.token_service import count_tokens
+
+SAMPLE_SECTION = (
+    "第{n}章 SPC 管制圖設定\n"
+    "SPC 系統透過管制圖監控製程參數，當量測值超出管制界限時會發出警報。"
+    "設定 CHART 前請先確認 EDC 檔案中的 DATA_GROUP 與 ITEM 名稱是否正確。\n"
+    "{n}.1 AFF Diff GAP 設定\n"
+    "AFF Diff GAP 用於比較同一片玻璃在不同機台的量測差異。Set the GAP limit to 1.5 um before release. "
+    "若差異超過門檻，系統會在 HAMSPARA 表中記錄異常並通知工程師。\n"
+    "{n}.2 常見問題\n"
+    "若圖表沒有資料，請檢查 EDC 上傳時間與 CHART 的生效時間。Is the chart enabled? Check the owner field!\n"
+)
+
+def legacy_chunk_text(text: str, chunk_size: int = 500, chunk_overlap: int = 50) -> List[str]:
+    """舊版分塊（字元長度、字串累加、重疊取最後 N 個字元），作為比較基準"""
+    sentences = re.split(r'[。！？\n]', text)
+    chunks = []
+    current_chunk = ""
+    for sentence in sentences:
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if len(current_chunk) + len(sentence) > chunk_size:
+            if current_chunk:
+                chunks.append(current_chunk.strip())
+                current_chunk = current_chunk[-chunk_overlap:] if chunk_overlap > 0 else ""
+        current_chunk += sentence + "。"
+    if current_chunk.strip():
+        chunks.append(current_chunk.strip())
+    return chunks
+
+def summarize(name: str, chars: int, chunks: List[str], elapsed: float):
+    tokens = [count_tokens(chunk) for chunk in chunks] or [0]
+    print(f"{name:<10}{chars:>10}{len(chunks):>8}{np.mean(tokens):>10.0f}{max(tokens):>10}{elapsed * 1000:>12.1f}")
+
+def run(text: str, label: str):
+    print(f"\n[{label}] {len(text)} 字元，{count_tokens(text)} tokens")
+    print(f"{'策略':<10}{'字元數':>10}{'塊數':>8}{'平均tok':>10}{'最大tok':>10}{'耗時(ms)':>12}")
+
+    start = time.perf_counter()
+    chunks = legacy_chunk_text(text, config.CHUNK_SIZE, config.CHUNK_OVERLAP)
+    summarize("legacy", len(text), chunks, time.perf_counter() - start)
+
+    for method in CHUNKING_METHODS:
+        start = time.perf_counter()
+        chunks = [chunk["text"] for chunk in chunk_document(text, method)]
+        summarize(method, len(text), chunks, time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="分塊效能評估")
+    parser.add_argument("--scales", default="1,10,50", help="合成文檔的章節數倍數，逗號分隔")
+    parser.add_argument("--docx", nargs="*", default=None, help="改用指定的 DOCX 檔案")
+    args = parser.parse_args()
+
+    print(f"CHUNK_SIZE={config.CHUNK_SIZE}, CHUNK_OVERLAP={config.CHUNK_OVERLAP}, MIN_CHUNK_SIZE={config.MIN_CHUNK_SIZE}")
+    if args.docx:
+        from utils import extract_text_from_document
+        for path in args.docx:
+            run(extract_text_from_document(path)["full_text"], os.path.basename(path))
+        return
+
+    for scale in (int(s) for s in args.scales.split(",")):
+        text = "".join(SAMPLE_SECTION.format(n=n) for n in range(1, scale * 20 + 1))
+        run(text, f"合成 x{scale}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+MMR 去重效益評估
+比較啟用與停用 MMR 時，送入 LLM 的提示詞大小與上下文重複程度（不呼叫 LLM）
+
+執行方式: python benchmarks/mmr_token_benchmark.py [--queries benchmarks/rag_queries.json] [--lambda 0.5]
+"""
+
+import os
+import sys
+import json
+import argparse
+from typing import List
+
+# 將專案根目錄加入 sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import config
+from agents.rag_agent import RAGAgent
+from services.token_service import count_tokens
+
+DEFAULT_QUERIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rag_queries.json")
+
+def context_redundancy(agent: RAGAgent, docs: List[dict]) -> float:
+    """上下文文字塊兩兩之間的平均餘弦相似度（越高表示越重複）"""
+    contents = [doc.get("content", "") for doc in docs[:3]]
+    if len(contents) < 2:
+        return 0.0
+    vectors = np.asarray(agent.embedding_service.encode(contents), dtype=np.float32)
+    sims = vectors @ vectors.T
+    upper = sims[np.triu_indices(len(contents), k=1)]
+    return float(upper.mean())
+
+def run_query(agent: RAGAgent, query: str, use_mmr: bool) -> dict:
+    """執行一次檢索並構建提示詞"""
+    config.MMR_ENABLED = use_mmr
+    _, docs = agent.retrieve_documents(query)
+    prompt = agent._build_prompt(query, agent._build_context(docs))
+    return {
+        "docs": len(docs),
+        "tokens": count_tokens(prompt),
+        "redundancy": context_redundancy(agent, docs),
+        "sources": sorted({doc.get("source_file", "") for doc in docs[:3]}),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="MMR 去重效益評估")
+    parser.add_argument("--queries", default=DEFAULT_QUERIES_PATH, help="查詢集 JSON 檔")
+    parser.add_argument("--lambda", dest="lambda_mult", type=float, default=config.MMR_LAMBDA, help="MMR 相關性權重")
+    args = parser.parse_args()
+
+    with open(args.queries, 'r', encoding='utf-8') as f:
+        queries = [item["query"] for item in json.load(f)]
+
+    config.MMR_LAMBDA = args.lambda_mult
+    agent = RAGAgent()
+    if not agent.collection:
+        print("❌ 向量資料庫尚未建立，請先執行 document_processor.py")
+        return
+
+    rows = []
+    for query in queries:
+        baseline = run_query(agent, query, use_mmr=False)
+        mmr = run_query(agent, query, use_mmr=True)
+        rows.append((query, baseline, mmr))
+
+    print("\n" + "=" * 90)
+    print(f"{'查詢':<30}{'基準 tokens':>12}{'MMR tokens':>12}{'基準重複度':>12}{'MMR重複度':>12}{'來源數':>10}")
+    print("-" * 90)
+    for query, baseline, mmr in rows:
+        print(f"{query[:28]:<30}{baseline['tokens']:>12}{mmr['tokens']:>12}"
+              f"{baseline['redundancy']:>12.3f}{mmr['redundancy']:>12.3f}"
+              f"{len(baseline['sources']):>5}→{len(mmr['sources'])}")
+
+    total_baseline = sum(r[1]["tokens"] for r in rows)
+    total_mmr = sum(r[2]["tokens"] for r in rows)
+    saved = total_baseline - total_mmr
+    print("-" * 90)
+    print(f"提示詞 tokens 合計: 基準 {total_baseline} / MMR {total_mmr}（節省 {saved}，{saved / total_baseline * 100 if total_baseline else 0:.1f}%）")
+    print(f"平均上下文重複度: 基準 {np.mean([r[1]['redundancy'] for r in rows]):.3f} / "
+          f"MMR {np.mean([r[2]['redundancy'] for r in rows]):.3f}（lambda: {args.lambda_mult}）")
+    print("=" * 90)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+檢索品質與延遲評估工具
+以標註好的「查詢 → 預期文檔」資料集評估各種檢索模式，輸出 recall@k、MRR 與 p50/p95 檢索延遲，
+用於以數據調整 SIMILARITY_THRESHOLD、CHUNK_SIZE、CHUNKING_METHOD 等參數
+
+資料集格式（JSON）：
+[
+  {"query": "SPC AFF Diff GAP 如何設定", "expected_sources": ["SPC_AFF_Diff_GAP.docx"]},
+  ...
+]
+expected_sources 為空的查詢只計入延遲，不計入 recall/MRR
+
+執行方式:
+  # 使用現有向量資料庫（需與 embedding 後端一致）
+  python benchmarks/retrieval_eval.py --modes vector,hybrid --k 1,3,5
+  # 離線：以本地 SentenceTransformer 重建暫存索引後評估，並掃描相似度門檻
+  python benchmarks/retrieval_eval.py --backend sentence_transformers --reindex --chunk-size 384 --thresholds 0.3,0.5,1.0
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Tuple
+
+# 將專案根目錄加入 sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import config
+
+DEFAULT_DATASET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rag_queries.json")
+# 直接呼叫 _search_documents 的模式；其餘模式走完整的 retrieve_documents 流程
+RAW_MODES = {"vector", "hybrid"}
+PIPELINE_MODES = {"mmr", "rerank"}
+
+@contextmanager
+def config_overrides(**values):
+    """暫時覆寫 config 設定，離開時還原（評估設定不殘留給同一程序中的其他程式）"""
+    original = {name: getattr(config, name) for name in values}
+    for name, value in values.items():
+        setattr(config, name, value)
+    try:
+        yield
+    finally:
+        for name, value in original.items():
+            setattr(config, name, value)
+
+def load_dataset(path: str) -> List[Dict[str, Any]]:
+    """讀取標註資料集"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def is_relevant(metadata: Dict[str, Any], expected_sources: List[str]) -> bool:
+    """判斷檢索結果是否屬於預期文檔（比對檔名或相對路徑，不分大小寫）"""
+    candidates = {
+        (metadata.get("source_file") or "").lower(),
+        (metadata.get("relative_path") or "").replace("\\", "/").lower(),
+    }
+    for expected in expected_sources:
+        expected = expected.replace("\\", "/").lower()
+        if any(c and (c == expected or c.endswith("/" + expected)) for c in candidates):
+            return True
+    return False
+
+def rank_sources(metadatas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """將文字塊結果依文檔去重，保留每個文檔第一次出現的排名"""
+    seen = set()
+    ranked = []
+    for metadata in metadatas:
+        key = metadata.get("relative_path") or metadata.get("source_file")
+        if key not in seen:
+            seen.add(key)
+            ranked.append(metadata)
+    return ranked
+
+def run_mode(agent, mode: str, query: str, n_results: int, threshold: float):
+    """執行一次檢索，返回 (依門檻過濾後的 metadata 列表, 延遲毫秒)"""
+    start = time.perf_counter()
+    if mode in RAW_MODES:
+        results = agent._search_documents(query, n_results=n_results, mode=mode)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if not results.get("metadatas") or not results["metadatas"][0]:
+            return [], elapsed_ms
+        lexical_hits = results.get("lexical_hits", [[False] * len(results["metadatas"][0])])[0]
+        metadatas = [
+            metadata for metadata, distance, lexical in zip(results["metadatas"][0], results["distances"][0], lexical_hits)
+            if distance <= threshold or lexical
+        ]
+        return metadatas, elapsed_ms
+
+    # 完整流程（含門檻過濾、重排序、MMR）
+    with config_overrides(SIMILARITY_THRESHOLD=threshold, MMR_ENABLED=mode == "mmr"):
+        _, docs = agent.retrieve_documents(query)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return [doc["metadata"] for doc in docs], elapsed_ms
+
+def evaluate(agent, dataset: List[Dict[str, Any]], mode: str, ks: List[int], threshold: float) -> Dict[str, Any]:
+    """評估單一模式與門檻組合"""
+    max_k = max(ks)
+    latencies = []
+    recalls = {k: [] for k in ks}
+    reciprocal_ranks = []
+
+    for item in dataset:
+        metadatas, elapsed_ms = run_mode(agent, mode, item["query"], max_k, threshold)
+        latencies.append(elapsed_ms)
+
+        expected = item.get("expected_sources") or []
+        if not expected:
+            continue
+
+        ranked = rank_sources(metadatas)
+        hits = [is_relevant(metadata, expected) for metadata in ranked]
+        for k in ks:
+            found = sum(hits[:k])
+            recalls[k].append(min(found, len(expected)) / len(expected))
+        first_hit = next((i for i, hit in enumerate(hits) if hit), None)
+        reciprocal_ranks.append(1.0 / (first_hit + 1) if first_hit is not None else 0.0)
+
+    labelled = len(reciprocal_ranks)
+    return {
+        "mode": mode,
+        "threshold": threshold,
+        "queries": len(dataset),
+        "labelled": labelled,
+        "recall": {k: (float(np.mean(v)) if v else None) for k, v in recalls.items()},
+        "mrr": float(np.mean(reciprocal_ranks)) if labelled else None,
+        "p50_ms": float(np.percentile(latencies, 50)) if latencies else 0.0,
+        "p95_ms": float(np.percentile(latencies, 95)) if latencies else 0.0,
+    }
+
+def reindex_overrides(args) -> Tuple[str, Dict[str, Any]]:
+    """重建暫存索引使用的 config 覆寫值：輸出路徑導向暫存目錄（不影響正式資料）與分塊參數"""
+    from embedding_service import get_embedding_service
+
+    # 先以原始 MODEL_PATH 載入 embedding 模型，再將輸出路徑導向暫存目錄
+    get_embedding_service()
+    work_dir = args.vector_db or tempfile.mkdtemp(prefix="rag_eval_")
+    overrides = {
+        "VECTOR_DB_PATH": os.path.join(work_dir, "vector_db"),
+        "MODEL_PATH": os.path.join(work_dir, "models"),
+        "IMAGES_PATH": os.path.join(work_dir, "images"),
+    }
+    if args.chunk_size:
+        overrides["CHUNK_SIZE"] = args.chunk_size
+    if args.chunk_overlap is not None:
+        overrides["CHUNK_OVERLAP"] = args.chunk_overlap
+    if args.chunking_method:
+        overrides["CHUNKING_METHOD"] = args.chunking_method
+    return work_dir, overrides
+
+def reindex(work_dir: str):
+    """以目前的分塊參數重建暫存向量資料庫（需在 reindex_overrides 的設定下執行）"""
+    print(f"🔧 重建評估用索引: {work_dir}（CHUNK_SIZE={config.CHUNK_SIZE}, "
+          f"CHUNK_OVERLAP={config.CHUNK_OVERLAP}, CHUNKING_METHOD={config.CHUNKING_METHOD}）")
+    from document_processor import DocumentProcessor
+    DocumentProcessor().process_docx_files(force_reprocess=True)
+
+def run_evaluation(dataset: List[Dict[str, Any]], modes: List[str], ks: List[int], thresholds: List[float]) -> Optional[List[Dict[str, Any]]]:
+    """依序評估各模式與門檻；向量資料庫不存在時返回 None"""
+    from agents.rag_agent import RAGAgent
+    agent = RAGAgent()
+    if not agent.collection:
+        print("❌ 向量資料庫尚未建立，請先執行 document_processor.py 或加上 --reindex")
+        return None
+    rerank_service = agent.rerank_service
+
+    reports = []
+    for mode in modes:
+        # 重排序只在 rerank 模式啟用
+        agent.rerank_service = rerank_service if mode == "rerank" else None
+        for threshold in thresholds:
+            try:
+                reports.append(evaluate(agent, dataset, mode, ks, threshold))
+            except Exception as e:
+                print(f"❌ 模式 {mode} 評估失敗: {e}")
+                print("   若為向量維度不符，請確認向量資料庫與 embedding 後端一致（可加上 --reindex）")
+                break
+    return reports
+
+def print_report(reports: List[Dict[str, Any]], ks: List[int]):
+    """輸出評估結果表格"""
+    header = f"{'模式':<10}{'門檻':>8}" + "".join(f"{'R@' + str(k):>8}" for k in ks) + f"{'MRR':>8}{'p50(ms)':>10}{'p95(ms)':>10}"
+    print("\n" + "=" * len(header))
+    print(header)
+    print("-" * len(header))
+    for report in reports:
+        recall_cols = "".join(
+            f"{report['recall'][k]:>8.3f}" if report['recall'][k] is not None else f"{'-':>8}" for k in ks
+        )
+        mrr = f"{report['mrr']:>8.3f}" if report['mrr'] is not None else f"{'-':>8}"
+        print(f"{report['mode']:<10}{report['threshold']:>8.2f}{recall_cols}{mrr}{report['p50_ms']:>10.1f}{report['p95_ms']:>10.1f}")
+    print("=" * len(header))
+    if reports:
+        print(f"查詢數: {reports[0]['queries']}，有標註: {reports[0]['labelled']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="檢索品質與延遲評估")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET_PATH, help="標註資料集 JSON 檔")
+    parser.add_argument("--modes", default="vector,hybrid", help="評估模式，逗號分隔: vector, hybrid, mmr, rerank")
+    parser.add_argument("--k", default="1,3,5", help="recall@k 的 k 值，逗號分隔")
+    parser.add_argument("--thresholds", default=None, help="相似度（距離）門檻，逗號分隔；預設使用 config.SIMILARITY_THRESHOLD")
+    parser.add_argument("--backend", default=None, choices=["sentence_transformers", "openai"], help="embedding 後端（離線評估請用 sentence_transformers）")
+    parser.add_argument("--reindex", action="store_true", help="以下列分塊參數重建暫存索引後再評估")
+    parser.add_argument("--vector-db", default=None, help="重建索引的工作目錄（預設為暫存目錄）")
+    parser.add_argument("--chunk-size", type=int, default=None, help="覆寫 CHUNK_SIZE")
+    parser.add_argument("--chunk-overlap", type=int, default=None, help="覆寫 CHUNK_OVERLAP")
+    parser.add_argument("--chunking-method", default=None, help="覆寫 CHUNKING_METHOD")
+    parser.add_argument("--output", default=None, help="將結果另存為 JSON 檔")
+    args = parser.parse_args()
+
+    ks = sorted({int(k) for k in args.k.split(",")})
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = set(modes) - RAW_MODES - PIPELINE_MODES
+    if unknown:
+        parser.error(f"不支援的模式: {', '.join(sorted(unknown))}")
+    thresholds = [float(t) for t in args.thresholds.split(",")] if args.thresholds else [config.SIMILARITY_THRESHOLD]
+
+    dataset = load_dataset(args.dataset)
+    unlabelled = sum(1 for item in dataset if not item.get("expected_sources"))
+    if unlabelled:
+        print(f"⚠️ {unlabelled}/{len(dataset)} 個查詢沒有標註 expected_sources，只計入延遲")
+
+    settings = {"RERANK_ENABLED": "rerank" in modes}
+    if args.backend:
+        settings["EMBEDDING_BACKEND"] = args.backend
+    with config_overrides(**settings):
+        work_dir, index_settings = reindex_overrides(args) if args.reindex else (None, {})
+        with config_overrides(**index_settings):
+            if args.reindex:
+                reindex(work_dir)
+            reports = run_evaluation(dataset, modes, ks, thresholds)
+    if reports is None:
+        return
+
+    print_report(reports, ks)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+        print(f"結果已保存至: {args.output}")
+
+if __name__ == "__main__":
+    main()
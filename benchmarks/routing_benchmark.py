@@ -0,0 +1,87 @@
+"""
+意圖路由準確度評估
+以標註查詢集（expected 為工具名稱，或 "agent" 表示應交由 ReAct Agent）評估 IntentRouter 的
+準確度、各工具的 precision/recall，以及直接執行工具省下的 LLM 呼叫次數（不呼叫 LLM、不執行工具）
+
+執行方式: python benchmarks/routing_benchmark.py [--queries benchmarks/routing_queries.json] [--threshold 0.8] [--embedding]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from collections import Counter
+
+# 將專案根目錄加入 sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import config
+from tools.tool_manager import ToolManager
+from agents.intent_router import IntentRouter
+
+DEFAULT_QUERIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "routing_queries.json")
+AGENT = "agent"
+
+def main():
+    parser = argparse.ArgumentParser(description="意圖路由準確度評估")
+    parser.add_argument("--queries", default=DEFAULT_QUERIES_PATH, help="標註查詢集 JSON 檔")
+    parser.add_argument("--threshold", type=float, default=config.INTENT_ROUTER_THRESHOLD, help="規則信心度門檻")
+    parser.add_argument("--embedding", action="store_true", help="啟用 embedding 相似度路由")
+    parser.add_argument("--react-calls", type=int, default=2,
+                        help="ReAct 處理單一工具查詢的 LLM 呼叫數（選擇工具 + 整理答案）")
+    args = parser.parse_args()
+
+    with open(args.queries, 'r', encoding='utf-8') as f:
+        labelled = json.load(f)
+
+    config.INTENT_ROUTER_THRESHOLD = args.threshold
+    router = IntentRouter(ToolManager().tools, use_embedding=args.embedding)
+
+    rows, latencies = [], []
+    for item in labelled:
+        start = time.perf_counter()
+        decision = router.route(item["query"])
+        latencies.append((time.perf_counter() - start) * 1000)
+        predicted = decision["tool"] if decision else AGENT
+        rows.append((item["query"], item["expected"], predicted, decision))
+
+    print("\n" + "=" * 100)
+    print(f"{'查詢':<40}{'標註':<22}{'路由結果':<22}{'信心度':>8}")
+    print("-" * 100)
+    for query, expected, predicted, decision in rows:
+        mark = "✅" if expected == predicted else "❌"
+        confidence = f"{decision['confidence']:.2f}" if decision else "-"
+        print(f"{mark} {query[:36]:<38}{expected:<22}{predicted:<22}{confidence:>8}")
+
+    correct = sum(1 for _, expected, predicted, _ in rows if expected == predicted)
+    expected_counts = Counter(expected for _, expected, _, _ in rows)
+    predicted_counts = Counter(predicted for _, _, predicted, _ in rows)
+    hits = Counter(expected for _, expected, predicted, _ in rows if expected == predicted)
+
+    print("-" * 100)
+    print(f"{'類別':<24}{'precision':>12}{'recall':>12}{'樣本數':>10}")
+    for label in sorted(expected_counts, key=lambda l: (l == AGENT, l)):
+        precision = hits[label] / predicted_counts[label] if predicted_counts[label] else 0.0
+        recall = hits[label] / expected_counts[label]
+        print(f"{label:<24}{precision:>12.2f}{recall:>12.2f}{expected_counts[label]:>10}")
+
+    # 路由到錯誤的工具或把應交由 Agent 的查詢直接執行工具，都會給出錯誤答案；漏路由只是少省 LLM 呼叫
+    routed_correct = sum(1 for _, expected, predicted, _ in rows if predicted != AGENT and expected == predicted)
+    misrouted = sum(1 for _, expected, predicted, _ in rows if predicted != AGENT and expected != predicted)
+    missed = sum(1 for _, expected, predicted, _ in rows if predicted == AGENT and expected != AGENT)
+    tool_queries = len(rows) - expected_counts[AGENT]
+
+    print("-" * 100)
+    print(f"準確度: {correct}/{len(rows)}（{correct / len(rows) * 100:.1f}%）")
+    print(f"直接執行工具: {routed_correct + misrouted} 筆（正確 {routed_correct}、錯誤 {misrouted}），"
+          f"工具查詢漏路由 {missed}/{tool_queries}")
+    print(f"省下 LLM 呼叫: {routed_correct * args.react_calls} 次"
+          f"（全部交由 Agent 至少需要 {tool_queries * args.react_calls} 次）")
+    print(f"路由延遲: 平均 {np.mean(latencies):.2f} ms，P95 {np.percentile(latencies, 95):.2f} ms"
+          f"（embedding: {'啟用' if args.embedding else '停用'}）")
+    print("=" * 100)
+
+if __name__ == "__main__":
+    main()
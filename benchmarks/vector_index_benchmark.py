@@ -0,0 +1,169 @@
+"""
+向量索引規模評估
+以合成向量（依領域分群）在暫存 Chroma 資料庫中比較不同規模、HNSW 參數與分片方式的 recall@k 與查詢延遲，
+並與本地向量索引（mmap 矩陣 + NumPy 暴力搜尋）比較
+正確答案以 NumPy 暴力搜尋計算
+
+執行方式:
+  python benchmarks/vector_index_benchmark.py --sizes 10000,100000 --search-ef 10,64,128
+  # 大規模（約需數 GB 記憶體與較長建立時間）
+  python benchmarks/vector_index_benchmark.py --sizes 500000 --dim 384 --queries 200
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+from typing import List, Dict, Any
+
+# 將專案根目錄加入 sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import chromadb
+from chromadb.config import Settings
+import config
+from services.vector_collections import ShardedCollection
+from services.vector_store import LocalVectorStore
+
+DOMAINS = ["spc", "edc", "general"]
+INSERT_BATCH = 5000
+
+def make_corpus(size: int, dim: int, clusters_per_domain: int, seed: int = 0):
+    """產生依領域分群的正規化向量，返回 (向量, 領域索引)"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((len(DOMAINS) * clusters_per_domain, dim)).astype(np.float32)
+    assignments = rng.integers(0, len(centers), size)
+    vectors = centers[assignments] + 0.6 * rng.standard_normal((size, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors, assignments // clusters_per_domain
+
+def make_queries(vectors: np.ndarray, domains: np.ndarray, count: int, seed: int = 1):
+    """由語料向量加入雜訊產生查詢，返回 (查詢向量, 所屬領域)"""
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(vectors), count)
+    queries = vectors[picks] + 0.3 * rng.standard_normal((count, vectors.shape[1])).astype(np.float32) / np.sqrt(vectors.shape[1])
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return queries, domains[picks]
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> List[set]:
+    """NumPy 暴力搜尋的正確答案（分批計算避免大型中間矩陣）"""
+    truth = []
+    for i in range(0, len(queries), 64):
+        sims = queries[i:i + 64] @ vectors.T
+        top = np.argpartition(-sims, k, axis=1)[:, :k]
+        truth.extend({f"c{j}" for j in row} for row in top)
+    return truth
+
+def build_collection(client, name: str, vectors: np.ndarray, ids: List[str], hnsw: Dict[str, Any]):
+    collection = client.create_collection(name=name, metadata={"hnsw:space": "cosine", **hnsw})
+    for i in range(0, len(ids), INSERT_BATCH):
+        collection.add(ids=ids[i:i + INSERT_BATCH], embeddings=vectors[i:i + INSERT_BATCH].tolist())
+    return collection
+
+def measure(search, queries: np.ndarray, query_domains: np.ndarray, truth: List[set], k: int) -> Dict[str, float]:
+    latencies, recalls = [], []
+    for query, domain, expected in zip(queries, query_domains, truth):
+        start = time.perf_counter()
+        result = search(query, domain)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(len(expected & set(result["ids"][0])) / k)
+    return {
+        "recall": float(np.mean(recalls)),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+    }
+
+def run_size(size: int, args, search_efs: List[int]) -> List[Dict[str, Any]]:
+    print(f"\n=== {size} 個文字塊（維度 {args.dim}）===")
+    vectors, domains = make_corpus(size, args.dim, args.clusters)
+    queries, query_domains = make_queries(vectors, domains, args.queries)
+    truth = exact_top_k(vectors, queries, args.k)
+    ids = [f"c{i}" for i in range(size)]
+
+    start = time.perf_counter()
+    for query in queries[:50]:
+        sims = vectors @ query
+        np.argpartition(-sims, args.k)[:args.k]
+    brute_ms = (time.perf_counter() - start) * 1000 / min(50, len(queries))
+
+    rows = [{"size": size, "layout": "numpy", "search_ef": "-", "recall": 1.0, "p50_ms": brute_ms, "p95_ms": brute_ms, "build_s": 0.0}]
+
+    work_dir = tempfile.mkdtemp(prefix="vector_bench_local_")
+    try:
+        start = time.perf_counter()
+        local = LocalVectorStore(path=work_dir)
+        for i in range(0, size, INSERT_BATCH):
+            batch_ids = ids[i:i + INSERT_BATCH]
+            local.upsert(ids=batch_ids, metadatas=[{}] * len(batch_ids), documents=[""] * len(batch_ids),
+                         embeddings=vectors[i:i + INSERT_BATCH])
+        build_s = time.perf_counter() - start
+        start = time.perf_counter()
+        local = LocalVectorStore(path=work_dir, create=False)
+        print(f"本地索引開啟耗時: {(time.perf_counter() - start) * 1000:.1f} ms")
+        stats = measure(lambda q, d: local.query(query_embeddings=[q], n_results=args.k, include=[]),
+                        queries, query_domains, truth, args.k)
+        rows.append({"size": size, "layout": "local", "search_ef": "-", "build_s": build_s, **stats})
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    for search_ef in search_efs:
+        hnsw = {"hnsw:M": args.m, "hnsw:construction_ef": args.construction_ef, "hnsw:search_ef": search_ef}
+        work_dir = tempfile.mkdtemp(prefix="vector_bench_")
+        try:
+            client = chromadb.PersistentClient(path=work_dir, settings=Settings(anonymized_telemetry=False))
+
+            start = time.perf_counter()
+            single = build_collection(client, "single", vectors, ids, hnsw)
+            build_s = time.perf_counter() - start
+            stats = measure(lambda q, d: single.query(query_embeddings=[q.tolist()], n_results=args.k, include=[]),
+                            queries, query_domains, truth, args.k)
+            rows.append({"size": size, "layout": "single", "search_ef": search_ef, "build_s": build_s, **stats})
+
+            start = time.perf_counter()
+            shards = {}
+            for index, domain in enumerate(DOMAINS):
+                mask = domains == index
+                shards[domain] = build_collection(client, f"shard_{domain}", vectors[mask],
+                                                  [ids[i] for i in np.flatnonzero(mask)], hnsw)
+            sharded = ShardedCollection(shards)
+            build_s = time.perf_counter() - start
+            stats = measure(lambda q, d: sharded.query(query_embeddings=[q.tolist()], n_results=args.k, include=[],
+                                                       domains=[DOMAINS[d]]),
+                            queries, query_domains, truth, args.k)
+            rows.append({"size": size, "layout": "routed", "search_ef": search_ef, "build_s": build_s, **stats})
+            stats = measure(lambda q, d: sharded.query(query_embeddings=[q.tolist()], n_results=args.k, include=[]),
+                            queries, query_domains, truth, args.k)
+            rows.append({"size": size, "layout": "fan-out", "search_ef": search_ef, "build_s": build_s, **stats})
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="向量索引規模評估")
+    parser.add_argument("--sizes", default="10000,50000", help="文字塊數量，逗號分隔（例如 10000,100000,500000）")
+    parser.add_argument("--dim", type=int, default=256, help="向量維度")
+    parser.add_argument("--clusters", type=int, default=20, help="每個領域的主題群數")
+    parser.add_argument("--queries", type=int, default=100, help="查詢數量")
+    parser.add_argument("--k", type=int, default=10, help="recall@k 的 k 值")
+    parser.add_argument("--m", type=int, default=config.HNSW_M, help="HNSW M")
+    parser.add_argument("--construction-ef", type=int, default=config.HNSW_CONSTRUCTION_EF, help="HNSW construction_ef")
+    parser.add_argument("--search-ef", default=str(config.HNSW_SEARCH_EF), help="HNSW search_ef，逗號分隔")
+    args = parser.parse_args()
+
+    search_efs = [int(ef) for ef in args.search_ef.split(",")]
+    rows = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        rows.extend(run_size(size, args, search_efs))
+
+    header = f"{'規模':>9}{'配置':>10}{'ef':>6}{'R@' + str(args.k):>8}{'p50(ms)':>10}{'p95(ms)':>10}{'建立(s)':>10}"
+    print("\n" + header)
+    print("-" * len(header))
+    for row in rows:
+        print(f"{row['size']:>9}{row['layout']:>10}{row['search_ef']:>6}{row['recall']:>8.3f}"
+              f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['build_s']:>10.1f}")
+    print(f"\nHNSW: M={args.m}, construction_ef={args.construction_ef}；numpy 為記憶體內暴力搜尋基準，local 為本地向量索引（含讀取文字塊 ID）")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+文字分塊引擎
+依 config.CHUNKING_METHOD 提供四種分塊策略，全部以「句子區間」（原文起訖位置）運作：
+- fixed：依 token 數填滿文字塊
+- semantic：相鄰句子視窗的詞頻餘弦相似度低於門檻時斷開（主題轉換）
+- keyword：新句子的關鍵詞與目前文字塊重疊比例低於門檻時斷開
+- structure：依段落與標題斷開，段落不會被切開（超過大小時才分割）
+
+文字塊大小以 token 計算（CHUNK_SIZE / CHUNK_OVERLAP / MIN_CHUNK_SIZE），
+重疊部分以完整句子為單位；文字塊內容直接取原文區間，不做字串累加
+"""
+
+import re
+import math
+from collections import Counter
+from typing import List, Dict, Optional
+import config
+from services.token_service import count_tokens
+from utils import tokenize_for_search
+
+CHUNKING_METHODS = ("fixed", "semantic", "keyword", "structure")
+
+# 句子：以中英文句末標點或換行結尾（英文句點需後接空白，避免切開小數與版本號）
+_SENTENCE_PATTERN = re.compile(r'[^\n。！？!?]*?(?:[。！？!?]+|\.(?=\s)|\n|$)')
+# 標題樣式的段落：Markdown 標題、章節編號（1. / 1.2 / 一、 / 第一章）
+_HEADING_PATTERN = re.compile(r'^(?:#{1,6}\s|\d+(?:\.\d+)*[.、\s]|[一二三四五六七八九十]+、|第[一二三四五六七八九十\d]+[章節])')
+# 語義分塊時比較的前後視窗句子數
+_SEMANTIC_WINDOW = 2
+
+def split_sentences(text: str) -> List[Dict]:
+    """
+    將文字切分為句子區間
+
+    Returns:
+        句子列表，每筆含 start、end（原文位置）、tokens、paragraph_start（是否為段落開頭）
+    """
+    sentences = []
+    paragraph_start = True
+    for match in _SENTENCE_PATTERN.finditer(text):
+        start, end = match.span()
+        segment = text[start:end]
+        stripped = segment.strip()
+        if stripped:
+            start += len(segment) - len(segment.lstrip())
+            end = start + len(stripped)
+            sentences.append({
+                "start": start,
+                "end": end,
+                "tokens": count_tokens(stripped),
+                "paragraph_start": paragraph_start,
+            })
+            paragraph_start = False
+        if segment.endswith("\n"):
+            paragraph_start = True
+    return sentences
+
+def _split_oversized(text: str, sentence: Dict, max_tokens: int) -> List[Dict]:
+    """將超過大小上限的句子依字元比例切成多段（線性時間，不重複編碼）"""
+    length = sentence["end"] - sentence["start"]
+    pieces = math.ceil(sentence["tokens"] / max_tokens)
+    step = math.ceil(length / pieces)
+    result = []
+    for offset in range(0, length, step):
+        start = sentence["start"] + offset
+        end = min(start + step, sentence["end"])
+        result.append({
+            "start": start,
+            "end": end,
+            "tokens": count_tokens(text[start:end]),
+            "paragraph_start": sentence["paragraph_start"] and offset == 0,
+        })
+    return result
+
+def _cosine(a: Counter, b: Counter) -> float:
+    if not a or not b:
+        return 0.0
+    if len(a) > len(b):
+        a, b = b, a
+    dot = sum(count * b.get(term, 0) for term, count in a.items())
+    norm = math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values()))
+    return dot / norm if norm else 0.0
+
+def _semantic_boundaries(text: str, sentences: List[Dict], threshold: float) -> List[bool]:
+    """
+    標記每個句子之前是否為主題轉換點：比較前後各 _SEMANTIC_WINDOW 句的詞頻向量（TextTiling）
+    以滑動視窗增減詞頻，整體為線性時間
+    """
+    terms = [Counter(tokenize_for_search(text[s["start"]:s["end"]])) for s in sentences]
+    boundaries = [False] * len(sentences)
+    before, after = Counter(), Counter()
+    for k in range(min(_SEMANTIC_WINDOW, len(terms))):
+        after.update(terms[k])
+
+    for i in range(1, len(sentences)):
+        # 視窗前移：句子 i-1 進入前視窗、離開後視窗
+        before.update(terms[i - 1])
+        if i - 1 - _SEMANTIC_WINDOW >= 0:
+            before.subtract(terms[i - 1 - _SEMANTIC_WINDOW])
+        after.subtract(terms[i - 1])
+        if i - 1 + _SEMANTIC_WINDOW < len(terms):
+            after.update(terms[i - 1 + _SEMANTIC_WINDOW])
+        before += Counter()  # 移除計數為 0 的詞
+        after += Counter()
+        boundaries[i] = _cosine(before, after) < threshold
+    return boundaries
+
+def _keyword_boundaries(text: str, sentences: List[Dict], threshold: float) -> List[bool]:
+    """
+    標記每個句子之前是否為主題轉換點：新句子的關鍵詞出現在目前段落中的比例低於門檻
+    （段落在斷點處重新累計）
+    """
+    boundaries = [False] * len(sentences)
+    current = set()
+    for i, sentence in enumerate(sentences):
+        keywords = {t for t in tokenize_for_search(text[sentence["start"]:sentence["end"]]) if len(t) > 1}
+        if current and keywords:
+            overlap = len(keywords & current) / len(keywords)
+            if overlap < threshold:
+                boundaries[i] = True
+                current = set()
+        current |= keywords
+    return boundaries
+
+def _is_heading(text: str, sentence: Dict) -> bool:
+    return sentence["paragraph_start"] and bool(_HEADING_PATTERN.match(text[sentence["start"]:sentence["end"]]))
+
+def _pack(sentences: List[Dict], boundaries: List[bool], chunk_size: int,
+          chunk_overlap: int, min_chunk_size: int, hard_boundaries: Optional[List[bool]] = None) -> List[Dict]:
+    """
+    將句子依 token 大小打包成文字塊
+
+    Args:
+        boundaries: 可選斷點（文字塊達到 min_chunk_size 後在此斷開）
+        hard_boundaries: 必定斷開的位置（例如標題），不受 min_chunk_size 限制
+    """
+    chunks = []
+    current: List[Dict] = []
+    current_tokens = 0
+
+    def emit():
+        chunks.append({
+            "start": current[0]["start"],
+            "end": current[-1]["end"],
+            "tokens": current_tokens,
+        })
+
+    for i, sentence in enumerate(sentences):
+        if current:
+            hard = hard_boundaries is not None and hard_boundaries[i]
+            topical = boundaries[i] and current_tokens >= min_chunk_size
+            if hard or topical:
+                # 主題或結構斷點：新文字塊不帶重疊
+                emit()
+                current, current_tokens = [], 0
+            elif current_tokens + sentence["tokens"] > chunk_size:
+                emit()
+                # 大小斷點：從結尾往前保留完整句子作為重疊
+                overlap, overlap_tokens = [], 0
+                for previous in reversed(current):
+                    if overlap_tokens + previous["tokens"] > chunk_overlap or \
+                            overlap_tokens + previous["tokens"] + sentence["tokens"] > chunk_size:
+                        break
+                    overlap.insert(0, previous)
+                    overlap_tokens += previous["tokens"]
+                current, current_tokens = overlap, overlap_tokens
+        current.append(sentence)
+        current_tokens += sentence["tokens"]
+
+    if current:
+        emit()
+    return chunks
+
+def chunk_document(text: str, method: Optional[str] = None, chunk_size: Optional[int] = None,
+                   chunk_overlap: Optional[int] = None, min_chunk_size: Optional[int] = None) -> List[Dict]:
+    """
+    將文字分塊
+
+    Args:
+        text: 原始文字（保留換行，段落與標題資訊用於 structure 策略）
+        method: 分塊策略（預設 config.CHUNKING_METHOD）
+        chunk_size: 文字塊 token 上限（預設 config.CHUNK_SIZE）
+        chunk_overlap: 大小斷點時的重疊 token 上限（預設 config.CHUNK_OVERLAP）
+        min_chunk_size: 主題斷點的最小文字塊 token 數（預設 config.MIN_CHUNK_SIZE）
+
+    Returns:
+        文字塊列表，每筆含 text、start、end（原文位置）、tokens
+    """
+    if not text:
+        return []
+
+    method = (method or getattr(config, "CHUNKING_METHOD", "fixed")).lower()
+    if method not in CHUNKING_METHODS:
+        print(f"⚠️ 未知的分塊策略 {method}，改用 fixed")
+        method = "fixed"
+    chunk_size = chunk_size or getattr(config, "CHUNK_SIZE", 512)
+    chunk_overlap = chunk_overlap if chunk_overlap is not None else getattr(config, "CHUNK_OVERLAP", 50)
+    min_chunk_size = min(min_chunk_size if min_chunk_size is not None else getattr(config, "MIN_CHUNK_SIZE", 100), chunk_size)
+
+    sentences = []
+    for sentence in split_sentences(text):
+        if sentence["tokens"] > chunk_size:
+            sentences.extend(_split_oversized(text, sentence, chunk_size))
+        else:
+            sentences.append(sentence)
+    if not sentences:
+        return []
+
+    hard_boundaries = None
+    if method == "semantic":
+        boundaries = _semantic_boundaries(text, sentences, getattr(config, "SEMANTIC_SIMILARITY_THRESHOLD", 0.3))
+    elif method == "keyword":
+        boundaries = _keyword_boundaries(text, sentences, getattr(config, "KEYWORD_OVERLAP_THRESHOLD", 0.2))
+    elif method == "structure":
+        boundaries = [sentence["paragraph_start"] for sentence in sentences]
+        hard_boundaries = [_is_heading(text, sentence) for sentence in sentences]
+    else:
+        boundaries = [False] * len(sentences)
+
+    chunks = _pack(sentences, boundaries, chunk_size, chunk_overlap, min_chunk_size, hard_boundaries)
+    for chunk in chunks:
+        chunk["text"] = text[chunk["start"]:chunk["end"]]
+    return chunks
+
+def chunk_sections(sections: List[Dict], chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None,
+                   min_chunk_size: Optional[int] = None) -> List[Dict]:
+    """
+    結構分塊：逐章節分塊，文字塊不會跨越章節，並在開頭加上章節路徑（例如「SPC 設定 > AFF Diff GAP」）
+
+    Args:
+        sections: utils.extract_document 產生的章節列表（heading_path、text）
+
+    Returns:
+        文字塊列表，每筆含 text、section（章節路徑）、images（章節內的圖片）、tokens
+    """
+    chunk_size = chunk_size or getattr(config, "CHUNK_SIZE", 512)
+    chunks = []
+    for section in sections:
+        if not section.get("text"):
+            continue
+        path = " > ".join(section.get("heading_path") or [])
+        prefix = f"{path}\n" if path else ""
+        prefix_tokens = count_tokens(prefix)
+        # 章節路徑佔用的 token 從文字塊大小中扣除（至少保留一半給內文）
+        body_size = max(chunk_size - prefix_tokens, chunk_size // 2)
+        for chunk in chunk_document(section["text"], "structure", body_size, chunk_overlap, min_chunk_size):
+            chunks.append({
+                "text": prefix + chunk["text"],
+                "section": path,
+                "images": section.get("images", []),
+                "tokens": prefix_tokens + chunk["tokens"],
+            })
+    return chunks
+
+def images_in_span(sections: List[Dict], start: int, end: int) -> List[str]:
+    """取得與完整文字區間 [start, end) 重疊的章節內的圖片（章節需含 start、end、images）"""
+    images = []
+    for section in sections:
+        if section.get("start", 0) < end and section.get("end", 0) >= start:
+            images.extend(section.get("images", []))
+    return list(dict.fromkeys(images))
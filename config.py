@@ -65,14 +65,23 @@ LOCAL_MODEL = "all-mpnet-base-v2" # 本地Sentence Transformer模型
 CHUNKING_METHOD = "semantic"  # 選項: "fixed", "semantic", "keyword", "structure"
 # "semantic"    # 語義分塊
 # "keyword"   # 關鍵詞分塊  
-# "structure" # 結構分塊
+# "structure" # 結構分塊（依 DOCX 標題樣式分章節，文字塊不跨章節，表格轉為 Markdown）
 # "fixed"     # 固定長度分塊
-CHUNK_SIZE = 512
-CHUNK_OVERLAP = 50
-MIN_CHUNK_SIZE = 100
+CHUNK_SIZE = 512      # 文字塊 token 上限
+CHUNK_OVERLAP = 50    # 重疊 token 上限（以完整句子為單位）
+MIN_CHUNK_SIZE = 100  # 語義/關鍵詞/結構斷點的最小文字塊 token 數
 SEMANTIC_SIMILARITY_THRESHOLD = 0.3  # 語義相似度閾值
 KEYWORD_OVERLAP_THRESHOLD = 0.2      # 關鍵詞重疊度閾值
 
+# 文檔索引建立配置
+INGEST_WORKERS = 4  # 文檔提取（DOCX 解析、圖片、關鍵字）的平行程序數量，0 表示使用所有 CPU 核心
+INGEST_BATCH_SIZE = 256  # 每批向量化並寫入向量資料庫的文字塊數量（每批完成後更新檔案清單，中斷後增量處理會接續）
+
+# 圖片預覽配置（文檔索引建立時產生縮圖，介面顯示預覽而非原圖）
+IMAGE_PREVIEW_SIZE = (800, 600)  # 縮圖最大尺寸（寬, 高）
+IMAGE_PREVIEW_FORMAT = "WEBP"    # 縮圖格式
+IMAGE_PREVIEW_QUALITY = 80       # 縮圖品質
+
 # 中文處理配置
 USE_JIEBA_USERDICT = True  # 是否使用自定義詞典
 CUSTOM_DICT_PATH = "./dataset/custom_dict.txt"  # 自定義詞典路徑
@@ -106,11 +115,118 @@ OLLAMA_BASE_URL = "http://localhost:11434"  # Ollama默認地址
 # 通用LLM配置
 LLM_TEMPERATURE = 0.7
 LLM_MAX_TOKENS = 2048
+LLM_HTTP_POOL_SIZE = 10           # LLM API 連線池大小（所有請求共用連線）
+LLM_CONNECT_TIMEOUT = 5           # 建立連線逾時（秒）
+LLM_READ_TIMEOUT = 60             # 等待回應逾時（秒；串流時為兩個 token 之間的最長間隔）
+LLM_MAX_RETRIES = 3               # 逾時、連線錯誤與 429/5xx 的重試次數
+LLM_RETRY_BACKOFF = 1.0           # 指數退避的起始等待秒數（無 Retry-After 時使用）
+LLM_RETRY_MAX_BACKOFF = 20.0      # 單次重試的最長等待秒數
+
+# LLM 請求排程（程序內所有 LLM 與 embedding 請求共用，互動對話優先於文檔索引建立）
+LLM_MAX_IN_FLIGHT = 4             # 同時進行的請求數上限
+LLM_RATE_LIMITS = {               # 每個模型每分鐘請求數上限（令牌桶），未列出的模型使用 default
+    "gpt-4.1": 30,
+    "gpt-4.1-mini": 60,
+    "default": 60,
+}
+LLM_DAILY_QUOTA = {               # 每日請求數額度（未列出表示不限制；代理返回額度用盡時也會降級）
+    "gpt-4.1": 1000,
+}
+LLM_DEGRADE_THRESHOLD = 0.9       # 用量達額度的此比例後改用降級模型
+LLM_DEGRADE_MODEL = "gpt-4.1-mini"  # 降級模型
+LLM_USAGE_SAVE_EVERY = 20         # 每累積此數量的請求寫入一次用量檔（換日、額度用盡與程序結束時也會寫入）
+
+# LLM 回應快取（模型、temperature、max_tokens 與正規化訊息完全相同時直接返回先前的回應）
+LLM_CACHE_ENABLED = True          # 是否啟用快取
+LLM_CACHE_TTL = 24 * 3600         # 快取有效秒數（知識庫或工具資料更新後，舊回應最多保留此時間）
+LLM_CACHE_MAX_ENTRIES = 5000      # 快取筆數上限（超過時淘汰最久未使用的項目）
+LLM_CACHE_MAX_TEMPERATURE = 0.2   # temperature 高於此值的請求不使用快取（需低於 LLM_TEMPERATURE，一般對話的取樣回答不重複使用）
+
+# 工具 Agent 配置
+AGENT_MODE = "react"                      # 選項: "react"（ReAct 文字格式，每輪一個工具）, "tool_calling"（OpenAI tool calls，同一輪並行執行多個工具）
+AGENT_MAX_ITERATIONS = 5                  # Agent 最多的 LLM 輪數
+AGENT_MAX_EXECUTION_TIME = 300            # Agent 單次問題的總執行時間上限（秒，react 與 tool_calling 模式皆適用）
+TOOL_ENTRY_POINT_GROUP = "autogen_mcp.tools"  # 外部套件提供工具的 entry point 群組（tools/ 目錄中的工具自動探索）
+TOOL_ORDER = [                            # 工具在 Agent 提示詞中的順序，未列出的工具依檔名排在後面，entry point 工具最後
+    "current_time", "calculation", "spc_query", "edc_query",
+    "edc_format_check", "ip_edc_config_check", "spc_detail_viewer",
+]
+TOOL_MAX_WORKERS_PER_TOOL = 4             # 每個工具的執行緒數（各工具獨立，某個外部系統無回應不影響其他工具）
+TOOL_TIMEOUT = 60                         # 工具執行時間上限（秒），逾時取消並返回說明訊息，Agent 繼續處理
+TOOL_TIMEOUTS = {                         # 個別工具的執行時間上限（秒），未列出的工具使用 TOOL_TIMEOUT
+    "spc_query": 120,
+    "calculation": 5,
+    "current_time": 5,
+}
+
+# 工具結果快取（各工具以 BaseTool.cache_ttl / cache_key 宣告策略，程序內所有對話共用）
+TOOL_CACHE_ENABLED = True                 # 是否啟用工具結果快取
+TOOL_CACHE_MAX_ENTRIES = 1000             # 快取筆數上限（超過時淘汰最久未使用的項目）
+TOOL_CACHE_PERSIST = False                # 是否以 SQLite 保存到磁碟（models/tool_cache.db，重新啟動後仍可使用）
+TOOL_CACHE_TTLS = {}                      # 覆寫個別工具的快取秒數，例如 {"spc_query": 0} 停用 SPC 快取
+
+# 意圖路由（Agent 模式下，格式完整的工具查詢直接執行工具，不經過 ReAct 迴圈）
+INTENT_ROUTER_ENABLED = True              # 是否啟用意圖路由
+INTENT_ROUTER_THRESHOLD = 0.8             # 規則信心度門檻（低於此值交由 Agent）
+INTENT_ROUTER_MARGIN = 0.1                # 最高分與次高分工具的最小差距（不足視為模糊，交由 Agent）
+INTENT_ROUTER_USE_EMBEDDING = False       # 規則無法判斷時是否以 embedding 相似度比對範例語句（每次查詢多一次 embedding）
+INTENT_ROUTER_EMBEDDING_THRESHOLD = 0.8   # embedding 相似度門檻
 
 # 搜尋配置
 SIMILARITY_THRESHOLD = 0.3        # 文檔檢索的最低相似度門檻（提高以過濾低品質結果）
 IMAGE_SIMILARITY_THRESHOLD = 0.6  # 圖片顯示的相似度門檻（較高確保相關性）
 
+# 向量儲存後端（切換後需以 --force-retrain 重建）
+VECTOR_STORE_BACKEND = "chroma"   # 選項: "chroma"（Chroma 資料庫）, "local"（程序內索引：mmap 向量矩陣 + SQLite）
+LOCAL_INDEX_BACKEND = "numpy"     # 本地索引的搜尋方式: "numpy"（暴力搜尋，結果精確）, "hnswlib"（需安裝 hnswlib）
+LOCAL_ANN_THRESHOLD = 50000       # 本地索引文字塊超過此數量時才使用 hnswlib
+
+# 向量索引配置（HNSW 參數於建立 collection 時套用，修改後需以 --force-retrain 重建）
+HNSW_M = 16                       # 每個節點的連結數（越大召回越高、索引越大）
+HNSW_CONSTRUCTION_EF = 200        # 建立索引時的候選數（越大索引品質越好、建立越慢）
+HNSW_SEARCH_EF = 64               # 查詢時的候選數（越大召回越高、查詢越慢）
+
+# 依文檔領域分片（啟用或修改後需以 --force-retrain 重建）
+COLLECTION_SHARDING = False       # 是否將文檔依領域寫入不同的 collection
+DOMAIN_KEYWORDS = {               # 領域關鍵詞（文檔依檔名/標題/關鍵字、查詢依內容分類，其餘為 general）
+    "spc": ["SPC", "CHART", "OOC", "OOS", "AFF", "管制圖"],
+    "edc": ["EDC"],
+}
+
+# 混合檢索配置（BM25 + 向量）
+RETRIEVAL_MODE = "hybrid"         # 選項: "vector"（純向量）, "hybrid"（BM25 + 向量，RRF 融合）
+HYBRID_CANDIDATES = 20            # 每個檢索器取回的候選數量（融合前）
+BM25_K1 = 1.5                     # BM25 詞頻飽和參數
+BM25_B = 0.75                     # BM25 文件長度正規化參數
+RRF_K = 60                        # 倒數排名融合常數
+HYBRID_LEXICAL_BYPASS_TOP_N = 3   # BM25 排名前幾名的結果不受 SIMILARITY_THRESHOLD 限制（精確關鍵詞比對）
+
+# 重排序配置（本地 Cross-Encoder）
+RERANK_ENABLED = False                                # 是否啟用重排序
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2" # 中文文檔可改用 "BAAI/bge-reranker-base"
+RERANK_BACKEND = "torch"                              # 選項: "torch", "onnx"
+RERANK_ONNX_FILE = None                               # ONNX 量化模型檔，例如 "onnx/model_qint8_avx512_vnni.onnx"
+RERANK_CANDIDATES = 30                                # 向量資料庫取回的候選數量
+RERANK_TOP_K = 3                                      # 重排序後送入上下文的文檔數量
+RERANK_BATCH_SIZE = 16                                # CPU 批次推論大小
+RERANK_LATENCY_BUDGET_MS = 300                        # 延遲預算，超出時略過重排序
+RERANK_ESTIMATE_DECAY = 0.8                           # 因預估超出預算而略過時，預估耗時乘上此係數（逐漸重新嘗試）
+
+# MMR 去重配置（最大邊際相關性，避免上下文充滿近似重複的文字塊）
+MMR_ENABLED = True                # 是否啟用 MMR 選取（在重排序之後執行，以重排序分數作為相關性）
+MMR_FETCH_K = 20                  # MMR 候選數量
+MMR_TOP_K = 3                     # MMR 選取數量（已重排序時改用 RERANK_TOP_K）
+MMR_LAMBDA = 0.5                  # 相關性權重（1.0 = 只看相關性，0.0 = 只看差異性）
+
+# RAG 提示詞 token 預算配置（提示詞大小直接影響延遲與 InnoAI 代理用量）
+TOKENIZER_ENCODING = "o200k_base"      # tiktoken 編碼（gpt-4.1 系列）；未安裝 tiktoken 時使用近似估算
+RAG_PROMPT_TOKEN_BUDGET = 6000         # 整體提示詞 token 上限
+RAG_CONTEXT_MAX_DOCS = 3               # 上下文最多放入的文檔數量
+RAG_CONTEXT_MIN_PARTIAL_TOKENS = 100   # 截斷文檔至少保留的 token 數，不足則捨棄
+RAG_HISTORY_MESSAGES = 3               # 使用最近幾條對話
+RAG_HISTORY_TOKEN_BUDGET = 1000        # 對話歷史 token 上限
+RAG_HISTORY_MESSAGE_MAX_TOKENS = 400   # 單條對話超過此長度即壓縮（省略 XML 區塊、保留頭尾）
+
 # EDC 配置檔案路徑
 GETEDCFILE_CONFIG_PATH = r"D:\Git_Code\GETEDCFILE_CONFIG"  # EDC 配置檔案根目錄
 
@@ -22,20 +22,69 @@
 import os
 import json
 import glob
-from typing import List, Dict
-import chromadb
-from chromadb.config import Settings
+import hashlib
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Tuple, Iterator, Optional
 import config
 from utils import (
-    extract_text_from_document,  # 支援 DOC 和 DOCX 
-    extract_images_from_document,  # 支援 DOC 和 DOCX 圖片提取
-    chunk_text, 
+    extract_document,  # 一次開啟文檔提取文字、關鍵字與圖片（支援 DOC 和 DOCX）
     clean_text, 
-    save_metadata,
     cleanup_temp_files,  # 清理臨時檔案
     auto_convert_doc_to_docx  # DOC 轉 DOCX
 )
+from chunking import chunk_document, chunk_sections, images_in_span
 from embedding_service import get_embedding_service
+from services.bm25_service import get_bm25_index
+from services.metadata_store import get_metadata_store
+from services.llm_scheduler import PRIORITY_BATCH
+from services.vector_collections import classify_document
+from services.vector_store import open_vector_store
+
+def _extract_file(index: int, file_path: str, relative_path: str, images_dir: str) -> Dict:
+    """
+    提取單一檔案（在子程序中執行，需為模組層級函數以便序列化）
+    
+    Returns:
+        包含索引、路徑、提取結果或錯誤訊息的字典
+    """
+    try:
+        return {
+            "index": index,
+            "file_path": file_path,
+            "relative_path": relative_path,
+            "data": extract_document(file_path, images_dir),
+            "error": None
+        }
+    except Exception as e:
+        return {"index": index, "file_path": file_path, "relative_path": relative_path, "data": None, "error": str(e)}
+
+def _file_fingerprint(file_path: str) -> Dict:
+    """檔案大小與修改時間（快速判斷檔案是否可能變動）"""
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+def _file_sha256(file_path: str) -> str:
+    """計算檔案內容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _chunk_ids(relative_path: str, chunks: List[str]) -> List[str]:
+    """
+    由檔案路徑與文字塊內容產生穩定的 ID：檔案修改後內容未變的文字塊沿用原 ID（不需重新向量化），
+    刪除其他檔案也不會造成 ID 衝突；同一檔案中重複的文字塊以出現次數區分
+    """
+    ids = []
+    seen: Dict[str, int] = {}
+    for chunk in chunks:
+        digest = hashlib.sha1(f"{relative_path}\n{chunk}".encode('utf-8')).hexdigest()[:20]
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        ids.append(f"chunk_{digest}" if occurrence == 0 else f"chunk_{digest}_{occurrence}")
+    return ids
 
 class DocumentProcessor:
     """
@@ -53,42 +102,63 @@ class DocumentProcessor:
         
         # 初始化向量資料庫
         print("初始化向量資料庫...")
-        self.chroma_client = chromadb.PersistentClient(
-            path=config.VECTOR_DB_PATH,
-            settings=Settings(anonymized_telemetry=False)
-        )
+        # 依 VECTOR_STORE_BACKEND 使用 Chroma 或本地向量索引（介面與 Chroma Collection 相同）
+        self.collection = open_vector_store(create=True)
+        print(f"使用向量儲存: {self.collection.describe()}")
         
-        # 創建或獲取collection
-        try:
-            self.collection = self.chroma_client.get_collection("documents")
-            print("使用現有的collection")
-        except:
-            self.collection = self.chroma_client.create_collection(
-                name="documents",
-                metadata={"hnsw:space": "cosine"}
-            )
-            print("創建新的collection")
+        # 初始化 BM25 關鍵詞索引（與向量資料庫同步維護）
+        self.bm25_index = get_bm25_index()
+        
+        # 文字塊元數據（SQLite，依來源檔案建立索引）
+        self.metadata_store = get_metadata_store()
         
-        self.documents_metadata = []
     
-    def get_existing_files(self):
+    def reset_collection(self):
         """
-        獲取已訓練的檔案列表
+        清空向量資料庫與 BM25 索引（完全重新處理時使用）
         """
-        try:
-            # 查詢所有文檔以獲取已處理的檔案
-            all_results = self.collection.get()
-            if all_results and all_results['metadatas']:
-                existing_files = set()
-                for metadata in all_results['metadatas']:
-                    if 'relative_path' in metadata:
-                        existing_files.add(metadata['relative_path'])
-                    elif 'source_file' in metadata:
-                        existing_files.add(metadata['source_file'])
-                return existing_files
-        except Exception as e:
-            print(f"獲取已存在檔案時發生錯誤: {e}")
-        return set()
+        self.collection.reset()
+        self.bm25_index.clear()
+        self.bm25_index.save()
+        self.metadata_store.clear()
+        self._clear_manifest()
+    
+    def sync_bm25_index(self, batch_size: int = 1000):
+        """
+        當 BM25 索引為空但向量資料庫已有資料時（舊版建立的索引），
+        從 collection 分頁讀取文字塊補建 BM25 索引
+        """
+        total = self.collection.count()
+        if total == 0 or len(self.bm25_index) > 0:
+            return
+        
+        print(f"補建 BM25 索引（{total} 個文字塊）...")
+        for offset in range(0, total, batch_size):
+            page = self.collection.get(include=["documents"], limit=batch_size, offset=offset)
+            self.bm25_index.add_documents(page["ids"], page["documents"])
+        self.bm25_index.save()
+        print(f"BM25 索引補建完成，共 {len(self.bm25_index)} 個文字塊")
+    
+    def _scan_collection_files(self, page_size: int = 5000) -> Dict[str, List[str]]:
+        """
+        分頁掃描 collection 的 metadata，返回 檔案相對路徑 -> 文字塊 ID 列表
+        記憶體與耗時只與文字塊數量成正比，不會讀入文字內容與向量
+        讀取失敗時直接拋出例外（不完整的結果會讓未列入的檔案被當成新檔案重複寫入）
+        """
+        start = time.perf_counter()
+        files: Dict[str, List[str]] = {}
+        total = self.collection.count()
+        for offset in range(0, total, page_size):
+            page = self.collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            for chunk_id, metadata in zip(page['ids'], page['metadatas'] or []):
+                if not metadata:
+                    continue
+                key = metadata.get('relative_path') or metadata.get('source_file')
+                if key:
+                    files.setdefault(key, []).append(chunk_id)
+        print(f"掃描 {total} 個文字塊的 metadata，取得 {len(files)} 個已處理檔案 "
+              f"({(time.perf_counter() - start) * 1000:.0f}ms)")
+        return files
     
     def convert_all_docs_to_docx(self, dataset_path: str = config.DATASET_PATH) -> None:
         """
@@ -138,13 +208,55 @@ class DocumentProcessor:
             print(f"✅ 成功轉換並刪除了 {converted_count} 個 DOC 檔案")
         print()
 
-    def process_docx_files(self, dataset_path: str = config.DATASET_PATH, force_reprocess: bool = False):
+    def extract_files(self, files: List[Tuple[str, str]], workers: Optional[int] = None) -> Iterator[Dict]:
+        """
+        提取階段：以多程序平行解析文檔，依完成順序逐一產出結果給後續的分塊/向量化階段
+        同時進行中的檔案數量有上限，後續階段較慢時不會在記憶體中堆積提取結果
+        
+        Args:
+            files: (檔案路徑, 相對路徑) 列表
+            workers: 程序數量（None 使用 config.INGEST_WORKERS，<= 1 時在主程序依序處理）
+            
+        Yields:
+            _extract_file 的結果字典
+        """
+        workers = workers if workers is not None else getattr(config, "INGEST_WORKERS", 1)
+        if not workers or workers <= 0:
+            workers = os.cpu_count() or 1
+        workers = min(workers, len(files))
+        
+        if workers <= 1:
+            for i, (file_path, relative_path) in enumerate(files):
+                yield _extract_file(i, file_path, relative_path, config.IMAGES_PATH)
+            return
+        
+        print(f"使用 {workers} 個程序平行提取文檔")
+        max_in_flight = workers * 2
+        pending_files = iter(enumerate(files))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            in_flight = set()
+            while True:
+                # 補滿進行中的工作
+                for i, (file_path, relative_path) in pending_files:
+                    in_flight.add(executor.submit(_extract_file, i, file_path, relative_path, config.IMAGES_PATH))
+                    if len(in_flight) >= max_in_flight:
+                        break
+                if not in_flight:
+                    return
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+    
+    def process_docx_files(self, dataset_path: str = config.DATASET_PATH, force_reprocess: bool = False, workers: Optional[int] = None):
         """
         處理指定目錄下的所有DOCX檔案（注意：這是文檔索引建立，不是模型訓練）
+        增量模式依檔案清單（大小、修改時間、SHA-256）判斷新增、修改與刪除的檔案，
+        只重新處理有變動的檔案，並刪除已移除檔案的文字塊
         
         Args:
             dataset_path: 數據集路徑
             force_reprocess: 是否強制重新處理所有檔案
+            workers: 提取階段的程序數量（None 使用 config.INGEST_WORKERS）
         """
         # 首先轉換所有 DOC 檔案為 DOCX
         self.convert_all_docs_to_docx(dataset_path)
@@ -156,14 +268,14 @@ class DocumentProcessor:
             print(f"Dataset目錄不存在: {dataset_path}")
             return
         
-        # 獲取已處理的檔案列表
-        existing_files = set() if force_reprocess else self.get_existing_files()
-        print(f"已處理的檔案數量: {len(existing_files)}")
+        # 舊版建立的向量資料庫沒有 BM25 索引時先補建；向量資料庫為空時清除殘留索引
+        if not force_reprocess:
+            self.sync_bm25_index()
+        elif self.collection.count() == 0 and len(self.bm25_index) > 0:
+            self.bm25_index.clear()
         
         # 遞迴搜尋所有DOCX檔案（DOC已經轉換為DOCX）
         docx_files = []
-        new_files = []
-        
         for root, dirs, files in os.walk(dataset_path):
             for file in files:
                 # 只處理 .docx 檔案（DOC 已轉換）
@@ -171,122 +283,176 @@ class DocumentProcessor:
                     file_path = os.path.join(root, file)
                     relative_path = os.path.relpath(file_path, dataset_path)
                     docx_files.append((file_path, relative_path))
-                    
-                    # 檢查是否為新檔案
-                    if relative_path not in existing_files:
-                        new_files.append((file_path, relative_path))
+        
+        # 讀取檔案清單；舊版建立的向量資料庫沒有清單時，從 collection 建立
+        manifest = {} if force_reprocess else self.load_manifest()
+        if not force_reprocess and not manifest and self.collection.count() > 0:
+            manifest = self._build_manifest_from_collection(docx_files)
+        print(f"已處理的檔案數量: {len(manifest)}")
+        
+        # 比對檔案清單：大小與修改時間相同直接略過，否則以 SHA-256 確認內容是否變動
+        new_files = []
+        modified_files = []
+        fingerprints: Dict[str, Dict] = {}
+        manifest_changed = False
+        for file_path, relative_path in docx_files:
+            fingerprint = _file_fingerprint(file_path)
+            entry = manifest.get(relative_path)
+            if entry and entry.get("size") == fingerprint["size"] and entry.get("mtime") == fingerprint["mtime"]:
+                continue
+            fingerprint["sha256"] = _file_sha256(file_path)
+            if entry and entry.get("sha256") == fingerprint["sha256"]:
+                # 內容未變（例如只是複製或 touch），只更新修改時間
+                entry.update(fingerprint)
+                manifest_changed = True
+                continue
+            fingerprints[relative_path] = fingerprint
+            (modified_files if entry else new_files).append((file_path, relative_path))
+        
+        current_files = {relative_path for _, relative_path in docx_files}
+        removed_files = [relative_path for relative_path in manifest if relative_path not in current_files]
         
         print(f"總共找到 {len(docx_files)} 個 DOCX 檔案")
-        print(f"需要處理的新檔案: {len(new_files)} 個")
+        print(f"新增: {len(new_files)} 個，修改: {len(modified_files)} 個，刪除: {len(removed_files)} 個")
         
-        if not new_files:
+        # 刪除已移除檔案的文字塊
+        for relative_path in removed_files:
+            entry = manifest.pop(relative_path)
+            deleted = self._delete_file_chunks(relative_path, entry.get("chunk_ids", []))
+            print(f"  - 已移除 {relative_path}: 刪除 {deleted} 個文字塊")
+            manifest_changed = True
+        if removed_files:
+            self.bm25_index.save()
+        
+        changed_files = new_files + modified_files
+        if not changed_files:
+            if manifest_changed:
+                self._save_manifest(manifest)
             if not docx_files:
                 print("Dataset目錄及子目錄中沒有找到 DOCX 檔案")
             else:
                 print("所有檔案都已經處理過了，無需重新處理")
             return
         
-        print("新檔案列表:")
+        print("需要處理的檔案列表:")
         for file_path, relative_path in new_files:
-            print(f"  - {relative_path}")
+            print(f"  + {relative_path}")
+        for file_path, relative_path in modified_files:
+            print(f"  * {relative_path}")
         print()
         
-        all_texts = []
-        all_metadatas = []
-        all_ids = []
-        
-        # 獲取現有文檔的最大索引，避免ID衝突
-        existing_doc_count = len(existing_files)
+        batch_size = getattr(config, "INGEST_BATCH_SIZE", 256)
+        batch = self._new_batch()
+        # 相對路徑 -> 檔案指紋、新文字塊 ID 與尚未寫入的數量；全部寫入後才記入清單
+        file_states: Dict[str, Dict] = {}
+        # 批次寫入失敗的檔案（不記入清單，下次處理時重試）
+        failed_files = set()
+        total_chunks = 0
         
-        for i, (file_path, relative_path) in enumerate(new_files):
+        for done, result in enumerate(self.extract_files(changed_files, workers), start=1):
+            file_path = result["file_path"]
+            relative_path = result["relative_path"]
             filename = os.path.basename(file_path)
-            print(f"處理新檔案 ({i+1}/{len(new_files)}): {relative_path}")
+            print(f"處理檔案 ({done}/{len(changed_files)}): {relative_path}")
             
             try:
-                # 提取文字 (支援 DOC 和 DOCX)
-                text_data = extract_text_from_document(file_path)
+                if result["error"]:
+                    raise RuntimeError(result["error"])
+                
+                # 提取文字與圖片 (支援 DOC 和 DOCX，每個檔案只開啟一次)
+                text_data = result["data"]
                 
-                if not text_data['full_text']:
+                # 先分割再清理（分塊需要保留換行等段落資訊）
+                sections = text_data.get('sections') or []
+                image_paths = text_data['images']
+                # 能定位到章節的圖片只對應到所屬的文字塊；無法定位時沿用整份文檔的圖片
+                positioned = any(section.get('images') for section in sections)
+                if config.CHUNKING_METHOD == "structure" and sections:
+                    # 結構分塊：文字塊不跨越章節，保留章節路徑、清單與 Markdown 表格
+                    prepared = [
+                        (clean_text(chunk["text"], keep_structure=True), chunk["section"],
+                         chunk["images"] if positioned else image_paths)
+                        for chunk in chunk_sections(sections, config.CHUNK_SIZE, config.CHUNK_OVERLAP)
+                    ]
+                else:
+                    prepared = [
+                        (clean_text(chunk["text"]), "",
+                         images_in_span(sections, chunk["start"], chunk["end"]) if positioned else image_paths)
+                        for chunk in chunk_document(text_data['full_text'], config.CHUNKING_METHOD, config.CHUNK_SIZE, config.CHUNK_OVERLAP)
+                    ]
+                prepared = [item for item in prepared if item[0]]
+                text_chunks = [chunk for chunk, _, _ in prepared]
+                chunk_ids = _chunk_ids(relative_path, text_chunks)
+                file_states[relative_path] = dict(fingerprints[relative_path], chunk_ids=chunk_ids, pending=len(chunk_ids))
+                
+                if not text_chunks:
+                    # 沒有文字內容仍記入清單（並移除舊的文字塊），避免每次都重新處理
                     print(f"警告: {relative_path} 沒有提取到文字內容")
+                    self._finalize_file(relative_path, file_states.pop(relative_path), manifest)
+                    self.bm25_index.save()
+                    self._save_manifest(manifest)
                     continue
                 
-                # 提取圖片 (支援 DOCX 和 DOC 檔案)
-                image_paths = extract_images_from_document(file_path, config.IMAGES_PATH)
                 print(f"從 {relative_path} 提取了 {len(image_paths)} 張圖片")
+                domain = classify_document(relative_path, text_data['title'], text_data['keywords'])
                 
-                # 清理並分割文字
-                cleaned_text = clean_text(text_data['full_text'])
-                text_chunks = chunk_text(cleaned_text, config.CHUNK_SIZE, config.CHUNK_OVERLAP)
-                
-                # 為每個文字塊創建記錄，使用新的索引避免衝突
-                doc_index = existing_doc_count + i
-                for j, chunk in enumerate(text_chunks):
-                    chunk_id = f"doc_{doc_index}_{j}"
-                    
+                # 為每個文字塊創建記錄（ID 由路徑與內容決定，內容未變的文字塊沿用原 ID）
+                for j, (chunk_id, (chunk, section, chunk_images)) in enumerate(zip(chunk_ids, prepared)):
                     # ChromaDB metadata只能存儲基本類型，將list轉換為字符串
                     metadata = {
                         "source_file": filename,
                         "relative_path": relative_path,  # 添加相對路徑資訊
                         "title": text_data['title'],
                         "keywords": "|".join(text_data['keywords']) if text_data['keywords'] else "",
+                        "section": section,  # 章節路徑（結構分塊時）
+                        "domain": domain,  # 文檔領域（分片寫入使用）
                         "chunk_index": j,
                         "total_chunks": len(text_chunks),
-                        "images": "|".join(image_paths) if image_paths else "",
+                        "images": "|".join(chunk_images) if chunk_images else "",
                         "file_path": file_path
                     }
                     
-                    all_texts.append(chunk)
-                    all_metadatas.append(metadata)
-                    all_ids.append(chunk_id)
+                    batch["texts"].append(chunk)
+                    batch["metadatas"].append(metadata)
+                    batch["ids"].append(chunk_id)
                     
-                    # 保存文檔元數據
-                    self.documents_metadata.append({
+                    # 文檔元數據
+                    batch["records"].append({
                         "id": chunk_id,
                         "title": text_data['title'],
                         "keywords": text_data['keywords'],
                         "content": chunk,
+                        "section": section,
                         "source_file": filename,
                         "relative_path": relative_path,
-                        "images": image_paths,
+                        "images": chunk_images,
                         "file_path": file_path
                     })
                     
+                    # 批次滿了就向量化並寫入，記憶體用量與資料集大小無關
+                    if len(batch["ids"]) >= batch_size:
+                        total_chunks += self._flush_batch_safely(batch, file_states, manifest, failed_files)
+                        batch = self._new_batch()
+                        if relative_path in failed_files:
+                            break
+                    
             except Exception as e:
                 print(f"處理檔案 {relative_path} 時發生錯誤: {str(e)}")
+                self._discard_file(relative_path, batch, file_states)
                 continue
         
-        if all_texts:
-            print(f"開始向量化 {len(all_texts)} 個新文字塊...")
-            
-            # 生成embeddings（使用預訓練模型）
-            embeddings = self.embedding_service.encode(all_texts)
-            
-            # 存儲到向量資料庫
-            self.collection.add(
-                documents=all_texts,
-                metadatas=all_metadatas,
-                ids=all_ids,
-                embeddings=embeddings  # 已經是list格式，不需要tolist()
-            )
-            
-            print(f"成功處理並存儲了 {len(all_texts)} 個新文字塊")
-            
-            # 更新文檔元數據（追加模式）
-            metadata_file = os.path.join(config.MODEL_PATH, "documents_metadata.json")
-            
-            # 讀取現有元數據
-            existing_metadata = []
-            if os.path.exists(metadata_file):
-                try:
-                    with open(metadata_file, 'r', encoding='utf-8') as f:
-                        existing_metadata = json.load(f)
-                except:
-                    existing_metadata = []
-            
-            # 合併新舊元數據
-            all_metadata = existing_metadata + self.documents_metadata
-            save_metadata(all_metadata, metadata_file)
-            print(f"元數據已更新至: {metadata_file}")
+        total_chunks += self._flush_batch_safely(batch, file_states, manifest, failed_files)
+        
+        if manifest_changed:
+            self._save_manifest(manifest)
+        
+        if failed_files:
+            print(f"⚠️ {len(failed_files)} 個檔案寫入失敗，未記入檔案清單，下次處理時會重試:")
+            for relative_path in sorted(failed_files):
+                print(f"  ! {relative_path}")
+        
+        if total_chunks:
+            print(f"成功處理並存儲了 {total_chunks} 個文字塊（BM25 索引: {len(self.bm25_index)} 個）")
             
             # 清理臨時轉換檔案
             print("\n🗑️  清理臨時檔案...")
@@ -295,6 +461,190 @@ class DocumentProcessor:
         else:
             print("沒有找到有效的新文字內容進行處理")
     
+    def _new_batch(self) -> Dict[str, List]:
+        """建立空的寫入批次"""
+        return {"ids": [], "texts": [], "metadatas": [], "records": []}
+    
+    def _discard_file(self, relative_path: str, batch: Dict[str, List], file_states: Dict[str, Dict]):
+        """從批次中移除處理失敗檔案的文字塊（不寫入、不記入清單，下次處理時重試）"""
+        keep = [k for k, metadata in enumerate(batch["metadatas"]) if metadata["relative_path"] != relative_path]
+        for field in batch:
+            batch[field] = [batch[field][k] for k in keep]
+        file_states.pop(relative_path, None)
+    
+    def _flush_batch_safely(self, batch: Dict[str, List], file_states: Dict[str, Dict], manifest: Dict[str, Dict], failed_files: set) -> int:
+        """
+        寫入批次；寫入失敗時（例如 embedding API 錯誤）批次中尚未完成的檔案標記為失敗，
+        不記入清單並保存目前的清單，其他檔案繼續處理
+        
+        Returns:
+            寫入的文字塊數量（失敗時為 0）
+        """
+        if not batch["ids"]:
+            return 0
+        try:
+            return self._flush_batch(batch, file_states, manifest)
+        except Exception as e:
+            print(f"❌ 寫入批次失敗（{len(batch['ids'])} 個文字塊）: {e}")
+            for relative_path in {metadata["relative_path"] for metadata in batch["metadatas"]}:
+                if relative_path in file_states:
+                    file_states.pop(relative_path)
+                    failed_files.add(relative_path)
+            self._save_manifest(manifest)
+            return 0
+    
+    def _flush_batch(self, batch: Dict[str, List], file_states: Dict[str, Dict], manifest: Dict[str, Dict]) -> int:
+        """
+        寫入一個批次（向量資料庫、BM25 索引、文檔元數據），並將全部寫入完成的檔案記入清單
+        已存在於向量資料庫的文字塊（內容未變）只更新 metadata，不重新向量化
+        
+        Args:
+            batch: 寫入批次
+            file_states: 各檔案的指紋與尚未寫入的文字塊數量（會就地更新）
+            manifest: 檔案清單（會就地更新並寫回磁碟）
+            
+        Returns:
+            寫入的文字塊數量
+        """
+        existing_ids = set(self.collection.get(ids=batch["ids"], include=[])["ids"])
+        new_indices = [k for k, chunk_id in enumerate(batch["ids"]) if chunk_id not in existing_ids]
+        print(f"寫入 {len(batch['ids'])} 個文字塊（需向量化: {len(new_indices)} 個）...")
+        
+        if existing_ids:
+            kept = [k for k, chunk_id in enumerate(batch["ids"]) if chunk_id in existing_ids]
+            self.collection.update(
+                ids=[batch["ids"][k] for k in kept],
+                metadatas=[batch["metadatas"][k] for k in kept]
+            )
+        
+        if new_indices:
+            texts = [batch["texts"][k] for k in new_indices]
+            # 生成embeddings（使用預訓練模型）
+            embeddings = self.embedding_service.encode(texts, priority=PRIORITY_BATCH)
+            
+            # 存儲到向量資料庫
+            self.collection.upsert(
+                documents=texts,
+                metadatas=[batch["metadatas"][k] for k in new_indices],
+                ids=[batch["ids"][k] for k in new_indices],
+                embeddings=embeddings  # 已經是list格式，不需要tolist()
+            )
+        
+        # 同步更新 BM25 關鍵詞索引（相同 ID 會覆寫）
+        self.bm25_index.add_documents(batch["ids"], batch["texts"])
+        
+        # 更新文檔元數據（相同 ID 以新記錄取代）
+        self.metadata_store.upsert_records(batch["records"])
+        
+        # 檔案的文字塊全部寫入後，刪除舊版本的文字塊並記入清單
+        for metadata in batch["metadatas"]:
+            relative_path = metadata["relative_path"]
+            state = file_states[relative_path]
+            state["pending"] -= 1
+            if state["pending"] == 0:
+                self._finalize_file(relative_path, file_states.pop(relative_path), manifest)
+        
+        self.bm25_index.save()
+        self._save_manifest(manifest)
+        
+        return len(batch["ids"])
+    
+    def _finalize_file(self, relative_path: str, state: Dict, manifest: Dict[str, Dict]):
+        """刪除檔案舊版本中不再存在的文字塊，並將新版本記入清單"""
+        old_entry = manifest.get(relative_path, {})
+        deleted = self._delete_file_chunks(relative_path, old_entry.get("chunk_ids", []), keep=state["chunk_ids"])
+        if deleted:
+            print(f"  - {relative_path}: 刪除 {deleted} 個舊文字塊")
+        manifest[relative_path] = {
+            "size": state["size"],
+            "mtime": state["mtime"],
+            "sha256": state["sha256"],
+            "chunk_ids": state["chunk_ids"]
+        }
+    
+    def _delete_file_chunks(self, relative_path: str, chunk_ids: List[str], keep: List[str] = ()) -> int:
+        """
+        刪除檔案的文字塊（清單記錄的 ID 加上向量資料庫中屬於該檔案的 ID，
+        後者涵蓋上次中斷時只寫入部分的文字塊）
+        
+        Returns:
+            刪除的文字塊數量
+        """
+        stale_ids = set(chunk_ids)
+        stale_ids.update(self.collection.get(where={"relative_path": relative_path}, include=[])["ids"])
+        stale_ids.difference_update(keep)
+        if not stale_ids:
+            return 0
+        stale_ids = list(stale_ids)
+        self.collection.delete(ids=stale_ids)
+        self.bm25_index.remove_documents(stale_ids)
+        self.metadata_store.delete_records(stale_ids)
+        return len(stale_ids)
+    
+    @property
+    def manifest_file(self) -> str:
+        return os.path.join(config.VECTOR_DB_PATH, "ingest_manifest.json")
+    
+    def load_manifest(self) -> Dict[str, Dict]:
+        """
+        讀取檔案清單：相對路徑 -> {size, mtime, sha256, chunk_ids}
+        """
+        if not os.path.exists(self.manifest_file):
+            return {}
+        try:
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                return json.load(f).get("files", {})
+        except Exception as e:
+            print(f"⚠️ 無法讀取檔案清單，將重新建立: {e}")
+            return {}
+    
+    def _save_manifest(self, manifest: Dict[str, Dict]):
+        """寫入檔案清單（先寫暫存檔再替換，避免中斷時損毀）"""
+        tmp_path = self.manifest_file + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": 1, "files": manifest}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_file)
+    
+    def _clear_manifest(self):
+        if os.path.exists(self.manifest_file):
+            os.remove(self.manifest_file)
+    
+    def _build_manifest_from_collection(self, docx_files: List[Tuple[str, str]]) -> Dict[str, Dict]:
+        """
+        舊版向量資料庫沒有檔案清單時，以目前的檔案內容建立清單（視為已處理），
+        向量資料庫中已不存在於 Dataset 的檔案也會列入，以便本次刪除
+        """
+        print("建立檔案清單（首次使用增量更新）...")
+        try:
+            existing_files = self._scan_collection_files()
+        except Exception as e:
+            raise RuntimeError(f"無法讀取向量資料庫的 metadata，未建立檔案清單（請稍後重試或使用 --force-retrain）: {e}") from e
+        
+        # 上次處理中斷、只寫入部分文字塊的檔案不列入，讓本次重新處理
+        interrupted = set()
+        legacy_checkpoint = os.path.join(config.VECTOR_DB_PATH, "ingest_checkpoint.json")
+        if os.path.exists(legacy_checkpoint):
+            try:
+                with open(legacy_checkpoint, 'r', encoding='utf-8') as f:
+                    interrupted = set(json.load(f).get("in_progress", []))
+            except Exception:
+                pass
+            os.remove(legacy_checkpoint)
+        
+        file_paths = dict((relative_path, file_path) for file_path, relative_path in docx_files)
+        manifest = {}
+        for relative_path, chunk_ids in existing_files.items():
+            if relative_path in interrupted:
+                continue
+            entry = {"chunk_ids": chunk_ids}
+            if relative_path in file_paths:
+                entry.update(_file_fingerprint(file_paths[relative_path]))
+                entry["sha256"] = _file_sha256(file_paths[relative_path])
+            manifest[relative_path] = entry
+        
+        self._save_manifest(manifest)
+        return manifest
+    
     def search_similar_documents(self, query: str, n_results: int = 5):
         """
         搜尋相似文檔
@@ -322,20 +672,26 @@ def main():
     注意：這不是模型訓練，而是 RAG 系統的資料準備過程
     """
     import sys
+    import argparse
     
     # 檢查命令行參數
-    force_reprocess_mode = False
-    incremental_mode = False
+    parser = argparse.ArgumentParser(description="文檔處理和向量化索引建立")
+    parser.add_argument('--force-retrain', action='store_true', help="清空所有資料重新處理")  # 保持參數名稱向後兼容
+    parser.add_argument('--incremental', action='store_true', help="增量處理（只處理新增、修改與刪除的檔案）")
+    parser.add_argument('--workers', type=int, default=None,
+                        help=f"文檔提取的程序數量（預設 {getattr(config, 'INGEST_WORKERS', 1)}，0 表示使用所有 CPU 核心）")
+    args, unknown_args = parser.parse_known_args()
     
-    if len(sys.argv) > 1:
-        if sys.argv[1] == '--force-retrain':  # 保持參數名稱向後兼容
-            force_reprocess_mode = True
-            print("=== 文檔重新處理開始 ===")
-        elif sys.argv[1] == '--incremental':
-            incremental_mode = True
-            print("=== 文檔增量處理開始 ===")
-        else:
-            print("=== 文檔處理開始 ===")
+    force_reprocess_mode = args.force_retrain
+    incremental_mode = args.incremental and not force_reprocess_mode
+    workers = args.workers
+    
+    if force_reprocess_mode:
+        print("=== 文檔重新處理開始 ===")
+    elif incremental_mode:
+        print("=== 文檔增量處理開始 ===")
+    elif len(sys.argv) > 1:
+        print("=== 文檔處理開始 ===")
     else:
         print("=== 文檔處理和向量化索引建立 ===")
     
@@ -349,23 +705,19 @@ def main():
         if existing_count > 0:
             print(f"清空現有的 {existing_count} 個文檔")
             # 清空現有資料
-            processor.chroma_client.delete_collection("documents")
-            processor.collection = processor.chroma_client.create_collection(
-                name="documents",
-                metadata={"hnsw:space": "cosine"}
-            )
+            processor.reset_collection()
             print("已清空現有資料")
         print("開始完全重新處理...")
-        processor.process_docx_files(force_reprocess=True)
+        processor.process_docx_files(force_reprocess=True, workers=workers)
     elif incremental_mode:
         # 增量處理模式（由批處理檔案調用）
         print(f"向量資料庫中已有 {existing_count} 個文檔")
         print("開始增量處理...")
-        processor.process_docx_files(force_reprocess=False)
+        processor.process_docx_files(force_reprocess=False, workers=workers)
     elif existing_count > 0:
         print(f"\n向量資料庫中已有 {existing_count} 個文檔")
         print("選擇處理模式:")
-        print("1. 增量處理 (只處理新檔案，推薦)")
+        print("1. 增量處理 (只處理新增、修改與刪除的檔案，推薦)")
         print("2. 完全重新處理 (清空所有資料重新開始)")
         print("3. 取消處理")
         
@@ -373,18 +725,14 @@ def main():
             choice = input("請選擇 (1/2/3): ").strip()
             if choice == "1":
                 print("=== 開始增量處理 ===")
-                processor.process_docx_files(force_reprocess=False)
+                processor.process_docx_files(force_reprocess=False, workers=workers)
                 break
             elif choice == "2":
                 print("=== 開始完全重新處理 ===")
                 # 清空現有資料
-                processor.chroma_client.delete_collection("documents")
-                processor.collection = processor.chroma_client.create_collection(
-                    name="documents",
-                    metadata={"hnsw:space": "cosine"}
-                )
+                processor.reset_collection()
                 print("已清空現有資料")
-                processor.process_docx_files(force_reprocess=True)
+                processor.process_docx_files(force_reprocess=True, workers=workers)
                 break
             elif choice == "3":
                 print("取消處理")
@@ -393,7 +741,7 @@ def main():
                 print("無效選擇，請重新輸入")
     else:
         print("向量資料庫為空，開始初始處理...")
-        processor.process_docx_files(force_reprocess=True)
+        processor.process_docx_files(force_reprocess=True, workers=workers)
     
     # 顯示最終統計
     final_count = processor.get_collection_info()
@@ -69,13 +69,14 @@ class EmbeddingService:
             # OpenAI 後端不需預先載入模型
             print(f"使用 OpenAI Embedding 後端: {self.model_name}")
     
-    def encode(self, texts: Union[str, List[str]], normalize: bool = True) -> List[List[float]]:
+    def encode(self, texts: Union[str, List[str]], normalize: bool = True, priority: Optional[int] = None) -> List[List[float]]:
         """
         將文字編碼為向量
         
         Args:
             texts: 文字或文字列表
             normalize: 是否標準化向量
+            priority: openai 後端的排程優先權（預設為互動查詢；文檔索引建立使用 PRIORITY_BATCH）
             
         Returns:
             向量列表
@@ -85,7 +86,7 @@ class EmbeddingService:
             texts = [texts]
 
         if self.backend == "openai":
-            vectors = self._encode_openai(texts)
+            vectors = self._encode_openai(texts, priority)
         else:
             if not self.model:
                 raise Exception("ST 模型未載入")
@@ -112,8 +113,12 @@ class EmbeddingService:
 
         return vectors
 
-    def _encode_openai(self, texts: List[str]) -> List[List[float]]:
-        """呼叫 OpenAI 兼容的 Embeddings 端點，支援批次。"""
+    def _encode_openai(self, texts: List[str], priority: Optional[int] = None) -> List[List[float]]:
+        """呼叫 OpenAI 兼容的 Embeddings 端點，支援批次（每批經過 LLM 排程器取得執行名額）。"""
+        from services.llm_scheduler import get_llm_scheduler, PRIORITY_INTERACTIVE
+        scheduler = get_llm_scheduler()
+        priority = PRIORITY_INTERACTIVE if priority is None else priority
+
         if not self.api_key:
             raise RuntimeError("缺少 API_KEY，無法使用 OpenAI Embedding 後端")
 
@@ -143,23 +148,25 @@ class EmbeddingService:
 
             success = False
             last_err = None
-            for ep in endpoints:
-                try:
-                    resp = requests.post(ep, headers=headers, json=payload, timeout=60)
-                    if resp.status_code == 200:
-                        data = resp.json()
-                        # OpenAI 回傳格式：{"data": [{"embedding": [...]} ...]}
-                        batch_vectors = [item["embedding"] for item in data.get("data", [])]
-                        if len(batch_vectors) != len(chunk):
-                            raise RuntimeError("回傳向量數量與請求不一致")
-                        results.extend(batch_vectors)
-                        success = True
-                        break
-                    else:
-                        last_err = f"HTTP {resp.status_code}: {resp.text[:200]}"
-                except requests.RequestException as e:
-                    last_err = str(e)
-                    continue
+            # 每批取得排程名額（embedding 不能替換模型，不做降級）
+            with scheduler.slot(self.model_name, priority, degrade=False):
+                for ep in endpoints:
+                    try:
+                        resp = requests.post(ep, headers=headers, json=payload, timeout=60)
+                        if resp.status_code == 200:
+                            data = resp.json()
+                            # OpenAI 回傳格式：{"data": [{"embedding": [...]} ...]}
+                            batch_vectors = [item["embedding"] for item in data.get("data", [])]
+                            if len(batch_vectors) != len(chunk):
+                                raise RuntimeError("回傳向量數量與請求不一致")
+                            results.extend(batch_vectors)
+                            success = True
+                            break
+                        else:
+                            last_err = f"HTTP {resp.status_code}: {resp.text[:200]}"
+                    except requests.RequestException as e:
+                        last_err = str(e)
+                        continue
 
             if not success:
                 # 直接拋出錯誤，不進行備援處理
@@ -206,6 +213,57 @@ class EmbeddingService:
         similarity = dot_product / (norm1 * norm2)
         return float(similarity)
 
+def mmr_select(query_embedding: List[float], embeddings: List[List[float]], k: int = 3, lambda_mult: float = 0.5,
+               relevance: Optional[List[float]] = None) -> List[int]:
+    """
+    最大邊際相關性（MMR）選取，兼顧與查詢的相關性及彼此間的差異性
+
+    Args:
+        query_embedding: 查詢向量
+        embeddings: 候選文字塊向量（依相關性排序）
+        k: 選取數量
+        lambda_mult: 相關性權重（1.0 = 只看相關性，0.0 = 只看差異性）
+        relevance: 各候選的相關性分數（0~1，例如正規化後的重排序分數）；未提供時使用與查詢的餘弦相似度
+
+    Returns:
+        選取的候選索引列表（依選取順序）
+    """
+    if not embeddings:
+        return []
+
+    doc_matrix = np.asarray(embeddings, dtype=np.float32)
+    query_vec = np.asarray(query_embedding, dtype=np.float32)
+
+    # 正規化後以內積計算餘弦相似度
+    doc_norms = np.linalg.norm(doc_matrix, axis=1, keepdims=True)
+    doc_matrix = doc_matrix / np.where(doc_norms == 0, 1.0, doc_norms)
+    query_norm = np.linalg.norm(query_vec)
+    if query_norm > 0:
+        query_vec = query_vec / query_norm
+
+    if relevance is None:
+        relevance = doc_matrix @ query_vec
+    else:
+        relevance = np.asarray(relevance, dtype=np.float32)
+    pairwise = doc_matrix @ doc_matrix.T
+
+    k = min(k, len(embeddings))
+    selected = [int(np.argmax(relevance))]
+    # 每個候選與已選集合的最大相似度，逐步更新避免重複計算
+    max_sim_to_selected = pairwise[selected[0]].copy()
+    candidate_mask = np.ones(len(embeddings), dtype=bool)
+    candidate_mask[selected[0]] = False
+
+    while len(selected) < k:
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_sim_to_selected
+        scores[~candidate_mask] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        candidate_mask[best] = False
+        np.maximum(max_sim_to_selected, pairwise[best], out=max_sim_to_selected)
+
+    return selected
+
 # 全域變數存儲 embedding 服務實例
 _embedding_service: Optional[EmbeddingService] = None
 
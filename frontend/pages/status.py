@@ -100,6 +100,56 @@ if "conversation_manager" in st.session_state:
                     st.write(f"{status_color} **{service_name}**")
                     st.write(f"狀態: {service_status}")
         
+        # LLM 請求排程
+        scheduler_status = status.get("llm_scheduler")
+        if isinstance(scheduler_status, dict):
+            st.subheader("🚦 LLM 請求排程")
+            sched_cols = st.columns(4)
+            with sched_cols[0]:
+                st.metric("進行中", f"{scheduler_status.get('in_flight', 0)}/{scheduler_status.get('max_in_flight', 0)}")
+            with sched_cols[1]:
+                st.metric("排隊中", scheduler_status.get("queued", 0))
+            with sched_cols[2]:
+                st.metric("已完成", scheduler_status.get("completed", 0))
+            with sched_cols[3]:
+                st.metric("降級次數", scheduler_status.get("degraded", 0))
+            
+            for label, wait in scheduler_status.get("queue_wait", {}).items():
+                name = "互動對話" if label == "interactive" else "批次作業" if label == "batch" else label
+                st.write(f"⏱️ **{name}** 排隊時間：平均 {wait['avg_ms']} ms，P95 {wait['p95_ms']} ms（{wait['count']} 筆）")
+            if scheduler_status.get("daily_requests"):
+                st.write("📊 今日請求數：" + "、".join(f"{model} {count}" for model, count in scheduler_status["daily_requests"].items()))
+            if scheduler_status.get("quota_exhausted"):
+                st.warning("🚫 已達每日額度：" + "、".join(scheduler_status["quota_exhausted"]))
+        
+        # LLM 回應快取
+        cache_status = status.get("llm_cache")
+        if isinstance(cache_status, dict):
+            st.subheader("♻️ LLM 回應快取")
+            cache_cols = st.columns(4)
+            with cache_cols[0]:
+                st.metric("命中率", f"{cache_status.get('hit_rate', 0) * 100:.1f}%")
+            with cache_cols[1]:
+                st.metric("命中 / 未命中", f"{cache_status.get('hits', 0)} / {cache_status.get('misses', 0)}")
+            with cache_cols[2]:
+                st.metric("略過（高 temperature）", cache_status.get("bypassed", 0))
+            with cache_cols[3]:
+                st.metric("快取筆數", cache_status.get("entries", 0))
+            
+            for source, stats in cache_status.get("sources", {}).items():
+                st.write(f"• **{source}**：命中率 {stats['hit_rate'] * 100:.1f}%（{stats['hits']}/{stats['hits'] + stats['misses']}）")
+        
+        # 工具執行
+        tool_metrics = status.get("tools")
+        if isinstance(tool_metrics, dict) and tool_metrics:
+            st.subheader("🛠️ 工具執行")
+            for tool_name, metrics in tool_metrics.items():
+                cached = f"，♻️ 快取命中 {metrics['cached']} 次" if metrics.get("cached") else ""
+                warning = f"，⏰ 逾時 {metrics['timeout']} 次" if metrics["timeout"] else ""
+                errors = f"，❌ 錯誤 {metrics['error']} 次" if metrics["error"] else ""
+                st.write(f"• **{tool_name}**：{metrics['count']} 次，P50 {metrics['p50_ms']} ms，P95 {metrics['p95_ms']} ms，"
+                         f"最長 {metrics['max_ms']} ms（期限 {metrics['timeout_s']} 秒）{cached}{warning}{errors}")
+        
         # 詳細狀態 JSON
         with st.expander("📄 詳細狀態資訊"):
             st.json(status)
@@ -0,0 +1,192 @@
+"""
+BM25 服務 - 關鍵詞倒排索引與混合檢索融合
+補足向量檢索對 CHART 名稱、表名（如 HAMSPARA）、錯誤代碼等精確字串的不足
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import math
+import pickle
+import threading
+from typing import List, Dict, Tuple, Optional
+import config
+from utils import tokenize_for_search
+
+class BM25Index:
+    """持久化的 BM25 倒排索引（以文字塊 ID 為單位，支援增量新增與刪除）"""
+
+    def __init__(self, index_path: Optional[str] = None, k1: Optional[float] = None, b: Optional[float] = None):
+        self.index_path = index_path or os.path.join(config.VECTOR_DB_PATH, "bm25_index.pkl")
+        self.k1 = k1 if k1 is not None else getattr(config, "BM25_K1", 1.5)
+        self.b = b if b is not None else getattr(config, "BM25_B", 0.75)
+
+        # 倒排索引：詞 -> {文字塊ID: 詞頻}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        # 文字塊ID -> 文字塊長度（詞數）
+        self.doc_lengths: Dict[str, int] = {}
+        # 文字塊ID -> 不重複詞列表（刪除時使用）
+        self.doc_terms: Dict[str, List[str]] = {}
+        self.total_length = 0
+
+        self._lock = threading.RLock()
+        self._loaded_mtime = None
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def load(self) -> bool:
+        """從磁碟載入索引，檔案不存在時保持空索引"""
+        with self._lock:
+            if not os.path.exists(self.index_path):
+                return False
+            try:
+                with open(self.index_path, 'rb') as f:
+                    data = pickle.load(f)
+                self.postings = data.get("postings", {})
+                self.doc_lengths = data.get("doc_lengths", {})
+                self.doc_terms = data.get("doc_terms", {})
+                self.total_length = data.get("total_length", sum(self.doc_lengths.values()))
+                self._loaded_mtime = os.path.getmtime(self.index_path)
+                return True
+            except Exception as e:
+                print(f"⚠️ 載入 BM25 索引失敗，使用空索引: {e}")
+                return False
+
+    def reload_if_changed(self) -> bool:
+        """索引檔被其他程序（document_processor.py）更新時重新載入"""
+        try:
+            mtime = os.path.getmtime(self.index_path)
+        except OSError:
+            return False
+        if mtime != self._loaded_mtime:
+            return self.load()
+        return False
+
+    def save(self):
+        """以原子方式寫回磁碟（先寫暫存檔再替換）"""
+        with self._lock:
+            os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump({
+                    "postings": self.postings,
+                    "doc_lengths": self.doc_lengths,
+                    "doc_terms": self.doc_terms,
+                    "total_length": self.total_length,
+                }, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.index_path)
+            self._loaded_mtime = os.path.getmtime(self.index_path)
+
+    def add_documents(self, ids: List[str], texts: List[str]):
+        """
+        新增（或覆蓋）文字塊
+
+        Args:
+            ids: 文字塊 ID 列表（與向量資料庫一致）
+            texts: 文字塊內容列表
+        """
+        with self._lock:
+            for chunk_id, text in zip(ids, texts):
+                if chunk_id in self.doc_lengths:
+                    self._remove(chunk_id)
+
+                tokens = tokenize_for_search(text)
+                term_freqs: Dict[str, int] = {}
+                for token in tokens:
+                    term_freqs[token] = term_freqs.get(token, 0) + 1
+
+                for term, tf in term_freqs.items():
+                    self.postings.setdefault(term, {})[chunk_id] = tf
+
+                self.doc_lengths[chunk_id] = len(tokens)
+                self.doc_terms[chunk_id] = list(term_freqs.keys())
+                self.total_length += len(tokens)
+
+    def remove_documents(self, ids: List[str]):
+        """刪除文字塊"""
+        with self._lock:
+            for chunk_id in ids:
+                self._remove(chunk_id)
+
+    def _remove(self, chunk_id: str):
+        if chunk_id not in self.doc_lengths:
+            return
+        for term in self.doc_terms.pop(chunk_id, []):
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(chunk_id, None)
+                if not posting:
+                    del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(chunk_id)
+
+    def clear(self):
+        """清空索引（完全重新處理時使用）"""
+        with self._lock:
+            self.postings = {}
+            self.doc_lengths = {}
+            self.doc_terms = {}
+            self.total_length = 0
+
+    def search(self, query: str, top_k: int = 20) -> List[Tuple[str, float]]:
+        """
+        BM25 關鍵詞搜尋
+
+        Args:
+            query: 查詢字串
+            top_k: 返回數量
+
+        Returns:
+            (文字塊ID, BM25 分數) 列表，分數由高到低
+        """
+        with self._lock:
+            n_docs = len(self.doc_lengths)
+            if n_docs == 0:
+                return []
+
+            avg_length = self.total_length / n_docs if n_docs else 0.0
+            k1, b = self.k1, self.b
+            scores: Dict[str, float] = {}
+
+            for term in set(tokenize_for_search(query)):
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                df = len(posting)
+                idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+                for chunk_id, tf in posting.items():
+                    length_norm = 1.0 - b + b * (self.doc_lengths[chunk_id] / avg_length if avg_length else 0.0)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (k1 + 1) / (tf + k1 * length_norm)
+
+            return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+
+def reciprocal_rank_fusion(ranked_lists: List[List[str]], k: int = 60, weights: Optional[List[float]] = None) -> List[Tuple[str, float]]:
+    """
+    倒數排名融合（Reciprocal Rank Fusion）
+
+    Args:
+        ranked_lists: 多個已排序的 ID 列表（如向量檢索結果、BM25 結果）
+        k: RRF 平滑常數
+        weights: 各列表的權重（預設皆為 1）
+
+    Returns:
+        (ID, 融合分數) 列表，分數由高到低
+    """
+    weights = weights or [1.0] * len(ranked_lists)
+    fused: Dict[str, float] = {}
+    for ranked, weight in zip(ranked_lists, weights):
+        for rank, item_id in enumerate(ranked):
+            fused[item_id] = fused.get(item_id, 0.0) + weight / (k + rank + 1)
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
+
+# 全域變數存儲 BM25 索引實例
+_bm25_index: Optional[BM25Index] = None
+
+def get_bm25_index() -> BM25Index:
+    """獲取 BM25 索引實例（單例）"""
+    global _bm25_index
+    if _bm25_index is None:
+        _bm25_index = BM25Index()
+    return _bm25_index
@@ -3,15 +3,18 @@
 """
 
 import os
-import json
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 from typing import List, Dict, Any
-import config
+from services.metadata_store import get_metadata_store
 
 class DocumentService:
     """文檔服務 - 管理文檔資料"""
     
     def __init__(self):
-        self.metadata_file = os.path.join(config.MODEL_PATH, "documents_metadata.json")
+        # 文字塊元數據儲存（SQLite，首次使用時自動匯入舊版 documents_metadata.json）
+        self.metadata_store = get_metadata_store()
         print("📄 文檔服務初始化完成")
     
     def get_document_summary(self, documents: List[Dict]) -> Dict[str, Any]:
@@ -63,13 +66,7 @@ class DocumentService:
     def get_all_documents_metadata(self) -> List[Dict]:
         """獲取所有文檔的元數據"""
         try:
-            if not os.path.exists(self.metadata_file):
-                return []
-            
-            with open(self.metadata_file, 'r', encoding='utf-8') as f:
-                metadata = json.load(f)
-            
-            return metadata
+            return self.metadata_store.get_all()
             
         except Exception as e:
             print(f"讀取文檔元數據錯誤: {e}")
@@ -86,14 +83,7 @@ class DocumentService:
             匹配的文檔列表
         """
         try:
-            all_metadata = self.get_all_documents_metadata()
-            matching_docs = []
-            
-            for doc in all_metadata:
-                if source_file.lower() in doc.get("source_file", "").lower():
-                    matching_docs.append(doc)
-            
-            return matching_docs
+            return self.metadata_store.search_by_source(source_file)
             
         except Exception as e:
             print(f"搜尋文檔錯誤: {e}")
@@ -102,41 +92,12 @@ class DocumentService:
     def get_document_statistics(self) -> Dict[str, Any]:
         """獲取文檔統計資訊"""
         try:
-            all_metadata = self.get_all_documents_metadata()
+            statistics = self.metadata_store.get_statistics(top_n=10)
             
-            if not all_metadata:
+            if not statistics["total_chunks"]:
                 return {"total_documents": 0}
             
-            # 統計資訊
-            sources = set()
-            total_images = 0
-            keywords_count = {}
-            
-            for doc in all_metadata:
-                # 統計來源
-                source = doc.get("source_file", "Unknown")
-                sources.add(source)
-                
-                # 統計圖片
-                images = doc.get("images", [])
-                if images:
-                    total_images += len(images)
-                
-                # 統計關鍵字
-                keywords = doc.get("keywords", [])
-                for keyword in keywords:
-                    keywords_count[keyword] = keywords_count.get(keyword, 0) + 1
-            
-            # 取前10個最常見的關鍵字
-            top_keywords = sorted(keywords_count.items(), key=lambda x: x[1], reverse=True)[:10]
-            
-            return {
-                "total_documents": len(sources),
-                "total_chunks": len(all_metadata),
-                "total_images": total_images,
-                "top_keywords": top_keywords,
-                "sources_list": list(sources)
-            }
+            return statistics
             
         except Exception as e:
             print(f"獲取文檔統計錯誤: {e}")
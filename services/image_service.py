@@ -3,9 +3,14 @@
 """
 
 import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 from typing import List, Dict, Any
 from PIL import Image
 import config
+from utils import create_image_preview, get_image_preview_path
+from services.metadata_store import get_metadata_store
 
 class ImageService:
     """圖片服務 - 管理和處理圖片"""
@@ -15,13 +20,14 @@ class ImageService:
         os.makedirs(self.images_path, exist_ok=True)
         print("🖼️ 圖片服務初始化完成")
     
-    def get_related_images(self, documents: List[Dict], query: str = "") -> List[str]:
+    def get_related_images(self, documents: List[Dict], query: str = "", use_preview: bool = True) -> List[str]:
         """
         根據文檔獲取相關圖片，並依相似度門檻過濾並排序。
 
         Args:
             documents: 文檔列表（包含 metadata/images 與 distance）
             query: 使用者查詢字串（可選）
+            use_preview: 返回縮圖預覽路徑（索引建立時已產生，無預覽時返回原圖）
 
         Returns:
             圖片路徑列表（按相似度由高到低排序）
@@ -90,6 +96,9 @@ class ImageService:
                     if len(unique_images_sorted) >= 5:  # 限制最多5張
                         break
 
+            if use_preview:
+                unique_images_sorted = [self.get_preview(img_path) for img_path in unique_images_sorted]
+
             print(f"🖼️ 找到 {len(unique_images_sorted)} 張相關圖片（門檻: {distance_threshold}，主題過濾: {'有' if present_keywords else '無'}）")
             return unique_images_sorted
 
@@ -97,6 +106,21 @@ class ImageService:
             print(f"獲取相關圖片錯誤: {e}")
             return []
     
+    def get_preview(self, image_path: str) -> str:
+        """
+        取得圖片的縮圖預覽路徑；舊版索引的圖片沒有預覽時即時產生並快取
+
+        Args:
+            image_path: 原始圖片路徑
+
+        Returns:
+            預覽圖路徑（無法產生時返回原圖路徑）
+        """
+        preview_path = get_image_preview_path(image_path)
+        if os.path.exists(preview_path):
+            return preview_path
+        return create_image_preview(image_path) or image_path
+    
     def get_image_info(self, image_path: str) -> Dict[str, Any]:
         """
         獲取圖片資訊
@@ -125,7 +149,7 @@ class ImageService:
     
     def search_images_by_keyword(self, keyword: str) -> List[str]:
         """
-        根據關鍵字搜尋圖片
+        根據關鍵字搜尋圖片（比對圖片所屬文字塊的來源檔名、標題、關鍵字、章節與內容）
         
         Args:
             keyword: 搜尋關鍵字
@@ -133,18 +157,12 @@ class ImageService:
         Returns:
             匹配的圖片路徑列表
         """
-        matching_images = []
-        
         try:
-            # 遍歷圖片目錄
-            for root, dirs, files in os.walk(self.images_path):
-                for file in files:
-                    if file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-                        # 檢查檔名是否包含關鍵字
-                        if keyword.lower() in file.lower():
-                            image_path = os.path.join(root, file)
-                            matching_images.append(image_path)
-            
+            # 圖片檔名為內容雜湊，改由文字塊元數據中的圖片關聯查詢
+            matching_images = [
+                image_path for image_path in get_metadata_store().search_images(keyword)
+                if os.path.exists(image_path)
+            ]
             print(f"🔍 關鍵字 '{keyword}' 找到 {len(matching_images)} 張圖片")
             return matching_images
             
@@ -0,0 +1,166 @@
+"""
+LLM 回應快取 - 完全相同的請求（模型、temperature、max_tokens、正規化後的訊息）直接返回先前的回應
+以 SQLite 保存，依 TTL 過期、超過筆數上限時淘汰最久未使用的項目；
+temperature 高於 LLM_CACHE_MAX_TEMPERATURE 的請求（需要隨機性）不使用快取
+LLMService 與 LangChain（langchain_agent.LangChainLLMCache）共用同一個快取
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import re
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import List, Dict, Any, Optional
+import config
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT,
+    response TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access);
+"""
+
+_WHITESPACE = re.compile(r'\s+')
+
+def normalize_text(text: str) -> str:
+    """正規化文字：合併連續空白並去除頭尾空白（排版差異不影響快取命中）"""
+    return _WHITESPACE.sub(" ", str(text or "")).strip()
+
+def make_key(model: str, temperature: float, max_tokens: Optional[int], messages: List[Dict[str, Any]]) -> str:
+    """請求指紋：模型、取樣參數與正規化訊息的 SHA-256"""
+    normalized = [{"role": m.get("role", "user"), "content": normalize_text(m.get("content"))} for m in messages]
+    fingerprint = json.dumps({
+        "model": model,
+        "temperature": round(float(temperature), 3),
+        "max_tokens": max_tokens,
+        "messages": normalized,
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()
+
+class LLMResponseCache:
+    """LLM 回應快取（SQLite）"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or os.path.join(config.MODEL_PATH, "llm_cache.db")
+        self.enabled = getattr(config, "LLM_CACHE_ENABLED", True)
+        self.ttl = getattr(config, "LLM_CACHE_TTL", 24 * 3600)
+        self.max_entries = getattr(config, "LLM_CACHE_MAX_ENTRIES", 5000)
+        self.max_temperature = getattr(config, "LLM_CACHE_MAX_TEMPERATURE", 0.2)
+
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+        # 各呼叫來源的命中統計（generate / stream / chat / langchain）
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, source: str, field: str):
+        stats = self._stats.setdefault(source, {"hits": 0, "misses": 0, "bypassed": 0})
+        stats[field] += 1
+
+    def cacheable(self, temperature: float) -> bool:
+        return self.enabled and float(temperature) <= self.max_temperature
+
+    # ---- 以請求參數存取 ----
+
+    def get(self, model: str, temperature: float, max_tokens: Optional[int], messages: List[Dict[str, Any]],
+            source: str = "generate") -> Optional[str]:
+        """查詢快取；temperature 過高時略過（記為 bypassed）"""
+        if not self.cacheable(temperature):
+            with self._lock:
+                self._count(source, "bypassed")
+            return None
+        return self.get_by_key(make_key(model, temperature, max_tokens, messages), source)
+
+    def put(self, model: str, temperature: float, max_tokens: Optional[int], messages: List[Dict[str, Any]], response: str):
+        if response and self.cacheable(temperature):
+            self.put_by_key(make_key(model, temperature, max_tokens, messages), model, response)
+
+    # ---- 以指紋存取（LangChain 自行組成指紋） ----
+
+    def get_by_key(self, key: str, source: str = "generate") -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                self._count(source, "misses")
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._count(source, "hits")
+            return row[0]
+
+    def put_by_key(self, key: str, model: str, response: str):
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created, last_access, hits) VALUES (?, ?, ?, ?, ?, 0)",
+                (key, model, response, now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        """刪除過期項目，超過筆數上限時刪除最久未使用的項目"""
+        if self.ttl:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        excess = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access LIMIT ?)", (excess,)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """命中統計（含各來源命中率）與目前快取筆數"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            sources = {}
+            totals = {"hits": 0, "misses": 0, "bypassed": 0}
+            for source, stats in self._stats.items():
+                lookups = stats["hits"] + stats["misses"]
+                sources[source] = {**stats, "hit_rate": round(stats["hits"] / lookups, 3) if lookups else 0.0}
+                for field in totals:
+                    totals[field] += stats[field]
+            lookups = totals["hits"] + totals["misses"]
+            return {
+                "enabled": self.enabled,
+                "entries": entries,
+                **totals,
+                "hit_rate": round(totals["hits"] / lookups, 3) if lookups else 0.0,
+                "sources": sources,
+            }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_llm_cache() -> LLMResponseCache:
+    """獲取 LLM 回應快取單例"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMResponseCache()
+    return _cache
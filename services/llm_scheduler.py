@@ -0,0 +1,290 @@
+"""
+LLM 請求排程器 - 程序內所有 LLM 呼叫（LLMService、LangChain ChatOpenAI、Embedding）共用
+- 同時進行的請求數上限（LLM_MAX_IN_FLIGHT）
+- 每個模型以令牌桶限制每分鐘請求數（LLM_RATE_LIMITS）
+- 優先權：互動對話優先於批次作業（文檔索引建立的 embedding 等）
+- 記錄每日用量，接近每日額度或代理返回「超過使用者每日最大使用量」時改用較便宜的模型
+- 排隊時間統計（狀態頁顯示）
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import time
+import atexit
+import heapq
+import itertools
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import date
+from typing import Dict, Any, Optional, Iterator, Tuple
+import numpy as np
+import config
+
+PRIORITY_INTERACTIVE = 0   # 使用者對話
+PRIORITY_BATCH = 10        # 批次作業（文檔索引建立、評估腳本）
+
+# 代理返回的每日額度用盡訊息
+QUOTA_EXCEEDED_MARKERS = ("超過使用者每日最大使用量",)
+
+def is_quota_exceeded(message: str) -> bool:
+    return any(marker in (message or "") for marker in QUOTA_EXCEEDED_MARKERS)
+
+class TokenBucket:
+    """令牌桶：容量為每分鐘請求數，依時間平均補充"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = max(float(per_minute), 1.0)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self) -> bool:
+        self._refill()
+        return self.tokens >= 1.0
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1.0
+
+    def wait_time(self) -> float:
+        """距離下一個令牌的秒數"""
+        self._refill()
+        return 0.0 if self.tokens >= 1.0 else (1.0 - self.tokens) / self.rate
+
+    def drain(self):
+        """收到 429 時清空令牌，暫停此模型的新請求"""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+class LLMScheduler:
+    """程序內的 LLM 請求排程器（以 get_llm_scheduler() 取得單例）"""
+
+    def __init__(self, usage_file: Optional[str] = None):
+        self.max_in_flight = max(getattr(config, "LLM_MAX_IN_FLIGHT", 4), 1)
+        self.rate_limits: Dict[str, float] = getattr(config, "LLM_RATE_LIMITS", {})
+        self.daily_quota: Dict[str, int] = getattr(config, "LLM_DAILY_QUOTA", {})
+        self.degrade_ratio = getattr(config, "LLM_DEGRADE_THRESHOLD", 0.9)
+        self.degrade_model = getattr(config, "LLM_DEGRADE_MODEL", "gpt-4.1-mini")
+        self.usage_file = usage_file or os.path.join(config.MODEL_PATH, "llm_usage.json")
+
+        self._cond = threading.Condition()
+        self._waiters = []  # (priority, 序號, 模型)
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._buckets: Dict[str, TokenBucket] = {}
+
+        self._wait_times = {PRIORITY_INTERACTIVE: deque(maxlen=500), PRIORITY_BATCH: deque(maxlen=500)}
+        self._completed = 0
+        self._degraded = 0
+        self._usage = self._load_usage()
+
+        # 用量檔不在每次請求結束時寫入（持有鎖時的磁碟 I/O 會阻塞所有等待者）：
+        # 累積 LLM_USAGE_SAVE_EVERY 次請求、換日或額度用盡時才寫入，程序結束時寫入剩餘的用量
+        self.save_every = max(int(getattr(config, "LLM_USAGE_SAVE_EVERY", 20)), 1)
+        self._unsaved = 0
+        self._versions = itertools.count(1)
+        self._written_version = 0
+        self._save_lock = threading.Lock()
+        atexit.register(self.flush_usage)
+
+    # ---- 每日用量 ----
+
+    def _load_usage(self) -> Dict[str, Any]:
+        today = date.today().isoformat()
+        try:
+            with open(self.usage_file, 'r', encoding='utf-8') as f:
+                usage = json.load(f)
+            if usage.get("date") == today:
+                return usage
+        except (OSError, ValueError):
+            pass
+        return {"date": today, "requests": {}, "exhausted": []}
+
+    def _snapshot_usage(self) -> Tuple[int, str]:
+        """取得目前用量的序列化內容（需持有 self._cond），寫入檔案在釋放鎖之後進行"""
+        self._unsaved = 0
+        return next(self._versions), json.dumps(self._usage, ensure_ascii=False)
+
+    def _write_usage(self, snapshot: Tuple[int, str]):
+        """寫入用量檔；並行寫入時不以較舊的內容覆蓋較新的內容"""
+        version, content = snapshot
+        with self._save_lock:
+            if version < self._written_version:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.usage_file) or ".", exist_ok=True)
+                tmp_path = self.usage_file + ".tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(content)
+                os.replace(tmp_path, self.usage_file)
+                self._written_version = version
+            except OSError as e:
+                print(f"⚠️ 無法保存 LLM 用量: {e}")
+
+    def flush_usage(self):
+        """寫入尚未保存的用量（程序結束時自動呼叫）"""
+        with self._cond:
+            snapshot = self._snapshot_usage() if self._unsaved else None
+        if snapshot:
+            self._write_usage(snapshot)
+
+    def _roll_day(self):
+        if self._usage["date"] != date.today().isoformat():
+            self._usage = {"date": date.today().isoformat(), "requests": {}, "exhausted": []}
+            # 換日後的第一次請求結束時寫入
+            self._unsaved = self.save_every
+
+    def _near_quota(self, model: str) -> bool:
+        if model in self._usage["exhausted"]:
+            return True
+        quota = self.daily_quota.get(model)
+        return bool(quota) and self._usage["requests"].get(model, 0) >= quota * self.degrade_ratio
+
+    def resolve_model(self, model: str) -> str:
+        """接近每日額度時返回降級模型，否則返回原模型"""
+        with self._cond:
+            self._roll_day()
+            if model != self.degrade_model and self._near_quota(model) and not self._near_quota(self.degrade_model):
+                return self.degrade_model
+            return model
+
+    def report_quota_exceeded(self, model: str):
+        """代理返回每日額度用盡：今日之後的請求改用降級模型"""
+        snapshot = None
+        with self._cond:
+            self._roll_day()
+            if model not in self._usage["exhausted"]:
+                self._usage["exhausted"].append(model)
+                fallback = f"，之後的請求改用 {self.degrade_model}" if model != self.degrade_model else ""
+                print(f"🚫 模型 {model} 已達每日額度{fallback}")
+                snapshot = self._snapshot_usage()
+        if snapshot:
+            self._write_usage(snapshot)
+
+    def report_rate_limited(self, model: str):
+        """收到 429：暫停此模型的新請求直到令牌補充"""
+        with self._cond:
+            self._bucket(model).drain()
+
+    # ---- 排程 ----
+
+    def _bucket(self, model: str) -> TokenBucket:
+        bucket = self._buckets.get(model)
+        if bucket is None:
+            bucket = TokenBucket(self.rate_limits.get(model, self.rate_limits.get("default", 60)))
+            self._buckets[model] = bucket
+        return bucket
+
+    def _next_runnable(self):
+        """依優先權與到達順序，找出第一個模型仍有令牌的等待者"""
+        for waiter in sorted(self._waiters):
+            if self._bucket(waiter[2]).available():
+                return waiter
+        return None
+
+    @contextmanager
+    def slot(self, model: str, priority: int = PRIORITY_INTERACTIVE, degrade: bool = True) -> Iterator[str]:
+        """
+        取得執行名額（阻塞直到輪到此請求），離開時釋放
+
+        Args:
+            model: 目標模型
+            priority: PRIORITY_INTERACTIVE 或 PRIORITY_BATCH（數字越小越優先）
+            degrade: 接近額度時是否允許改用降級模型（embedding 不可替換模型）
+
+        Yields:
+            實際使用的模型名稱
+        """
+        degraded = False
+        if degrade:
+            resolved = self.resolve_model(model)
+            if resolved != model:
+                degraded = True
+                print(f"⬇️ {model} 接近每日額度，改用 {resolved}")
+                model = resolved
+
+        enqueued = time.monotonic()
+        waiter = (priority, next(self._sequence), model)
+        with self._cond:
+            if degraded:
+                self._degraded += 1
+            heapq.heappush(self._waiters, waiter)
+            try:
+                while True:
+                    if self._in_flight < self.max_in_flight and self._next_runnable() == waiter:
+                        break
+                    pending = [self._bucket(m).wait_time() for _, _, m in self._waiters]
+                    self._cond.wait(timeout=min([t for t in pending if t > 0] + [1.0]))
+            except BaseException:
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+                raise
+            self._waiters.remove(waiter)
+            heapq.heapify(self._waiters)
+            self._bucket(model).take()
+            self._in_flight += 1
+            self._cond.notify_all()  # 仍有名額時讓下一個等待者繼續
+            self._wait_times.setdefault(priority, deque(maxlen=500)).append(time.monotonic() - enqueued)
+
+        try:
+            yield model
+        finally:
+            snapshot = None
+            with self._cond:
+                self._in_flight -= 1
+                self._completed += 1
+                self._roll_day()
+                self._usage["requests"][model] = self._usage["requests"].get(model, 0) + 1
+                self._unsaved += 1
+                if self._unsaved >= self.save_every:
+                    snapshot = self._snapshot_usage()
+                self._cond.notify_all()
+            if snapshot:
+                self._write_usage(snapshot)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """排程統計：進行中與排隊數量、各優先權的排隊時間、今日用量"""
+        with self._cond:
+            queue_wait = {}
+            for priority, samples in self._wait_times.items():
+                if not samples:
+                    continue
+                values = np.array(samples) * 1000
+                label = "interactive" if priority == PRIORITY_INTERACTIVE else "batch" if priority == PRIORITY_BATCH else str(priority)
+                queue_wait[label] = {
+                    "count": len(values),
+                    "avg_ms": round(float(values.mean()), 1),
+                    "p95_ms": round(float(np.percentile(values, 95)), 1),
+                }
+            return {
+                "in_flight": self._in_flight,
+                "max_in_flight": self.max_in_flight,
+                "queued": len(self._waiters),
+                "completed": self._completed,
+                "degraded": self._degraded,
+                "queue_wait": queue_wait,
+                "daily_requests": dict(self._usage["requests"]),
+                "quota_exhausted": list(self._usage["exhausted"]),
+            }
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_llm_scheduler() -> LLMScheduler:
+    """獲取 LLM 排程器單例"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler()
+    return _scheduler
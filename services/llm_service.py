@@ -1,12 +1,125 @@
 """
 LLM 服務 - 大語言模型調用服務
+- 所有請求共用同一個連線池（requests.Session），避免每次請求重新建立 TCP/TLS 連線
+- 記住每個模型可用的 API 端點，之後的請求不再逐一嘗試
+- 逾時、連線錯誤與 429/5xx 以指數退避重試（遵守 Retry-After）；
+  重試後仍失敗時返回「請稍後再試」的訊息，而不是關鍵字預設回應
+- 所有請求經過 LLM 排程器（services.llm_scheduler）取得執行名額，接近每日額度時改用降級模型
+- 完全相同的請求由 LLM 回應快取（services.llm_cache）直接返回
 """
 
 import os
+import time
+import queue
+import random
+import threading
 import requests
 import json
-from typing import Dict, Any, Optional
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional, Iterator, List
+from requests.adapters import HTTPAdapter
 import config
+from services.llm_scheduler import get_llm_scheduler, is_quota_exceeded, PRIORITY_INTERACTIVE
+from services.llm_cache import get_llm_cache
+
+# 可重試的 HTTP 狀態碼（限流與暫時性的伺服器錯誤）
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+class LLMTransientError(Exception):
+    """逾時、限流等暫時性錯誤（重試後仍失敗）"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+class LLMQuotaExceededError(LLMTransientError):
+    """代理返回每日額度用盡（不重試，改用降級模型）"""
+
+_session = None
+_session_lock = threading.Lock()
+
+# 模型 -> 可用的 API 端點
+_endpoint_cache: Dict[str, str] = {}
+_endpoint_lock = threading.Lock()
+
+def get_http_session() -> requests.Session:
+    """獲取共用的 HTTP 連線池（單例）"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                pool_size = getattr(config, "LLM_HTTP_POOL_SIZE", 10)
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+def _retry_after_seconds(response: requests.Response) -> Optional[float]:
+    """解析 Retry-After 標頭（秒數或 HTTP 日期）"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def _backoff_seconds(attempt: int) -> float:
+    """指數退避（含隨機抖動）"""
+    base = getattr(config, "LLM_RETRY_BACKOFF", 1.0)
+    limit = getattr(config, "LLM_RETRY_MAX_BACKOFF", 20.0)
+    return min(base * (2 ** attempt), limit) * (0.5 + random.random() / 2)
+
+def post_with_retry(endpoint: str, headers: Dict[str, str], payload: Dict[str, Any], stream: bool = False) -> requests.Response:
+    """
+    以共用連線池送出 POST 請求，暫時性錯誤依指數退避重試
+
+    Returns:
+        最後一次的回應（非暫時性的錯誤狀態碼也會返回，由呼叫端判斷）
+
+    Raises:
+        LLMTransientError: 重試次數用完仍為逾時、連線錯誤或 429/5xx
+    """
+    session = get_http_session()
+    timeout = (getattr(config, "LLM_CONNECT_TIMEOUT", 5), getattr(config, "LLM_READ_TIMEOUT", 60))
+    max_retries = getattr(config, "LLM_MAX_RETRIES", 3)
+
+    for attempt in range(max_retries + 1):
+        try:
+            response = session.post(endpoint, headers=headers, json=payload, timeout=timeout, stream=stream)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            if attempt >= max_retries:
+                kind = "逾時" if isinstance(e, requests.exceptions.Timeout) else "連線失敗"
+                raise LLMTransientError(f"{kind}: {e}") from e
+            wait = _backoff_seconds(attempt)
+            print(f"⚠️ 請求 {endpoint} 失敗（{e.__class__.__name__}），{wait:.1f} 秒後重試 ({attempt + 1}/{max_retries})")
+            time.sleep(wait)
+            continue
+
+        if response.status_code not in RETRYABLE_STATUS:
+            return response
+
+        retry_after = _retry_after_seconds(response)
+        if response.status_code == 429:
+            body = response.text
+            response.close()
+            if is_quota_exceeded(body):
+                raise LLMQuotaExceededError("超過使用者每日最大使用量", status_code=429)
+            get_llm_scheduler().report_rate_limited(payload.get("model", ""))
+        else:
+            response.close()
+        if attempt >= max_retries:
+            raise LLMTransientError(f"HTTP {response.status_code}", status_code=response.status_code)
+        wait = retry_after if retry_after is not None else _backoff_seconds(attempt)
+        wait = min(wait, getattr(config, "LLM_RETRY_MAX_BACKOFF", 20.0))
+        print(f"⚠️ 端點 {endpoint} 返回 {response.status_code}，{wait:.1f} 秒後重試 ({attempt + 1}/{max_retries})")
+        time.sleep(wait)
 
 class LLMService:
     """大語言模型服務"""
@@ -20,13 +133,16 @@ class LLMService:
         
         print(f"✅ LLM 服務初始化完成，使用模型: {self.model_name}")
     
-    def generate_response(self, prompt: str, model: str = None, **kwargs) -> str:
+    def generate_response(self, prompt: str, model: str = None, priority: int = PRIORITY_INTERACTIVE,
+                          meta: Optional[Dict[str, Any]] = None, **kwargs) -> str:
         """
         生成回應
         
         Args:
             prompt: 輸入提示詞
             model: 指定使用的模型（可選）
+            priority: 排程優先權（PRIORITY_INTERACTIVE / PRIORITY_BATCH）
+            meta: 呼叫端提供的字典，寫入實際使用的模型 meta["model"]（接近額度時可能為降級模型）
             **kwargs: 其他參數
             
         Returns:
@@ -34,74 +150,283 @@ class LLMService:
         """
         # 使用指定的模型或默認模型
         target_model = model or self.model_name
+        meta = {} if meta is None else meta
+        meta["model"] = target_model
+        
+        # 相同請求直接返回快取的回應
+        cache = get_llm_cache()
+        messages = [{"role": "user", "content": prompt}]
+        temperature = kwargs.get("temperature", self.temperature)
+        max_tokens = kwargs.get("max_tokens", self.max_tokens)
+        cached = cache.get(target_model, temperature, max_tokens, messages, source="generate")
+        if cached is not None:
+            print(f"♻️ 使用快取的 LLM 回應 (模型: {target_model})")
+            return cached
+        
+        def request(used_model: str) -> Optional[str]:
+            meta["model"] = used_model
+            content = self._try_api_request(prompt, model=used_model, **kwargs)
+            # 以實際使用的模型保存（降級模型的回應不會被當成原模型的回應）
+            cache.put(used_model, temperature, max_tokens, messages, content)
+            return content
         
         # 首先嘗試使用 API
-        api_response = self._try_api_request(prompt, model=target_model, **kwargs)
+        try:
+            api_response = self._scheduled(request, target_model, priority)
+        except LLMTransientError as e:
+            # 暫時性錯誤：提示稍後再試，不返回與問題無關的預設回應
+            return self._transient_error_response(e)
         if api_response:
             return api_response
         
         # 如果 API 失敗，返回預設回應
         return self._generate_fallback_response(prompt)
     
-    def _try_api_request(self, prompt: str, model: str = None, **kwargs) -> str:
-        """嘗試 API 請求"""
-        try:
-            # 使用指定的模型或默認模型
-            target_model = model or self.model_name
-            target_api_url = config.get_api_url(target_model)
-            
-            # 構建請求參數
-            payload = {
-                "model": target_model,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "temperature": kwargs.get("temperature", self.temperature),
-                "max_tokens": kwargs.get("max_tokens", self.max_tokens)
-            }
-            
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            # 嘗試不同的 API 端點
-            api_endpoints = [
-                f"{target_api_url}/chat/completions",
-                f"{target_api_url}/v1/completions"
-            ]
+    def _scheduled(self, request, model: str, priority: int):
+        """
+        在排程器名額內執行 request(實際模型)；模型每日額度用盡時，改用降級模型重試一次
+        """
+        scheduler = get_llm_scheduler()
+        while True:
+            with scheduler.slot(model, priority) as used_model:
+                try:
+                    return request(used_model)
+                except LLMQuotaExceededError:
+                    scheduler.report_quota_exceeded(used_model)
+                    if scheduler.resolve_model(used_model) == used_model:
+                        raise
+            model = used_model
+    
+    def _headers(self, stream: bool = False) -> Dict[str, str]:
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        if stream:
+            headers["Accept"] = "text/event-stream"
+        return headers
+    
+    def _payload(self, prompt: str, model: str, **kwargs) -> Dict[str, Any]:
+        return {
+            "model": model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            "temperature": kwargs.get("temperature", self.temperature),
+            "max_tokens": kwargs.get("max_tokens", self.max_tokens)
+        }
+    
+    def _candidate_endpoints(self, model: str) -> List[str]:
+        """API 端點候選（已知可用的端點優先且唯一）"""
+        cached = _endpoint_cache.get(model)
+        if cached:
+            return [cached]
+        api_url = config.get_api_url(model)
+        return [
+            f"{api_url}/chat/completions",
+            f"{api_url}/v1/completions"
+        ]
+    
+    def _try_api_request(self, prompt: str, model: str = None, **kwargs) -> Optional[str]:
+        """
+        嘗試 API 請求
+        
+        Returns:
+            回應文字；所有端點都無法使用時返回 None
+        
+        Raises:
+            LLMTransientError: 逾時或限流，重試後仍失敗
+        """
+        target_model = model or self.model_name
+        payload = self._payload(prompt, target_model, **kwargs)
+        headers = self._headers()
+        
+        for endpoint in self._candidate_endpoints(target_model):
+            try:
+                # 暫時性錯誤（LLMTransientError）直接向上拋出：端點存在但忙碌，不需改試其他端點
+                response = post_with_retry(endpoint, headers, payload)
+            except requests.exceptions.RequestException as e:
+                print(f"⚠️ 連接 {endpoint} 失敗: {e}")
+                continue
             
-            for endpoint in api_endpoints:
+            if response.status_code == 200:
                 try:
-                    print(f"🔗 嘗試 API 端點: {endpoint} (模型: {target_model})")
-                    response = requests.post(
-                        endpoint,
-                        headers=headers,
-                        json=payload,
-                        timeout=30
-                    )
-                    
-                    if response.status_code == 200:
-                        result = response.json()
-                        if "choices" in result and len(result["choices"]) > 0:
-                            content = result["choices"][0]["message"]["content"].strip()
-                            print(f"✅ API 請求成功")
-                            return content
-                    else:
-                        print(f"⚠️ API 端點 {endpoint} 失敗: {response.status_code}")
-                        
-                except requests.exceptions.RequestException as e:
-                    print(f"⚠️ 連接 {endpoint} 失敗: {e}")
+                    result = response.json()
+                except ValueError as e:
+                    print(f"⚠️ 端點 {endpoint} 回應格式錯誤: {e}")
                     continue
+                if "choices" in result and len(result["choices"]) > 0:
+                    content = result["choices"][0]["message"]["content"].strip()
+                    with _endpoint_lock:
+                        _endpoint_cache[target_model] = endpoint
+                    return content
+            else:
+                print(f"⚠️ API 端點 {endpoint} 失敗: {response.status_code}")
+                if response.status_code in (404, 405):
+                    # 端點已不可用，下次重新探測
+                    with _endpoint_lock:
+                        _endpoint_cache.pop(target_model, None)
+        
+        return None
+    
+    def _transient_error_response(self, error: LLMTransientError) -> str:
+        """暫時性錯誤時返回給用戶的訊息"""
+        if isinstance(error, LLMQuotaExceededError):
+            return "🚫 API 使用量已達每日限制，請稍後再試或切換其他模型。"
+        if error.status_code == 429:
+            reason = "模型服務目前請求量過高（429）"
+        elif error.status_code:
+            reason = f"模型服務暫時無法回應（HTTP {error.status_code}）"
+        else:
+            reason = f"模型服務連線逾時或中斷（{error}）"
+        return f"⚠️ {reason}，已重試 {getattr(config, 'LLM_MAX_RETRIES', 3)} 次仍失敗，請稍後再試。"
+    
+    def generate_response_stream(self, prompt: str, model: str = None, priority: int = PRIORITY_INTERACTIVE,
+                                 meta: Optional[Dict[str, Any]] = None, **kwargs) -> Iterator[str]:
+        """
+        串流生成回應（SSE，stream: true），收到 token 即輸出
+        
+        Args:
+            prompt: 輸入提示詞
+            model: 指定使用的模型（可選）
+            priority: 排程優先權（PRIORITY_INTERACTIVE / PRIORITY_BATCH）
+            meta: 呼叫端提供的字典，輸出第一個片段前寫入實際使用的模型 meta["model"]
+            **kwargs: 其他參數
             
-            return None
-                
-        except Exception as e:
-            print(f"❌ API 請求過程發生錯誤: {e}")
-            return None
+        Yields:
+            回應文字片段；端點不支援串流時改用一般請求一次輸出，API 失敗時輸出預設回應
+        """
+        target_model = model or self.model_name
+        meta = {} if meta is None else meta
+        meta["model"] = target_model
+        
+        # 快取命中時一次輸出完整回應
+        cache = get_llm_cache()
+        messages = [{"role": "user", "content": prompt}]
+        temperature = kwargs.get("temperature", self.temperature)
+        max_tokens = kwargs.get("max_tokens", self.max_tokens)
+        cached = cache.get(target_model, temperature, max_tokens, messages, source="stream")
+        if cached is not None:
+            print(f"♻️ 使用快取的 LLM 回應 (模型: {target_model})")
+            yield cached
+            return
+        
+        scheduler = get_llm_scheduler()
+        # 由背景執行緒讀取串流並放入佇列：排程名額只在 API 傳輸期間持有，
+        # 不受呼叫端（例如 Streamlit 逐段顯示）讀取速度影響
+        events: "queue.Queue" = queue.Queue()
+        stop = threading.Event()
+        
+        def produce():
+            try:
+                with scheduler.slot(target_model, priority) as used_model:
+                    events.put(("model", used_model))
+                    stream = self._stream_api_request(prompt, model=used_model, **kwargs)
+                    try:
+                        parts = []
+                        for delta in stream:
+                            if stop.is_set():
+                                return
+                            parts.append(delta)
+                            events.put(("delta", delta))
+                        # 完整接收後才保存（中斷的串流不寫入快取）
+                        cache.put(used_model, temperature, max_tokens, messages, "".join(parts))
+                    except LLMQuotaExceededError as e:
+                        scheduler.report_quota_exceeded(used_model)
+                        events.put(("error", e))
+                    finally:
+                        stream.close()
+            except Exception as e:
+                events.put(("error", e))
+            finally:
+                events.put(("done", None))
+        
+        threading.Thread(target=produce, name="llm-stream", daemon=True).start()
+        received = False
+        error = None
+        try:
+            while True:
+                kind, value = events.get()
+                if kind == "model":
+                    meta["model"] = value
+                elif kind == "delta":
+                    received = True
+                    yield value
+                elif kind == "error":
+                    error = value
+                else:
+                    break
+        finally:
+            # 呼叫端中途停止讀取時，背景執行緒在下一個片段結束並釋放名額
+            stop.set()
+        
+        if isinstance(error, LLMQuotaExceededError):
+            if received:
+                return
+        elif isinstance(error, LLMTransientError):
+            if not received:
+                yield self._transient_error_response(error)
+            return
+        elif error is not None:
+            print(f"⚠️ 串流請求失敗: {error}")
+        if received:
+            # 已輸出部分內容時不再重新生成，避免重複
+            return
+        
+        yield self.generate_response(prompt, model=target_model, priority=priority, meta=meta, **kwargs)
+    
+    def _stream_api_request(self, prompt: str, model: str = None, **kwargs) -> Iterator[str]:
+        """
+        SSE 串流請求，逐行解析 data: 事件並輸出 delta 內容（開始接收前的暫時性錯誤會重試）
+        使用與一般請求相同的端點記錄；已知可用的端點不是 /chat/completions 時，改用一般請求一次輸出
+        """
+        target_model = model or self.model_name
+        payload = self._payload(prompt, target_model, **kwargs)
+        payload["stream"] = True
+        
+        endpoint = f"{config.get_api_url(target_model)}/chat/completions"
+        known = _endpoint_cache.get(target_model)
+        if known and known != endpoint:
+            print(f"ℹ️ 模型 {target_model} 使用端點 {known}，不支援串流，改用一般請求")
+            content = self._try_api_request(prompt, model=target_model, **kwargs)
+            if content:
+                yield content
+            return
+        
+        print(f"🔗 串流 API 端點: {endpoint} (模型: {target_model})")
+        with post_with_retry(endpoint, self._headers(stream=True), payload, stream=True) as response:
+            if response.status_code != 200:
+                print(f"⚠️ 串流端點 {endpoint} 失敗: {response.status_code}")
+                if response.status_code in (404, 405):
+                    with _endpoint_lock:
+                        _endpoint_cache.pop(target_model, None)
+                return
+            with _endpoint_lock:
+                _endpoint_cache[target_model] = endpoint
+
+            if "text/event-stream" not in response.headers.get("Content-Type", ""):
+                # 端點不支援串流，直接返回完整回應
+                result = response.json()
+                if result.get("choices"):
+                    yield result["choices"][0]["message"]["content"].strip()
+                return
+
+            for line in response.iter_lines(decode_unicode=False):
+                if not line or not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    break
+                event = json.loads(data.decode("utf-8"))
+                choices = event.get("choices") or []
+                if not choices:
+                    continue
+                content = (choices[0].get("delta") or {}).get("content")
+                if content:
+                    yield content
     
     def _generate_fallback_response(self, prompt: str) -> str:
         """生成備用回應"""
@@ -149,12 +474,13 @@ class LLMService:
 
 或稍後再試。"""
     
-    def chat_completion(self, messages: list, **kwargs) -> Dict[str, Any]:
+    def chat_completion(self, messages: list, priority: int = PRIORITY_INTERACTIVE, **kwargs) -> Dict[str, Any]:
         """
         多輪對話完成
         
         Args:
             messages: 對話消息列表
+            priority: 排程優先權（PRIORITY_INTERACTIVE / PRIORITY_BATCH）
             **kwargs: 其他參數
             
         Returns:
@@ -168,22 +494,28 @@ class LLMService:
                 "max_tokens": kwargs.get("max_tokens", self.max_tokens)
             }
             
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
+            cache = get_llm_cache()
+            cached = cache.get(self.model_name, payload["temperature"], payload["max_tokens"], messages, source="chat")
+            if cached is not None:
+                return {
+                    "success": True,
+                    "data": json.loads(cached),
+                    "cached": True
+                }
+            
+            def request(used_model: str) -> requests.Response:
+                payload["model"] = used_model
+                return post_with_retry(f"{config.get_api_url(used_model)}/chat/completions", self._headers(), payload)
             
-            response = requests.post(
-                f"{self.api_url}/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=30
-            )
+            response = self._scheduled(request, self.model_name, priority)
             
             if response.status_code == 200:
+                data = response.json()
+                cache.put(payload["model"], payload["temperature"], payload["max_tokens"], messages,
+                          json.dumps(data, ensure_ascii=False))
                 return {
                     "success": True,
-                    "data": response.json()
+                    "data": data
                 }
             else:
                 return {
@@ -192,6 +524,12 @@ class LLMService:
                     "details": response.text
                 }
                 
+        except LLMTransientError as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "transient": True
+            }
         except Exception as e:
             return {
                 "success": False,
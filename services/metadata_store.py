@@ -0,0 +1,219 @@
+"""
+文檔元數據儲存 - 以 SQLite 保存文字塊元數據
+依來源檔案建立索引，並以增量方式維護關鍵字與來源統計，避免每次查詢都讀取整份資料
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import sqlite3
+import threading
+from typing import List, Dict, Any, Optional, Iterable
+import config
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id TEXT PRIMARY KEY,
+    source_file TEXT,
+    relative_path TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_source_file ON chunks(source_file);
+CREATE INDEX IF NOT EXISTS idx_chunks_relative_path ON chunks(relative_path);
+CREATE TABLE IF NOT EXISTS source_stats (
+    source_file TEXT PRIMARY KEY,
+    chunks INTEGER NOT NULL DEFAULT 0,
+    images INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS keyword_stats (
+    keyword TEXT PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+class DocumentMetadataStore:
+    """文字塊元數據儲存（SQLite），取代整份讀寫的 documents_metadata.json"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or os.path.join(config.MODEL_PATH, "documents_metadata.db")
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+        self._migrate_from_json(os.path.join(os.path.dirname(self.db_path), "documents_metadata.json"))
+
+    def _migrate_from_json(self, json_path: str):
+        """首次使用時匯入舊版 documents_metadata.json，完成後將舊檔改名保留"""
+        if not os.path.exists(json_path) or self.count() > 0:
+            return
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+            self.upsert_records(records)
+            os.replace(json_path, json_path + ".migrated")
+            print(f"✅ 已將 {len(records)} 筆文檔元數據從 JSON 匯入 SQLite")
+        except Exception as e:
+            print(f"⚠️ 匯入舊版文檔元數據失敗: {e}")
+
+    def _apply_stats(self, records: Iterable[Dict], sign: int):
+        """將記錄的來源與關鍵字統計加入（sign=1）或扣除（sign=-1）"""
+        for record in records:
+            source = record.get("source_file", "Unknown")
+            images = len(record.get("images") or [])
+            self._conn.execute(
+                "INSERT INTO source_stats (source_file, chunks, images) VALUES (?, ?, ?) "
+                "ON CONFLICT(source_file) DO UPDATE SET chunks = chunks + excluded.chunks, images = images + excluded.images",
+                (source, sign, sign * images)
+            )
+            for keyword in record.get("keywords") or []:
+                self._conn.execute(
+                    "INSERT INTO keyword_stats (keyword, count) VALUES (?, ?) "
+                    "ON CONFLICT(keyword) DO UPDATE SET count = count + excluded.count",
+                    (keyword, sign)
+                )
+
+    def _fetch_by_ids(self, ids: List[str]) -> List[Dict]:
+        records = []
+        for i in range(0, len(ids), 500):  # SQLite 參數數量上限
+            batch = ids[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(f"SELECT data FROM chunks WHERE id IN ({placeholders})", batch)
+            records.extend(json.loads(row[0]) for row in rows)
+        return records
+
+    def _cleanup_stats(self):
+        self._conn.execute("DELETE FROM source_stats WHERE chunks <= 0")
+        self._conn.execute("DELETE FROM keyword_stats WHERE count <= 0")
+
+    def upsert_records(self, records: List[Dict]):
+        """
+        新增或取代文字塊記錄（以 id 為鍵），同步更新統計
+
+        Args:
+            records: 文字塊元數據列表（需含 id）
+        """
+        if not records:
+            return
+        # 同一批中重複的 ID 以最後一筆為準
+        records = list({record["id"]: record for record in records}.values())
+        with self._lock, self._conn:
+            previous = self._fetch_by_ids([record["id"] for record in records])
+            self._apply_stats(previous, -1)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, source_file, relative_path, data) VALUES (?, ?, ?, ?)",
+                [
+                    (record["id"], record.get("source_file"), record.get("relative_path"),
+                     json.dumps(record, ensure_ascii=False))
+                    for record in records
+                ]
+            )
+            self._apply_stats(records, 1)
+            self._cleanup_stats()
+
+    def delete_records(self, ids: List[str]):
+        """刪除指定 ID 的文字塊記錄，同步更新統計"""
+        if not ids:
+            return
+        ids = list(ids)
+        with self._lock, self._conn:
+            self._apply_stats(self._fetch_by_ids(ids), -1)
+            for i in range(0, len(ids), 500):
+                batch = ids[i:i + 500]
+                self._conn.execute(f"DELETE FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch)
+            self._cleanup_stats()
+
+    def clear(self):
+        """清空所有記錄與統計"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM source_stats")
+            self._conn.execute("DELETE FROM keyword_stats")
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def get_all(self) -> List[Dict]:
+        """取得所有文字塊記錄（依寫入順序）"""
+        with self._lock:
+            return [json.loads(row[0]) for row in self._conn.execute("SELECT data FROM chunks ORDER BY rowid")]
+
+    def search_by_source(self, source_file: str) -> List[Dict]:
+        """
+        依來源檔名搜尋文字塊（不分大小寫的部分比對）
+        先從來源統計表比對檔名，再以索引取出對應的文字塊
+        """
+        keyword = source_file.lower()
+        with self._lock:
+            sources = [
+                row[0] for row in self._conn.execute("SELECT source_file FROM source_stats")
+                if keyword in (row[0] or "").lower()
+            ]
+            records = []
+            for source in sources:
+                rows = self._conn.execute("SELECT data FROM chunks WHERE source_file = ? ORDER BY rowid", (source,))
+                records.extend(json.loads(row[0]) for row in rows)
+            return records
+
+    def search_images(self, keyword: str) -> List[str]:
+        """
+        依關鍵字搜尋圖片：來源檔名、標題、關鍵字、章節或內容包含關鍵字（不分大小寫）的文字塊所關聯的圖片
+        （圖片檔名為內容雜湊，無法以檔名比對）
+
+        Returns:
+            圖片路徑列表（依寫入順序，已去重）
+        """
+        keyword = keyword.lower()
+        pattern = "%" + keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        images = []
+        seen = set()
+        with self._lock:
+            rows = self._conn.execute("SELECT data FROM chunks WHERE data LIKE ? ESCAPE '\\' ORDER BY rowid", (pattern,))
+            for row in rows:
+                record = json.loads(row[0])
+                if not record.get("images"):
+                    continue
+                fields = [record.get("source_file"), record.get("title"), record.get("section"), record.get("content")]
+                fields.extend(record.get("keywords") or [])
+                if not any(keyword in (field or "").lower() for field in fields):
+                    continue
+                for image_path in record["images"]:
+                    if image_path not in seen:
+                        seen.add(image_path)
+                        images.append(image_path)
+        return images
+
+    def get_statistics(self, top_n: int = 10) -> Dict[str, Any]:
+        """取得統計資訊（由增量維護的統計表直接查詢）"""
+        with self._lock:
+            sources = [row[0] for row in self._conn.execute("SELECT source_file FROM source_stats ORDER BY source_file")]
+            total_chunks, total_images = self._conn.execute(
+                "SELECT COALESCE(SUM(chunks), 0), COALESCE(SUM(images), 0) FROM source_stats"
+            ).fetchone()
+            top_keywords = [
+                (row[0], row[1]) for row in self._conn.execute(
+                    "SELECT keyword, count FROM keyword_stats ORDER BY count DESC, keyword LIMIT ?", (top_n,)
+                )
+            ]
+        return {
+            "total_documents": len(sources),
+            "total_chunks": total_chunks,
+            "total_images": total_images,
+            "top_keywords": top_keywords,
+            "sources_list": sources
+        }
+
+# 全域變數存儲元數據儲存實例
+_metadata_store: Optional[DocumentMetadataStore] = None
+
+def get_metadata_store() -> DocumentMetadataStore:
+    """獲取文檔元數據儲存實例（單例）"""
+    global _metadata_store
+    if _metadata_store is None:
+        _metadata_store = DocumentMetadataStore()
+    return _metadata_store
@@ -0,0 +1,130 @@
+"""
+重排序服務 - 使用本地 Cross-Encoder 對檢索候選進行重新排序
+支援以下後端：
+- torch（sentence_transformers CrossEncoder，CPU 批次推論）
+- onnx（sentence_transformers ONNX 後端，可指定量化模型檔）
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time
+from typing import List, Dict, Any, Optional, Tuple
+import config
+
+class RerankService:
+    """Cross-Encoder 重排序服務，依據 config.RERANK_* 設定載入模型"""
+
+    def __init__(self, model_name: Optional[str] = None, backend: Optional[str] = None):
+        self.model_name = model_name or getattr(config, "RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+        self.backend = (backend or getattr(config, "RERANK_BACKEND", "torch")).lower()
+        if self.backend not in {"torch", "onnx"}:
+            self.backend = "torch"
+        self.batch_size = getattr(config, "RERANK_BATCH_SIZE", 16)
+        self.latency_budget_ms = getattr(config, "RERANK_LATENCY_BUDGET_MS", 300)
+        self.estimate_decay = getattr(config, "RERANK_ESTIMATE_DECAY", 0.8)
+
+        self.model = None
+        # 最近一次每組 (query, passage) 的平均推論耗時（毫秒），用於預估是否超出預算
+        self._ms_per_pair: Optional[float] = None
+
+        self._load_model()
+
+    def _load_model(self):
+        """載入 Cross-Encoder 模型（延遲載入 sentence_transformers）"""
+        from sentence_transformers import CrossEncoder
+
+        cache_folder = os.path.join(config.MODEL_PATH, "cross_encoders")
+        os.makedirs(cache_folder, exist_ok=True)
+
+        print(f"載入重排序模型: {self.model_name} (後端: {self.backend})")
+        if self.backend == "onnx":
+            onnx_file = getattr(config, "RERANK_ONNX_FILE", None)
+            model_kwargs = {"file_name": onnx_file} if onnx_file else None
+            try:
+                self.model = CrossEncoder(
+                    self.model_name,
+                    device="cpu",
+                    cache_folder=cache_folder,
+                    backend="onnx",
+                    model_kwargs=model_kwargs,
+                )
+            except TypeError:
+                # 舊版 sentence_transformers 不支援 backend 參數
+                print("⚠️ 目前的 sentence_transformers 版本不支援 ONNX 後端，改用 torch")
+                self.backend = "torch"
+
+        if self.model is None:
+            self.model = CrossEncoder(self.model_name, device="cpu", cache_folder=cache_folder)
+        print(f"✅ 重排序模型載入成功: {self.model_name}")
+
+    def rerank(self, query: str, documents: List[Dict], top_k: int = 3) -> Tuple[List[Dict], Dict[str, Any]]:
+        """
+        對候選文檔重新排序
+
+        Args:
+            query: 用戶查詢
+            documents: 候選文檔（需含 content 欄位，已依向量距離排序）
+            top_k: 返回數量
+
+        Returns:
+            (排序後的前 top_k 筆文檔, 重排序資訊)；超出延遲預算時保留原排序
+        """
+        info = {"reranked": False, "candidates": len(documents), "elapsed_ms": 0.0}
+        if len(documents) <= 1:
+            return documents[:top_k], info
+
+        # 依上次的單組耗時預估，明顯超出預算就直接略過
+        if self._ms_per_pair is not None and self._ms_per_pair * len(documents) > self.latency_budget_ms:
+            info["skipped"] = "estimated_over_budget"
+            print(f"⏭️ 略過重排序：預估 {self._ms_per_pair * len(documents):.0f}ms > 預算 {self.latency_budget_ms}ms")
+            # 預估值逐次衰減：主機持續偏慢時仍會略過，暫時變慢時數次查詢後重新量測，避免永久停用
+            self._ms_per_pair *= self.estimate_decay
+            return documents[:top_k], info
+
+        pairs = [(query, doc.get("content", "")) for doc in documents]
+        scores: List[float] = []
+        start = time.perf_counter()
+
+        for i in range(0, len(pairs), self.batch_size):
+            batch_scores = self.model.predict(pairs[i:i + self.batch_size], batch_size=self.batch_size)
+            scores.extend(float(s) for s in batch_scores)
+
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if elapsed_ms > self.latency_budget_ms and len(scores) < len(pairs):
+                self._ms_per_pair = elapsed_ms / len(scores)
+                info.update({"skipped": "over_budget", "elapsed_ms": elapsed_ms})
+                print(f"⏭️ 重排序超出延遲預算 ({elapsed_ms:.0f}ms > {self.latency_budget_ms}ms)，使用原排序")
+                return documents[:top_k], info
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self._ms_per_pair = elapsed_ms / len(pairs)
+
+        ranked = sorted(zip(documents, scores), key=lambda x: x[1], reverse=True)
+        reranked_docs = []
+        for doc, score in ranked[:top_k]:
+            doc["rerank_score"] = score
+            reranked_docs.append(doc)
+
+        info.update({"reranked": True, "elapsed_ms": elapsed_ms})
+        print(f"🎯 重排序完成：{len(documents)} 筆候選 → 前 {len(reranked_docs)} 筆 ({elapsed_ms:.0f}ms)")
+        return reranked_docs, info
+
+    def get_model_info(self) -> str:
+        """獲取模型資訊"""
+        return f"CrossEncoder: {self.model_name} ({self.backend})"
+
+# 全域變數存儲重排序服務實例
+_rerank_service: Optional[RerankService] = None
+
+def get_rerank_service() -> Optional[RerankService]:
+    """獲取重排序服務實例（單例）。模型載入失敗時返回 None，由呼叫端略過重排序"""
+    global _rerank_service
+    if _rerank_service is None:
+        try:
+            _rerank_service = RerankService()
+        except Exception as e:
+            print(f"❌ 重排序模型載入失敗，停用重排序: {e}")
+            _rerank_service = False
+    return _rerank_service or None
@@ -0,0 +1,125 @@
+"""
+Token 服務 - 提示詞 token 計數與截斷
+優先使用 tiktoken 精確計數；未安裝時使用快速近似估算
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import re
+from typing import Optional
+import config
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken 為選用套件
+    tiktoken = None
+
+# 中日韓字元（近似估算時約 1 token/字）
+_CJK_PATTERN = re.compile(r'[\u4e00-\u9fff\u3040-\u30ff\uac00-\ud7af\uff00-\uffef]')
+# XML 區塊（SPC/EDC 工具輸出常見的大段 XML）
+_XML_BLOCK_PATTERN = re.compile(r'```xml.*?```|<\?xml.*?(?=\n\n|\Z)|<(\w+)[^>]*>.*?</\1>', re.S)
+
+_encoding = None
+
+def _get_encoding():
+    """取得 tiktoken 編碼器（僅初始化一次）"""
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        encoding_name = getattr(config, "TOKENIZER_ENCODING", "o200k_base")
+        try:
+            _encoding = tiktoken.get_encoding(encoding_name)
+        except Exception as e:
+            print(f"⚠️ 無法載入 tiktoken 編碼 {encoding_name}，改用近似估算: {e}")
+            _encoding = False
+    return _encoding or None
+
+def count_tokens(text: str) -> int:
+    """
+    計算文字的 token 數
+
+    Args:
+        text: 文字內容
+
+    Returns:
+        token 數（tiktoken 精確值或近似值）
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    # 近似：中日韓字元 1 token/字，其餘約 4 字元/token
+    cjk_chars = len(_CJK_PATTERN.findall(text))
+    return cjk_chars + (len(text) - cjk_chars + 3) // 4
+
+def truncate_to_tokens(text: str, max_tokens: int, keep_end: bool = False) -> str:
+    """
+    截斷文字至指定 token 數以內
+
+    Args:
+        text: 文字內容
+        max_tokens: 最大 token 數
+        keep_end: True 時保留結尾，否則保留開頭
+
+    Returns:
+        截斷後的文字
+    """
+    if max_tokens <= 0 or not text:
+        return ""
+    encoding = _get_encoding()
+    if encoding:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[-max_tokens:] if keep_end else tokens[:max_tokens])
+
+    if count_tokens(text) <= max_tokens:
+        return text
+    # 近似模式：逐字累計權重（中日韓字元 1，其餘 0.25）
+    used = 0.0
+    indices = range(len(text) - 1, -1, -1) if keep_end else range(len(text))
+    for i in indices:
+        used += 1.0 if _CJK_PATTERN.match(text[i]) else 0.25
+        if used > max_tokens:
+            return text[i + 1:] if keep_end else text[:i]
+    return text
+
+def compact_text(text: str, max_tokens: int, xml_block_tokens: Optional[int] = None) -> str:
+    """
+    將過長的文字（如含 XML 的 SPC 工具輸出）壓縮至 token 上限內：
+    1. 將過大的 XML 區塊替換為摘要標記
+    2. 仍超出時保留開頭與結尾，中間以省略標記取代
+
+    Args:
+        text: 文字內容
+        max_tokens: 最大 token 數
+        xml_block_tokens: XML 區塊超過此 token 數即替換為摘要（預設為 max_tokens 的四分之一）
+
+    Returns:
+        壓縮後的文字
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    xml_limit = xml_block_tokens if xml_block_tokens is not None else max(max_tokens // 4, 1)
+
+    def _collapse_xml(match):
+        block = match.group(0)
+        block_tokens = count_tokens(block)
+        if block_tokens <= xml_limit:
+            return block
+        return f"[XML 內容已省略，約 {block_tokens} tokens]"
+
+    text = _XML_BLOCK_PATTERN.sub(_collapse_xml, text)
+    total = count_tokens(text)
+    if total <= max_tokens:
+        return text
+
+    marker = f"\n…（已省略約 {total - max_tokens} tokens）…\n"
+    available = max(max_tokens - count_tokens(marker), 0)
+    head = truncate_to_tokens(text, available * 2 // 3)
+    tail_budget = available - count_tokens(head)
+    tail = truncate_to_tokens(text, tail_budget, keep_end=True) if tail_budget > 0 else ""
+    return head + marker + tail
@@ -0,0 +1,230 @@
+"""
+向量資料庫 collection 管理 - HNSW 參數與依文檔領域分片
+- HNSW 參數（M、construction_ef、search_ef）由 config.HNSW_* 設定，於建立 collection 時套用
+- 啟用 COLLECTION_SHARDING 時，文檔依領域（SPC、EDC、一般）寫入不同的 collection，
+  查詢時先以關鍵詞快速分類只查詢對應領域，無法分類或結果不佳時查詢全部領域並依距離合併
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import re
+from typing import List, Dict, Any, Optional, Iterable
+import config
+
+GENERAL_DOMAIN = "general"
+
+def _domain_keywords() -> Dict[str, List[str]]:
+    return getattr(config, "DOMAIN_KEYWORDS", {
+        "spc": ["SPC", "CHART", "OOC", "OOS", "AFF", "管制圖"],
+        "edc": ["EDC"],
+    })
+
+def collection_name(domain: str) -> str:
+    """領域對應的 collection 名稱（一般領域沿用 documents，相容未分片的資料）"""
+    return "documents" if domain == GENERAL_DOMAIN else f"documents_{domain}"
+
+def hnsw_metadata() -> Dict[str, Any]:
+    """建立 collection 時使用的 HNSW 設定"""
+    return {
+        "hnsw:space": "cosine",
+        "hnsw:M": getattr(config, "HNSW_M", 16),
+        "hnsw:construction_ef": getattr(config, "HNSW_CONSTRUCTION_EF", 100),
+        "hnsw:search_ef": getattr(config, "HNSW_SEARCH_EF", 10),
+    }
+
+def _count_domain_hits(text: str) -> Dict[str, int]:
+    text = (text or "").upper()
+    hits = {}
+    for domain, keywords in _domain_keywords().items():
+        count = sum(len(re.findall(re.escape(keyword.upper()), text)) for keyword in keywords)
+        if count:
+            hits[domain] = count
+    return hits
+
+def classify_document(relative_path: str, title: str = "", keywords: Iterable[str] = ()) -> str:
+    """
+    依檔名、標題與關鍵字判斷文檔領域（命中最多關鍵詞的領域，沒有命中時為一般領域）
+    """
+    hits = _count_domain_hits(" ".join([relative_path or "", title or ""] + list(keywords or [])))
+    if not hits:
+        return GENERAL_DOMAIN
+    return max(hits.items(), key=lambda item: item[1])[0]
+
+def classify_query(query: str) -> Optional[str]:
+    """
+    查詢的快速領域分類：只命中單一領域時返回該領域，否則返回 None（查詢全部領域）
+    """
+    hits = _count_domain_hits(query)
+    return next(iter(hits)) if len(hits) == 1 else None
+
+def domains() -> List[str]:
+    return list(_domain_keywords()) + [GENERAL_DOMAIN]
+
+class ShardedCollection:
+    """
+    依領域分片的 collection 組合，提供與 Chroma Collection 相同的常用介面
+    （count / get / add / upsert / update / delete / query），寫入時依 metadata["domain"] 分派
+    """
+
+    sharded = True
+
+    def __init__(self, shards: Dict[str, Any]):
+        self.shards = shards
+
+    def _shard_for(self, metadata: Dict) -> str:
+        domain = (metadata or {}).get("domain", GENERAL_DOMAIN)
+        return domain if domain in self.shards else GENERAL_DOMAIN
+
+    def _group(self, ids: List[str], metadatas: List[Dict], **columns) -> Dict[str, Dict[str, List]]:
+        groups: Dict[str, Dict[str, List]] = {}
+        for i, (chunk_id, metadata) in enumerate(zip(ids, metadatas)):
+            group = groups.setdefault(self._shard_for(metadata), {"ids": [], "metadatas": [], **{k: [] for k in columns}})
+            group["ids"].append(chunk_id)
+            group["metadatas"].append(metadata)
+            for key, values in columns.items():
+                group[key].append(values[i])
+        return groups
+
+    def count(self) -> int:
+        return sum(shard.count() for shard in self.shards.values())
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None, include: Optional[List[str]] = None,
+            limit: Optional[int] = None, offset: Optional[int] = None) -> Dict[str, Any]:
+        include = ["documents", "metadatas"] if include is None else include
+        merged = {"ids": [], **{key: [] for key in include}}
+        skip = offset or 0
+        remaining = limit
+        for shard in self.shards.values():
+            if remaining is not None and remaining <= 0:
+                break
+            filters = {}
+            if ids is not None:
+                filters["ids"] = ids
+            if where is not None:
+                filters["where"] = where
+            kwargs = {"include": include, **filters}
+            if limit is not None or offset is not None:
+                # 跨分片分頁：略過前面分片已涵蓋的筆數（有篩選條件時以符合條件的筆數計算）
+                size = len(shard.get(include=[], **filters)["ids"]) if filters else shard.count()
+                if skip >= size:
+                    skip -= size
+                    continue
+                kwargs["offset"] = skip
+                kwargs["limit"] = remaining if remaining is not None else size
+                skip = 0
+            result = shard.get(**kwargs)
+            merged["ids"].extend(result["ids"])
+            for key in include:
+                values = result.get(key)
+                merged[key].extend(list(values) if values is not None else [None] * len(result["ids"]))
+            if remaining is not None:
+                remaining -= len(result["ids"])
+        return merged
+
+    def add(self, ids: List[str], metadatas: List[Dict], documents: List[str], embeddings: List[List[float]]):
+        for domain, group in self._group(ids, metadatas, documents=documents, embeddings=embeddings).items():
+            self.shards[domain].add(**group)
+
+    def upsert(self, ids: List[str], metadatas: List[Dict], documents: List[str], embeddings: List[List[float]]):
+        for domain, group in self._group(ids, metadatas, documents=documents, embeddings=embeddings).items():
+            # 文檔領域改變時，從其他分片移除舊的文字塊
+            for other, shard in self.shards.items():
+                if other != domain:
+                    shard.delete(ids=group["ids"])
+            self.shards[domain].upsert(**group)
+
+    def update(self, ids: List[str], metadatas: List[Dict]):
+        """
+        更新 metadata；標題或關鍵字改變使文檔領域改變時，將文字塊（含 embedding）移到新領域的分片，
+        否則以領域分類的查詢會找不到留在舊分片的文字塊
+        """
+        new_metadata = dict(zip(ids, metadatas))
+        for domain, shard in self.shards.items():
+            existing = shard.get(ids=ids, include=[])["ids"]
+            if not existing:
+                continue
+            stay = [chunk_id for chunk_id in existing if self._shard_for(new_metadata[chunk_id]) == domain]
+            move = [chunk_id for chunk_id in existing if self._shard_for(new_metadata[chunk_id]) != domain]
+            if stay:
+                shard.update(ids=stay, metadatas=[new_metadata[chunk_id] for chunk_id in stay])
+            if move:
+                moved = shard.get(ids=move, include=["documents", "embeddings"])
+                shard.delete(ids=moved["ids"])
+                self.add(
+                    ids=moved["ids"],
+                    metadatas=[new_metadata[chunk_id] for chunk_id in moved["ids"]],
+                    documents=list(moved["documents"]),
+                    embeddings=list(moved["embeddings"])
+                )
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None):
+        for shard in self.shards.values():
+            shard.delete(ids=ids, where=where)
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10, include: Optional[List[str]] = None,
+              where: Optional[Dict] = None, domains: Optional[List[str]] = None) -> Dict[str, Any]:
+        """查詢指定領域的分片（預設全部），各查詢的結果依距離合併取前 n_results 筆"""
+        include = ["documents", "metadatas", "distances"] if include is None else include
+        fields = list(dict.fromkeys(list(include) + ["distances"]))
+        targets = [self.shards[d] for d in (domains or self.shards) if d in self.shards]
+
+        merged = [[] for _ in query_embeddings]  # 每個查詢的 (distance, id, {field: value})
+        for shard in targets:
+            size = shard.count()
+            if size == 0:
+                continue
+            kwargs = {"query_embeddings": query_embeddings, "n_results": min(n_results, size), "include": fields}
+            if where is not None:
+                kwargs["where"] = where
+            result = shard.query(**kwargs)
+            for q in range(len(query_embeddings)):
+                for i, chunk_id in enumerate(result["ids"][q]):
+                    values = {key: result[key][q][i] for key in fields if result.get(key) is not None}
+                    merged[q].append((values["distances"], chunk_id, values))
+
+        output = {"ids": [], **{key: [] for key in include}}
+        for hits in merged:
+            hits = sorted(hits, key=lambda hit: hit[0])[:n_results]
+            output["ids"].append([chunk_id for _, chunk_id, _ in hits])
+            for key in include:
+                output[key].append([values.get(key) for _, _, values in hits])
+        return output
+
+def open_document_collection(client, create: bool = True):
+    """
+    開啟文檔 collection（依 config.COLLECTION_SHARDING 返回單一 collection 或 ShardedCollection）
+
+    Args:
+        client: chromadb 客戶端
+        create: 不存在時是否建立；為 False 且不存在時拋出例外
+    """
+    if not getattr(config, "COLLECTION_SHARDING", False):
+        return _open(client, collection_name(GENERAL_DOMAIN), create)
+
+    shards = {}
+    for domain in domains():
+        try:
+            shards[domain] = _open(client, collection_name(domain), create)
+        except Exception:
+            if domain == GENERAL_DOMAIN and not create:
+                raise
+    return ShardedCollection(shards)
+
+def reset_document_collection(client):
+    """刪除並重新建立文檔 collection（含所有領域分片），套用目前的 HNSW 設定"""
+    for domain in domains():
+        try:
+            client.delete_collection(collection_name(domain))
+        except Exception:
+            pass
+    return open_document_collection(client, create=True)
+
+def _open(client, name: str, create: bool):
+    try:
+        return client.get_collection(name)
+    except Exception:
+        if not create:
+            raise
+        return client.create_collection(name=name, metadata=hnsw_metadata())
@@ -0,0 +1,480 @@
+"""
+向量儲存介面 - DocumentProcessor 與 RAGAgent 透過 VectorStore 存取向量資料，不直接依賴 chromadb
+支援以下後端（config.VECTOR_STORE_BACKEND）：
+- chroma：Chroma PersistentClient（含 HNSW 設定與領域分片，見 vector_collections）
+- local：程序內索引，向量存放於記憶體映射的 float32 矩陣、文字與 metadata 存放於 SQLite；
+  小型語料以 NumPy 暴力搜尋，超過 LOCAL_ANN_THRESHOLD 且安裝 hnswlib 時改用 HNSW
+
+所有查詢結果沿用 Chroma 的格式（{"ids": [[...]], "documents": [[...]], ...}）
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import shutil
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Optional
+import numpy as np
+import config
+
+class VectorStore(ABC):
+    """向量儲存抽象介面（方法與參數對齊 Chroma Collection）"""
+
+    # 是否依領域分片（query 可指定 domains）
+    sharded = False
+
+    @abstractmethod
+    def count(self) -> int:
+        """文字塊數量"""
+
+    @abstractmethod
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None, include: Optional[List[str]] = None,
+            limit: Optional[int] = None, offset: Optional[int] = None) -> Dict[str, Any]:
+        """依 ID 或 metadata 條件取得文字塊"""
+
+    @abstractmethod
+    def upsert(self, ids: List[str], metadatas: List[Dict], documents: List[str], embeddings: List[List[float]]):
+        """新增或取代文字塊"""
+
+    @abstractmethod
+    def update(self, ids: List[str], metadatas: List[Dict]):
+        """只更新既有文字塊的 metadata"""
+
+    @abstractmethod
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None):
+        """依 ID 或 metadata 條件刪除文字塊"""
+
+    @abstractmethod
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10, include: Optional[List[str]] = None,
+              where: Optional[Dict] = None, domains: Optional[List[str]] = None) -> Dict[str, Any]:
+        """向量相似度查詢（距離為餘弦距離，越小越相似）"""
+
+    @abstractmethod
+    def reset(self):
+        """清空所有資料"""
+
+    def add(self, ids: List[str], metadatas: List[Dict], documents: List[str], embeddings: List[List[float]]):
+        self.upsert(ids=ids, metadatas=metadatas, documents=documents, embeddings=embeddings)
+
+    def describe(self) -> str:
+        return self.__class__.__name__
+
+class ChromaVectorStore(VectorStore):
+    """Chroma 後端（單一 collection 或依領域分片）"""
+
+    def __init__(self, path: Optional[str] = None, create: bool = True):
+        import chromadb  # 延遲載入，local 後端不需安裝 chromadb
+        from chromadb.config import Settings
+        from services.vector_collections import open_document_collection
+
+        self.client = chromadb.PersistentClient(
+            path=path or config.VECTOR_DB_PATH,
+            settings=Settings(anonymized_telemetry=False)
+        )
+        self.collection = open_document_collection(self.client, create=create)
+        self.sharded = getattr(self.collection, "sharded", False)
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def get(self, ids=None, where=None, include=None, limit=None, offset=None) -> Dict[str, Any]:
+        kwargs = {"include": ["documents", "metadatas"] if include is None else include}
+        for key, value in (("ids", ids), ("where", where), ("limit", limit), ("offset", offset)):
+            if value is not None:
+                kwargs[key] = value
+        return self.collection.get(**kwargs)
+
+    def add(self, ids, metadatas, documents, embeddings):
+        self.collection.add(ids=ids, metadatas=metadatas, documents=documents, embeddings=embeddings)
+
+    def upsert(self, ids, metadatas, documents, embeddings):
+        self.collection.upsert(ids=ids, metadatas=metadatas, documents=documents, embeddings=embeddings)
+
+    def update(self, ids, metadatas):
+        self.collection.update(ids=ids, metadatas=metadatas)
+
+    def delete(self, ids=None, where=None):
+        self.collection.delete(ids=ids, where=where)
+
+    def query(self, query_embeddings, n_results=10, include=None, where=None, domains=None) -> Dict[str, Any]:
+        kwargs = {"query_embeddings": query_embeddings, "n_results": n_results,
+                  "include": ["documents", "metadatas", "distances"] if include is None else include}
+        if where is not None:
+            kwargs["where"] = where
+        if domains and self.sharded:
+            kwargs["domains"] = domains
+        return self.collection.query(**kwargs)
+
+    def reset(self):
+        from services.vector_collections import reset_document_collection
+        self.collection = reset_document_collection(self.client)
+
+    def describe(self) -> str:
+        return "Chroma（依領域分片）" if self.sharded else "Chroma"
+
+class LocalVectorStore(VectorStore):
+    """
+    程序內向量索引
+    - vectors.f32 / vectors.<世代>.f32：記憶體映射的 float32 矩陣（每列一個正規化向量，啟動時不需載入整個檔案）
+    - store.db：SQLite，id -> 列號、文字與 metadata
+    - state.json：列數、維度與矩陣世代，寫入完成後更新；其他程序依修改時間判斷是否重新載入
+    刪除的列先標記為無效，無效列過多時將有效列寫入新世代的矩陣檔，再經由 state.json 切換
+    （不覆寫其他程序可能仍在映射的檔案；Windows 無法取代已映射的檔案）
+    """
+
+    def __init__(self, path: Optional[str] = None, create: bool = True):
+        self.path = path or os.path.join(config.VECTOR_DB_PATH, "local_index")
+        if not create and not os.path.exists(os.path.join(self.path, "state.json")):
+            raise FileNotFoundError(f"本地向量索引不存在: {self.path}")
+        os.makedirs(self.path, exist_ok=True)
+
+        self.state_file = os.path.join(self.path, "state.json")
+        self.ann_backend = getattr(config, "LOCAL_INDEX_BACKEND", "numpy")
+        self.ann_threshold = getattr(config, "LOCAL_ANN_THRESHOLD", 50000)
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(self.path, "store.db"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, row INTEGER NOT NULL, document TEXT, metadata TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_row ON chunks(row)")
+        self._conn.commit()
+
+        self._state_mtime = None
+        self._load()
+        if not os.path.exists(self.state_file):
+            self._save_state()
+
+    # ---- 載入與狀態 ----
+
+    def _load(self):
+        """載入列號對應與記憶體映射矩陣"""
+        state = {"rows": 0, "dim": 0}
+        if os.path.exists(self.state_file):
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self._state_mtime = os.path.getmtime(self.state_file)
+        self.dim = state["dim"]
+        self.rows = state["rows"]
+        self.generation = state.get("generation", 0)
+        self.vectors_file = self._vectors_path(self.generation)
+
+        self._row_of: Dict[str, int] = {}
+        self._alive = np.zeros(self.rows, dtype=bool)
+        for chunk_id, row in self._conn.execute("SELECT id, row FROM chunks"):
+            if row < self.rows:
+                self._row_of[chunk_id] = row
+                self._alive[row] = True
+        self._ids = [None] * self.rows
+        for chunk_id, row in self._row_of.items():
+            self._ids[row] = chunk_id
+
+        self._map_vectors()
+        self._ann = None
+
+    def _vectors_path(self, generation: int) -> str:
+        return os.path.join(self.path, "vectors.f32" if generation == 0 else f"vectors.{generation}.f32")
+
+    def _map_vectors(self):
+        if self.rows and self.dim:
+            self._matrix = np.memmap(self.vectors_file, dtype=np.float32, mode='r', shape=(self.rows, self.dim))
+        else:
+            self._matrix = np.zeros((0, self.dim or 0), dtype=np.float32)
+
+    def _save_state(self):
+        tmp_path = self.state_file + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"rows": self.rows, "dim": self.dim, "generation": self.generation}, f)
+        os.replace(tmp_path, self.state_file)
+        self._state_mtime = os.path.getmtime(self.state_file)
+
+    def reload_if_changed(self):
+        """其他程序（例如 document_processor.py）更新索引後重新載入"""
+        if not os.path.exists(self.state_file):
+            return
+        mtime = os.path.getmtime(self.state_file)
+        if mtime != self._state_mtime:
+            with self._lock:
+                self._load()
+
+    # ---- 近似最近鄰（選用 hnswlib） ----
+
+    def _get_ann(self):
+        """列數超過門檻且設定為 hnswlib 時建立 HNSW 索引（未安裝時使用 NumPy）"""
+        if self.ann_backend != "hnswlib" or len(self._row_of) < self.ann_threshold:
+            return None
+        if self._ann is None:
+            try:
+                import hnswlib
+            except ImportError:
+                print("⚠️ 未安裝 hnswlib，本地向量索引改用 NumPy 暴力搜尋")
+                self.ann_backend = "numpy"
+                return None
+            ann = hnswlib.Index(space="cosine", dim=self.dim)
+            ann.init_index(max_elements=max(self.rows * 2, 1024),
+                           ef_construction=getattr(config, "HNSW_CONSTRUCTION_EF", 200),
+                           M=getattr(config, "HNSW_M", 16))
+            alive_rows = np.flatnonzero(self._alive)
+            for start in range(0, len(alive_rows), 50000):
+                rows = alive_rows[start:start + 50000]
+                ann.add_items(np.asarray(self._matrix[rows]), rows)
+            ann.set_ef(getattr(config, "HNSW_SEARCH_EF", 64))
+            self._ann = ann
+        return self._ann
+
+    # ---- 讀取 ----
+
+    def count(self) -> int:
+        self.reload_if_changed()
+        return len(self._row_of)
+
+    def _fetch(self, ids: List[str], include: List[str]) -> Dict[str, Any]:
+        """依 ID 順序取得文字塊（不存在的 ID 略過）"""
+        records = {}
+        for i in range(0, len(ids), 500):
+            batch = ids[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            for chunk_id, document, metadata in self._conn.execute(
+                    f"SELECT id, document, metadata FROM chunks WHERE id IN ({placeholders})", batch):
+                records[chunk_id] = (document, metadata)
+        found = [chunk_id for chunk_id in ids if chunk_id in records and chunk_id in self._row_of]
+        result = {"ids": found}
+        if "documents" in include:
+            result["documents"] = [records[chunk_id][0] for chunk_id in found]
+        if "metadatas" in include:
+            result["metadatas"] = [json.loads(records[chunk_id][1]) if records[chunk_id][1] else None for chunk_id in found]
+        if "embeddings" in include:
+            result["embeddings"] = [np.asarray(self._matrix[self._row_of[chunk_id]]).tolist() for chunk_id in found]
+        return result
+
+    def _where_sql(self, where: Dict) -> (str, List):
+        """metadata 等值條件（支援 {"key": value} 與 {"$and": [...]}）"""
+        if "$and" in where:
+            clauses, params = [], []
+            for condition in where["$and"]:
+                clause, clause_params = self._where_sql(condition)
+                clauses.append(clause)
+                params.extend(clause_params)
+            return " AND ".join(clauses), params
+        clauses, params = [], []
+        for key, value in where.items():
+            if isinstance(value, dict):
+                value = value.get("$eq")
+            clauses.append("json_extract(metadata, ?) = ?")
+            params.extend([f"$.{key}", value])
+        return " AND ".join(clauses), params
+
+    def get(self, ids=None, where=None, include=None, limit=None, offset=None) -> Dict[str, Any]:
+        self.reload_if_changed()
+        include = ["documents", "metadatas"] if include is None else include
+        with self._lock:
+            if ids is None:
+                sql, params = "SELECT id FROM chunks", []
+                if where:
+                    clause, params = self._where_sql(where)
+                    sql += f" WHERE {clause}"
+                sql += " ORDER BY row"
+                if limit is not None or offset is not None:
+                    sql += " LIMIT ? OFFSET ?"
+                    params = list(params) + [limit if limit is not None else -1, offset or 0]
+                ids = [row[0] for row in self._conn.execute(sql, params)]
+            elif where:
+                clause, params = self._where_sql(where)
+                matched = set()
+                for i in range(0, len(ids), 500):
+                    batch = ids[i:i + 500]
+                    rows = self._conn.execute(
+                        f"SELECT id FROM chunks WHERE id IN ({','.join('?' * len(batch))}) AND {clause}", batch + params)
+                    matched.update(row[0] for row in rows)
+                ids = [chunk_id for chunk_id in ids if chunk_id in matched]
+            return self._fetch(list(ids), include)
+
+    def query(self, query_embeddings, n_results=10, include=None, where=None, domains=None) -> Dict[str, Any]:
+        self.reload_if_changed()
+        include = ["documents", "metadatas", "distances"] if include is None else include
+        output = {"ids": [], **{key: [] for key in include}}
+        with self._lock:
+            queries = np.asarray(query_embeddings, dtype=np.float32)
+            norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            queries = queries / np.where(norms == 0, 1.0, norms)
+
+            allowed = None
+            if where:
+                allowed = set(self.get(where=where, include=[])["ids"])
+
+            alive_count = len(self._row_of)
+            ann = self._get_ann() if allowed is None else None
+            for query in queries:
+                k = min(n_results, alive_count if allowed is None else len(allowed))
+                if k <= 0 or not self.dim:
+                    rows, distances = [], []
+                elif ann is not None:
+                    labels, dists = ann.knn_query(query, k=k)
+                    rows, distances = labels[0].tolist(), dists[0].tolist()
+                else:
+                    # 暴力搜尋：記憶體映射矩陣與查詢向量內積
+                    scores = np.asarray(self._matrix @ query)
+                    mask = self._alive.copy()
+                    if allowed is not None:
+                        mask[:] = False
+                        mask[[self._row_of[chunk_id] for chunk_id in allowed if chunk_id in self._row_of]] = True
+                    scores[~mask] = -np.inf
+                    top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+                    top = top[np.argsort(-scores[top])]
+                    top = [row for row in top if mask[row]]
+                    rows, distances = top, [1.0 - float(scores[row]) for row in top]
+
+                ids = [self._ids[row] for row in rows]
+                fetched = self._fetch(ids, [key for key in include if key != "distances"])
+                distance_of = dict(zip(ids, distances))
+                output["ids"].append(fetched["ids"])
+                for key in include:
+                    if key == "distances":
+                        output[key].append([distance_of[chunk_id] for chunk_id in fetched["ids"]])
+                    else:
+                        output[key].append(fetched[key])
+        return output
+
+    # ---- 寫入 ----
+
+    def upsert(self, ids, metadatas, documents, embeddings):
+        if not ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1.0, norms)
+
+        with self._lock:
+            self.reload_if_changed()
+            if not self.dim:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"向量維度不符：索引為 {self.dim}，寫入為 {vectors.shape[1]}")
+
+            existing = [(i, self._row_of[chunk_id]) for i, chunk_id in enumerate(ids) if chunk_id in self._row_of]
+            new_indices = [i for i, chunk_id in enumerate(ids) if chunk_id not in self._row_of]
+
+            # 既有 ID 就地覆寫向量
+            if existing:
+                with open(self.vectors_file, 'r+b') as f:
+                    for i, row in existing:
+                        f.seek(row * self.dim * 4)
+                        f.write(vectors[i].tobytes())
+
+            # 新 ID 附加到矩陣尾端
+            first_row = self.rows
+            if new_indices:
+                with open(self.vectors_file, 'ab') as f:
+                    f.write(vectors[new_indices].tobytes())
+            rows = {ids[i]: row for i, row in existing}
+            rows.update({ids[i]: first_row + n for n, i in enumerate(new_indices)})
+
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (id, row, document, metadata) VALUES (?, ?, ?, ?)",
+                    [(chunk_id, rows[chunk_id], documents[i], json.dumps(metadatas[i], ensure_ascii=False))
+                     for i, chunk_id in enumerate(ids)]
+                )
+
+            self.rows += len(new_indices)
+            self._alive = np.concatenate([self._alive, np.ones(len(new_indices), dtype=bool)])
+            self._ids.extend(ids[i] for i in new_indices)
+            self._row_of.update(rows)
+            self._map_vectors()
+            if self._ann is not None:
+                changed = [rows[chunk_id] for chunk_id in ids]
+                if self.rows > self._ann.get_max_elements():
+                    self._ann.resize_index(self.rows * 2)
+                self._ann.add_items(vectors, changed)
+            self._save_state()
+
+    def update(self, ids, metadatas):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE chunks SET metadata = ? WHERE id = ?",
+                [(json.dumps(metadata, ensure_ascii=False), chunk_id) for chunk_id, metadata in zip(ids, metadatas)]
+            )
+            self._save_state()
+
+    def delete(self, ids=None, where=None):
+        with self._lock:
+            self.reload_if_changed()
+            if where is not None:
+                ids = self.get(ids=ids, where=where, include=[])["ids"]
+            ids = [chunk_id for chunk_id in (ids or []) if chunk_id in self._row_of]
+            if not ids:
+                return
+            with self._conn:
+                for i in range(0, len(ids), 500):
+                    batch = ids[i:i + 500]
+                    self._conn.execute(f"DELETE FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch)
+            for chunk_id in ids:
+                row = self._row_of.pop(chunk_id)
+                self._alive[row] = False
+                self._ids[row] = None
+                if self._ann is not None:
+                    self._ann.mark_deleted(row)
+
+            # 無效列超過四分之一時重寫矩陣
+            if self.rows > 1000 and self.rows - len(self._row_of) > self.rows // 4:
+                self._compact()
+            self._save_state()
+
+    def _compact(self):
+        """移除無效列並重新編號：寫入新世代的矩陣檔，更新列號後經由 state.json 切換"""
+        alive_rows = np.flatnonzero(self._alive)
+        generation = self.generation + 1
+        with open(self._vectors_path(generation), 'wb') as f:
+            for start in range(0, len(alive_rows), 50000):
+                f.write(np.asarray(self._matrix[alive_rows[start:start + 50000]]).tobytes())
+
+        new_row = {int(old): new for new, old in enumerate(alive_rows)}
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE chunks SET row = ? WHERE id = ?",
+                [(new_row[row], chunk_id) for chunk_id, row in self._row_of.items()]
+            )
+        self.rows = len(alive_rows)
+        self.generation = generation
+        self._save_state()
+        self._matrix = None
+        self._load()
+        self._remove_old_generations()
+
+    def _remove_old_generations(self):
+        """刪除舊世代的矩陣檔；其他程序仍在映射時（Windows）略過，下次壓縮時再刪除"""
+        for filename in os.listdir(self.path):
+            file_path = os.path.join(self.path, filename)
+            if filename.startswith("vectors.") and filename.endswith(".f32") and file_path != self.vectors_file:
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
+
+    def reset(self):
+        with self._lock:
+            self._conn.close()
+            self._matrix = None
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.__init__(self.path, create=True)
+
+    def describe(self) -> str:
+        ann = "hnswlib" if self._ann is not None else "NumPy"
+        return f"本地索引（{ann}，{len(self._row_of)} 筆，維度 {self.dim}）"
+
+def open_vector_store(create: bool = True) -> VectorStore:
+    """
+    依 config.VECTOR_STORE_BACKEND 開啟向量儲存
+
+    Args:
+        create: 不存在時是否建立；為 False 且不存在時拋出例外
+    """
+    backend = getattr(config, "VECTOR_STORE_BACKEND", "chroma").lower()
+    if backend == "local":
+        return LocalVectorStore(create=create)
+    return ChromaVectorStore(create=create)
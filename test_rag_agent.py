@@ -0,0 +1,234 @@
+"""
+RAG 檢索流程測試
+以假的檢索結果與重排序服務測試過濾、重排序與 MMR 的順序（不需要向量資料庫與模型）
+"""
+
+import sys
+import os
+
+# 將專案根目錄加入 sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import config
+from agents.rag_agent import RAGAgent
+
+class FakeReranker:
+    """記錄收到的候選數量，並以反轉的順序作為重排序結果"""
+
+    def __init__(self):
+        self.received = []
+
+    def rerank(self, query, documents, top_k=3):
+        self.received.append(len(documents))
+        ranked = list(reversed(documents))
+        for rank, doc in enumerate(ranked):
+            doc["rerank_score"] = float(len(ranked) - rank)
+        return ranked[:top_k], {"reranked": True, "candidates": len(documents)}
+
+def _make_agent(n_docs: int, reranker=None) -> RAGAgent:
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(n_docs, 8)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    results = {
+        "ids": [[f"chunk_{i}" for i in range(n_docs)]],
+        "documents": [[f"文字塊 {i}" for i in range(n_docs)]],
+        "metadatas": [[{"source_file": f"doc_{i}.docx", "chunk_index": i} for i in range(n_docs)]],
+        "distances": [[0.01 * i for i in range(n_docs)]],
+        "embeddings": [list(vectors)],
+        "query_embeddings": [vectors[0]],
+    }
+
+    agent = RAGAgent.__new__(RAGAgent)
+    agent.rerank_service = reranker
+    agent._search_documents = lambda query, n_results=5, mode=None, include_embeddings=False: results
+    return agent
+
+def _with_config(**values):
+    """暫時修改 config，返回還原用的原始值"""
+    original = {name: getattr(config, name) for name in values}
+    for name, value in values.items():
+        setattr(config, name, value)
+    return original
+
+def test_reranker_receives_full_candidate_pool():
+    """重排序在 MMR 之前執行，收到全部過濾後的候選，而不是 MMR 選出的前幾筆"""
+    original = _with_config(MMR_ENABLED=True, RERANK_TOP_K=3, MMR_TOP_K=3, SIMILARITY_THRESHOLD=1.0)
+    try:
+        reranker = FakeReranker()
+        agent = _make_agent(30, reranker)
+        _, docs = agent.retrieve_documents("SPC 沒有進 CHART")
+
+        assert reranker.received == [30]
+        assert reranker.received[0] > config.RERANK_TOP_K
+        assert len(docs) == config.RERANK_TOP_K
+        # MMR 以重排序分數作為相關性：第一筆為重排序分數最高的文字塊
+        assert docs[0]["source_file"] == "doc_29.docx"
+    finally:
+        _with_config(**original)
+
+def test_rerank_without_mmr_keeps_top_k():
+    original = _with_config(MMR_ENABLED=False, RERANK_TOP_K=3, SIMILARITY_THRESHOLD=1.0)
+    try:
+        reranker = FakeReranker()
+        agent = _make_agent(30, reranker)
+        _, docs = agent.retrieve_documents("SPC 沒有進 CHART")
+
+        assert reranker.received == [30]
+        assert [doc["source_file"] for doc in docs] == ["doc_29.docx", "doc_28.docx", "doc_27.docx"]
+    finally:
+        _with_config(**original)
+
+def test_mmr_without_reranker():
+    original = _with_config(MMR_ENABLED=True, MMR_TOP_K=4, SIMILARITY_THRESHOLD=1.0)
+    try:
+        agent = _make_agent(10)
+        _, docs = agent.retrieve_documents("SPC 沒有進 CHART")
+
+        assert len(docs) == 4
+        assert docs[0]["source_file"] == "doc_0.docx"
+    finally:
+        _with_config(**original)
+
+class FakeCollection:
+    sharded = False
+
+    def __init__(self, n_docs: int):
+        self.n_docs = n_docs
+
+    def query(self, query_embeddings, n_results, include):
+        n = min(n_results, self.n_docs)
+        return {
+            "ids": [[f"chunk_{i}" for i in range(n)]],
+            "documents": [[f"文字塊 {i}" for i in range(n)]],
+            "metadatas": [[{"source_file": f"doc_{i}.docx"} for i in range(n)]],
+            "distances": [[0.5 + 0.01 * i for i in range(n)]],
+            "included": include,
+        }
+
+class FakeBM25:
+    def __init__(self, hits):
+        self.hits = hits
+
+    def reload_if_changed(self):
+        pass
+
+    def search(self, query, top_k=10):
+        return self.hits[:top_k]
+
+def _make_hybrid_agent(n_docs: int, bm25_hits) -> RAGAgent:
+    agent = RAGAgent.__new__(RAGAgent)
+    agent.collection = FakeCollection(n_docs)
+    agent.bm25_index = FakeBM25(bm25_hits)
+    return agent
+
+def test_hybrid_without_bm25_hits_returns_n_results():
+    agent = _make_hybrid_agent(30, [])
+    results = agent._hybrid_search("SPC", [[0.0] * 8], 5, ["documents", "metadatas", "distances"])
+
+    assert len(results["ids"][0]) == 5
+    assert len(results["documents"][0]) == 5
+    assert len(results["distances"][0]) == 5
+    assert results["included"] == ["documents", "metadatas", "distances"]
+
+def test_hybrid_lexical_bypass_limited_to_top_bm25_hits():
+    original = _with_config(HYBRID_LEXICAL_BYPASS_TOP_N=2)
+    try:
+        bm25_hits = [(f"chunk_{i}", 10.0 - i) for i in range(20)]
+        agent = _make_hybrid_agent(30, bm25_hits)
+        results = agent._hybrid_search("SPC", [[0.0] * 8], 10, ["documents", "metadatas", "distances"])
+
+        bypass = [chunk_id for chunk_id, hit in zip(results["ids"][0], results["lexical_hits"][0]) if hit]
+        assert sorted(bypass) == ["chunk_0", "chunk_1"]
+    finally:
+        _with_config(**original)
+
+class FakeEmbeddingService:
+    def __init__(self, query_vector):
+        self.query_vector = query_vector
+
+    def encode(self, texts):
+        return [self.query_vector]
+
+class HybridCollection:
+    """向量候選皆與查詢距離 0.2；另有一個僅由 BM25 命中、與查詢正交（距離 1.0）的精確比對文字塊"""
+    sharded = False
+
+    def __init__(self, n_docs: int, dim: int = 8):
+        rng = np.random.default_rng(1)
+        self.query_vector = np.eye(dim, dtype=np.float32)[0]
+        self.vectors = {}
+        for i in range(n_docs):
+            other = rng.normal(size=dim).astype(np.float32)
+            other[0] = 0.0
+            other /= np.linalg.norm(other)
+            self.vectors[f"chunk_{i}"] = 0.8 * self.query_vector + 0.6 * other
+        self.vectors["HAMSPARA_chunk"] = np.eye(dim, dtype=np.float32)[dim - 1]
+
+    def _record(self, chunk_id):
+        return f"{chunk_id} 內容", {"source_file": f"{chunk_id}.docx"}
+
+    def query(self, query_embeddings, n_results, include):
+        ids = [chunk_id for chunk_id in self.vectors if chunk_id.startswith("chunk_")][:n_results]
+        results = {
+            "ids": [ids],
+            "documents": [[self._record(chunk_id)[0] for chunk_id in ids]],
+            "metadatas": [[self._record(chunk_id)[1] for chunk_id in ids]],
+            "distances": [[1.0 - float(self.vectors[chunk_id] @ self.query_vector) for chunk_id in ids]],
+        }
+        if "embeddings" in include:
+            results["embeddings"] = [[self.vectors[chunk_id] for chunk_id in ids]]
+        return results
+
+    def get(self, ids, include):
+        return {
+            "ids": ids,
+            "documents": [self._record(chunk_id)[0] for chunk_id in ids],
+            "metadatas": [self._record(chunk_id)[1] for chunk_id in ids],
+            "embeddings": [self.vectors[chunk_id] for chunk_id in ids],
+        }
+
+def _make_full_hybrid_agent() -> RAGAgent:
+    agent = RAGAgent.__new__(RAGAgent)
+    agent.collection = HybridCollection(20)
+    agent.embedding_service = FakeEmbeddingService(agent.collection.query_vector)
+    agent.bm25_index = FakeBM25([("HAMSPARA_chunk", 9.0), ("chunk_19", 1.0)])
+    agent.rerank_service = None
+    return agent
+
+def test_hybrid_exact_match_survives_into_context():
+    """僅由 BM25 命中的精確比對保留融合排序，進入提示詞上下文（不因向量距離排序而被擠出）"""
+    original = _with_config(RETRIEVAL_MODE="hybrid", MMR_ENABLED=False, SIMILARITY_THRESHOLD=0.3, RAG_CONTEXT_MAX_DOCS=3)
+    try:
+        agent = _make_full_hybrid_agent()
+        _, docs = agent.retrieve_documents("HAMSPARA 設定")
+
+        # RRF：chunk_19（兩個檢索器皆命中）、chunk_0（向量第一）、HAMSPARA_chunk（BM25 第一）
+        assert [doc["source_file"] for doc in docs[:3]] == ["chunk_19.docx", "chunk_0.docx", "HAMSPARA_chunk.docx"]
+        assert "HAMSPARA_chunk 內容" in agent._build_context(docs)
+    finally:
+        _with_config(**original)
+
+def test_hybrid_mmr_keeps_lexical_only_hit():
+    """混合檢索 + MMR（未重排序）以融合分數作為相關性，與查詢餘弦相似度低的精確比對仍被選取"""
+    original = _with_config(RETRIEVAL_MODE="hybrid", MMR_ENABLED=True, MMR_TOP_K=3, MMR_FETCH_K=20,
+                            SIMILARITY_THRESHOLD=0.3, RAG_CONTEXT_MAX_DOCS=3)
+    try:
+        agent = _make_full_hybrid_agent()
+        _, docs = agent.retrieve_documents("HAMSPARA 設定")
+
+        assert len(docs) == 3
+        assert "HAMSPARA_chunk.docx" in [doc["source_file"] for doc in docs]
+        assert "HAMSPARA_chunk 內容" in agent._build_context(docs)
+    finally:
+        _with_config(**original)
+
+if __name__ == "__main__":
+    test_reranker_receives_full_candidate_pool()
+    test_rerank_without_mmr_keeps_top_k()
+    test_mmr_without_reranker()
+    test_hybrid_without_bm25_hits_returns_n_results()
+    test_hybrid_lexical_bypass_limited_to_top_bm25_hits()
+    test_hybrid_exact_match_survives_into_context()
+    test_hybrid_mmr_keeps_lexical_only_hit()
+    print("✅ RAG 檢索流程測試通過！")
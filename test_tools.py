@@ -5,11 +5,17 @@
 
 import sys
 import os
+import time
+import tempfile
 
 # 將專案根目錄加入 sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import config
 from tools import ToolManager
+from tools.base_tool import BaseTool, check_cancelled
+from tools.tool_registry import ToolSpec
+from tools.tool_cache import ToolResultCache
 
 def test_all_tools():
     """測試所有工具"""
@@ -73,6 +79,196 @@ def test_langchain_integration():
     
     print("✅ LangChain 集成測試通過！")
 
+class SleepTool(BaseTool):
+    """依查詢的秒數等待後返回，記錄實際執行過的查詢"""
+
+    def __init__(self):
+        super().__init__()
+        self.executed = []
+
+    def get_name(self) -> str:
+        return "test_sleep"
+
+    def get_description(self) -> str:
+        return "測試用：等待指定秒數"
+
+    def execute(self, query: str) -> str:
+        self.executed.append(query)
+        time.sleep(float(query))
+        check_cancelled()
+        return f"完成 {query}"
+
+class FastTool(SleepTool):
+    def get_name(self) -> str:
+        return "test_fast"
+
+def _with_config(**values):
+    """暫時修改 config，返回還原用的原始值"""
+    original = {name: getattr(config, name) for name in values}
+    for name, value in values.items():
+        setattr(config, name, value)
+    return original
+
+def _make_manager(*tool_classes) -> ToolManager:
+    """建立 ToolManager 並註冊測試用工具（使用獨立的記憶體快取）"""
+    manager = ToolManager()
+    for tool_class in tool_classes:
+        name = tool_class.__new__(tool_class).get_name()  # 不執行 __init__，與 ToolRegistry 相同延後到第一次使用時才建立
+        manager.tools._register(ToolSpec(name, tool_class.__name__, lambda cls=tool_class: cls, "module"))
+    manager.cache = ToolResultCache(persist=False)
+    return manager
+
+def test_run_tool_timeout():
+    """超過期限時返回逾時說明，不等工具執行完"""
+    original = _with_config(TOOL_TIMEOUTS={"test_sleep": 0.2})
+    try:
+        manager = _make_manager(SleepTool)
+        result = manager.run_tool("test_sleep", "1")
+
+        assert result["status"] == "timeout"
+        assert result["output"].startswith("⏰")
+        assert result["elapsed_ms"] < 800
+        assert manager.get_metrics()["test_sleep"]["timeout"] == 1
+    finally:
+        _with_config(**original)
+
+def test_cancelled_before_start():
+    """排隊期間已逾時的呼叫不會執行"""
+    original = _with_config(TOOL_TIMEOUTS={"test_sleep": 0.2}, TOOL_MAX_WORKERS_PER_TOOL=1)
+    try:
+        manager = _make_manager(SleepTool)
+        results = manager.execute_tools([("test_sleep", "0.5"), ("test_sleep", "0")])
+        time.sleep(0.5)
+
+        assert all(result.startswith("⏰") for result in results)
+        assert manager.tools["test_sleep"].executed == ["0.5"]
+    finally:
+        _with_config(**original)
+
+def test_execute_tools_order_and_partial_timeout():
+    """結果依呼叫順序返回；逾時的工具不影響其他工具，延遲也不計入其他工具"""
+    original = _with_config(TOOL_TIMEOUTS={"test_sleep": 0.3, "test_fast": 5})
+    try:
+        manager = _make_manager(SleepTool, FastTool)
+        results = manager.execute_tools([("test_sleep", "1"), ("test_fast", "0"), ("not_a_tool", "x"), ("test_fast", "0.05")])
+
+        assert results[0].startswith("⏰")
+        assert results[1] == "完成 0"
+        assert results[2].startswith("❌")
+        assert results[3] == "完成 0.05"
+        # 兩個 test_fast 呼叫在 test_sleep 逾時之後才收集，延遲仍為各自的執行時間
+        assert manager.get_metrics()["test_fast"]["max_ms"] < 250
+    finally:
+        _with_config(**original)
+
+class BrokenTool(SleepTool):
+    """初始化失敗的工具（例如缺少依賴套件）"""
+
+    def __init__(self):
+        raise ImportError("No module named 'missing_dependency'")
+
+    def get_name(self) -> str:
+        return "test_broken"
+
+def test_load_failure_returns_error():
+    """工具載入失敗時返回錯誤結果，不拋出例外，也不影響同一批的其他工具"""
+    manager = _make_manager(BrokenTool, FastTool)
+    result = manager.run_tool("test_broken", "0")
+    results = manager.execute_tools([("test_broken", "0"), ("test_fast", "0")])
+
+    assert result["status"] == "error"
+    assert "missing_dependency" in result["output"]
+    assert results[0].startswith("❌")
+    assert results[1] == "完成 0"
+    assert manager.get_metrics()["test_broken"]["error"] == 2
+
+def test_tool_order():
+    """工具依 TOOL_ORDER 排列（Agent 提示詞中的順序）"""
+    tools = ToolManager().list_tools()
+    listed = [name for name in config.TOOL_ORDER if name in tools]
+    assert tools[:len(listed)] == listed
+
+class CountingTool(SleepTool):
+    """可快取的工具；查詢以 fail 開頭時返回錯誤訊息"""
+
+    cache_ttl = 60
+
+    def get_name(self) -> str:
+        return "test_cached"
+
+    def execute(self, query: str) -> str:
+        self.executed.append(query)
+        if query.startswith("fail"):
+            return f"❌ 暫時無法查詢 {query}"
+        return f"結果 {query}"
+
+def test_cache_hit_miss_and_expiry():
+    """相同查詢在快取期間直接返回，過期後重新執行"""
+    original = _with_config(TOOL_CACHE_ENABLED=True, TOOL_CACHE_TTLS={"test_cached": 0.3})
+    try:
+        manager = _make_manager(CountingTool)
+        first = manager.run_tool("test_cached", "SPC  A")
+        second = manager.run_tool("test_cached", "SPC A")
+        other = manager.run_tool("test_cached", "SPC B")
+
+        assert "cached" not in first
+        assert second["cached"] and second["output"] == "結果 SPC  A"
+        assert "cached" not in other
+        assert manager.tools["test_cached"].executed == ["SPC  A", "SPC B"]
+
+        time.sleep(0.4)
+        expired = manager.run_tool("test_cached", "SPC A")
+        assert "cached" not in expired
+        assert manager.tools["test_cached"].executed == ["SPC  A", "SPC B", "SPC A"]
+        assert manager.get_metrics()["test_cached"]["cached"] == 1
+    finally:
+        _with_config(**original)
+
+def test_cache_rejects_uncacheable_result():
+    """is_cacheable_result 拒絕的結果（預設為 ❌/⚠️）不寫入快取"""
+    original = _with_config(TOOL_CACHE_ENABLED=True, TOOL_CACHE_TTLS={})
+    try:
+        manager = _make_manager(CountingTool)
+        manager.run_tool("test_cached", "fail")
+        result = manager.run_tool("test_cached", "fail")
+
+        assert "cached" not in result
+        assert manager.tools["test_cached"].executed == ["fail", "fail"]
+    finally:
+        _with_config(**original)
+
+def test_ip_edc_config_cached_only_after_scan():
+    """配置目錄不存在時不快取；實際掃描後找不到配置的結果可快取"""
+    original = _with_config(TOOL_CACHE_ENABLED=True, TOOL_CACHE_TTLS={})
+    try:
+        manager = _make_manager()
+        tool_inst = manager.tools["ip_edc_config_check"]
+        with tempfile.TemporaryDirectory() as base_path:
+            tool_inst.config_base_path = os.path.join(base_path, "missing")
+            missing = manager.run_tool("ip_edc_config_check", "TFT6 10.99.3.111")
+            assert missing["output"].startswith("⚠️")
+            assert not tool_inst.is_cacheable_result(missing["output"])
+            assert "cached" not in manager.run_tool("ip_edc_config_check", "TFT6 10.99.3.111")
+
+            os.makedirs(os.path.join(base_path, "TFT6"))
+            tool_inst.config_base_path = base_path
+            not_found = manager.run_tool("ip_edc_config_check", "TFT6 10.99.3.112")
+            assert not_found["output"].startswith("❌ 未找到")
+            assert manager.run_tool("ip_edc_config_check", "tft6 10.99.3.112").get("cached")
+
+            assert not tool_inst.is_cacheable_result("❌ 查詢過程中發生錯誤：timeout")
+    finally:
+        _with_config(**original)
+
 if __name__ == "__main__":
     test_all_tools()
     test_langchain_integration()
+    test_run_tool_timeout()
+    test_cancelled_before_start()
+    test_execute_tools_order_and_partial_timeout()
+    test_load_failure_returns_error()
+    test_tool_order()
+    test_cache_hit_miss_and_expiry()
+    test_cache_rejects_uncacheable_result()
+    test_ip_edc_config_cached_only_after_scan()
+    print("✅ 工具執行期限測試通過！")
@@ -1,14 +1,28 @@
 """
 工具模組初始化文件
+工具類別在第一次存取時才匯入（例如 from tools import SPCTool），
+匯入 tools 套件本身不會載入任何工具；ToolManager 另行探索 tools/ 目錄中的所有工具
 """
 
-from .base_tool import BaseTool
-from .time_tool import TimeTool
-from .calculation_tool import CalculationTool
-from .spc_tool import SPCTool
-from .edc_query_tool import EDCQueryTool
-from .edc_format_tool import EDCFormatTool
-from .tool_manager import ToolManager
+import importlib
+
+_EXPORTS = {
+    'BaseTool': '.base_tool',
+    'TimeTool': '.time_tool',
+    'CalculationTool': '.calculation_tool',
+    'SPCTool': '.spc_tool',
+    'EDCQueryTool': '.edc_query_tool',
+    'EDCFormatTool': '.edc_format_tool',
+    'ToolManager': '.tool_manager',
+}
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
 
 __all__ = [
     'BaseTool',
@@ -2,12 +2,59 @@
 工具基類 - 定義工具的標準介面
 """
 
+import time
+import threading
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from contextvars import ContextVar
+from typing import Dict, Any, Optional
+
+class ToolCancelledError(BaseException):
+    """
+    工具已被 ToolManager 取消（超過執行期限）
+    與 asyncio.CancelledError 相同繼承 BaseException，不會被工具內的 except Exception 吞掉
+    """
+
+class CancellationToken:
+    """單次工具執行的取消旗標與期限"""
+
+    def __init__(self, timeout: float):
+        self.deadline = time.monotonic() + timeout
+        self.finished: Optional[float] = None  # 工具實際結束執行的時間（由 ToolManager 記錄，用於計算延遲）
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set() or time.monotonic() >= self.deadline
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+# 目前執行緒正在執行的工具的取消旗標（由 ToolManager 設定）
+_current_token: ContextVar[Optional[CancellationToken]] = ContextVar("tool_cancellation_token", default=None)
+
+def check_cancelled():
+    """協作式取消檢查點：長時間工具在每個外部呼叫之前呼叫，已逾時則拋出 ToolCancelledError"""
+    token = _current_token.get()
+    if token is not None and token.cancelled:
+        raise ToolCancelledError()
+
+def remaining_time(default: float) -> float:
+    """外部呼叫可用的逾時秒數：不超過 default，也不超過工具剩餘的執行期限"""
+    token = _current_token.get()
+    if token is None:
+        return default
+    return max(min(default, token.remaining()), 0.1)
 
 class BaseTool(ABC):
     """所有工具的基類"""
     
+    # 結果快取策略（由 ToolManager 執行）：相同 cache_key 的查詢在 cache_ttl 秒內直接返回先前的結果
+    # None 表示不快取（結果隨時間或外部狀態改變的工具，例如時間查詢）
+    cache_ttl: Optional[float] = None
+    
     def __init__(self):
         self.name = self.get_name()
         self.description = self.get_description()
@@ -27,6 +74,14 @@ class BaseTool(ABC):
         """執行工具邏輯"""
         pass
     
+    def cache_key(self, query: str) -> Optional[str]:
+        """快取鍵：預設為合併空白後的查詢；返回 None 表示此次查詢不使用快取"""
+        return " ".join(query.split())
+    
+    def is_cacheable_result(self, result: str) -> bool:
+        """結果是否可快取：預設不快取錯誤與警告（通常是暫時性失敗）"""
+        return not result.lstrip().startswith(("❌", "⚠️"))
+    
     def __call__(self, query: str) -> str:
         """讓工具可以像函數一樣被調用"""
         try:
@@ -15,6 +15,8 @@ from tools.base_tool import BaseTool
 class EDCFormatTool(BaseTool):
     """EDC XML 格式檢查工具"""
     
+    cache_ttl = 3600  # 結果只取決於輸入內容
+    
     def get_name(self) -> str:
         return "edc_format_check"
     
@@ -24,6 +26,10 @@ class EDCFormatTool(BaseTool):
         當用戶詢問「EDC檔案格式哪裡錯了」或需要驗證 EDC XML 格式時使用此工具。
         可以直接處理用戶貼上的 XML 內容進行驗證。"""
     
+    def is_cacheable_result(self, result: str) -> bool:
+        # 格式錯誤的檢查報告（❌ 開頭）同樣只取決於輸入
+        return True
+    
     def execute(self, query: str) -> str:
         """執行 EDC 格式檢查"""
         query_upper = query.upper()
@@ -7,11 +7,16 @@ import xml.etree.ElementTree as ET
 from typing import Dict, Any, List, Optional
 import glob
 import config
-from tools.base_tool import BaseTool
+from tools.base_tool import BaseTool, check_cancelled
+
+# 完整掃描後找不到配置的結果開頭（可快取）
+NOT_FOUND_PREFIX = "❌ 未找到"
 
 class IPEDCConfigTool(BaseTool):
     """查詢 IP 的 EDC 配置工具"""
     
+    cache_ttl = 600  # 配置檔很少變動，搜尋整個目錄卻很慢
+    
     def __init__(self):
         super().__init__()
         # 從 config.py 讀取配置路徑，預設為 D:\Git_Code\GETEDCFILE_CONFIG
@@ -28,6 +33,15 @@ class IPEDCConfigTool(BaseTool):
         3. 機台查詢：廠區名 機台名稱 (例如：TFT6 TPRB0100)
         4. 機台查詢：機台名稱 (例如：TPRB0100)"""
     
+    def cache_key(self, query: str) -> Optional[str]:
+        """廠區與機台名稱不分大小寫"""
+        return " ".join(query.upper().split())
+    
+    def is_cacheable_result(self, result: str) -> bool:
+        # 完整掃描配置目錄後找不到也是有效結果（設定檔更新後最多 cache_ttl 秒生效）；
+        # 配置目錄無法讀取（⚠️）與其他錯誤（❌）依預設不快取
+        return super().is_cacheable_result(result) or result.startswith(NOT_FOUND_PREFIX)
+    
     def execute(self, query: str) -> str:
         """執行 IP 或機台名稱 EDC 配置查詢"""
         try:
@@ -71,10 +85,13 @@ class IPEDCConfigTool(BaseTool):
             # 搜尋配置
             results = self._search_config(search_value, search_type, factory)
             
+            if results is None:
+                return f"⚠️ 無法讀取配置目錄 {self.config_base_path}，請確認路徑存在且可存取後再查詢"
+            
             if not results:
                 available_factories = self._get_available_factories()
                 search_desc = "IP" if search_type == "ip" else "機台名稱"
-                return f"""❌ 未找到 {search_desc} {search_value} 的 EDC 配置
+                return f"""{NOT_FOUND_PREFIX} {search_desc} {search_value} 的 EDC 配置
 
 📁 可用廠區：{', '.join(available_factories) if available_factories else '無'}
 💡 請確認：
@@ -117,13 +134,13 @@ class IPEDCConfigTool(BaseTool):
         except:
             return []
     
-    def _search_config(self, search_value: str, search_type: str, factory: Optional[str] = None) -> List[Dict[str, Any]]:
-        """搜尋 IP 或機台名稱配置"""
+    def _search_config(self, search_value: str, search_type: str, factory: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """搜尋 IP 或機台名稱配置；配置目錄不存在或搜尋失敗時返回 None（結果不完整，不可視為找不到）"""
         results = []
         
         try:
             if not os.path.exists(self.config_base_path):
-                return results
+                return None
             
             # 確定搜尋路徑
             search_paths = []
@@ -145,6 +162,7 @@ class IPEDCConfigTool(BaseTool):
                 xml_files = glob.glob(os.path.join(factory_path, "**", "*.xml"), recursive=True)
                 
                 for xml_file in xml_files:
+                    check_cancelled()  # XML 檔案很多時搜尋可能超過執行期限
                     try:
                         config_info = self._parse_xml_config(xml_file, search_value, search_type)
                         if config_info:
@@ -162,7 +180,7 @@ class IPEDCConfigTool(BaseTool):
             
         except Exception as e:
             print(f"搜尋配置錯誤: {e}")
-            return results
+            return None
     
     def _parse_xml_config(self, xml_file: str, search_value: str, search_type: str) -> Optional[Dict[str, Any]]:
         """解析 XML 配置檔案"""
@@ -231,7 +249,7 @@ class IPEDCConfigTool(BaseTool):
         """格式化查詢結果"""
         if not results:
             search_desc = "IP" if search_type == "ip" else "機台名稱"
-            return f"❌ 未找到 {search_desc} {search_value} 的 EDC 配置"
+            return f"{NOT_FOUND_PREFIX} {search_desc} {search_value} 的 EDC 配置"
         
         search_desc = "IP" if search_type == "ip" else "機台名稱"
         output = [f"✅ 找到 {search_desc} {search_value} 的 EDC 配置：\n"]
@@ -60,12 +60,18 @@ from urllib.parse import quote
 
 # 將專案根目錄加入 sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from tools.base_tool import BaseTool
+from tools.base_tool import BaseTool, check_cancelled, remaining_time
 from apis.universal_query_api import execute_query
 
 class SPCTool(BaseTool):
     """SPC 系統診斷工具"""
     
+    # 同一筆上報（五個條件相同）的診斷在短時間內不會改變；資料可能稍後才進 CHART，所以期限較短
+    cache_ttl = 300
+    
+    # 外部系統暫時性失敗的訊息，包含這些訊息的診斷結果不快取
+    _TRANSIENT_MARKERS = ("API請求失敗", "網路請求錯誤", "查詢錯誤", "查詢失敗", "發生錯誤")
+    
     def __init__(self):
         super().__init__()
         self.factory_map = {
@@ -182,6 +188,16 @@ class SPCTool(BaseTool):
 - 設備ID  
 - CHART ID"""
 
+    def cache_key(self, query: str) -> Optional[str]:
+        """以提取出的五個條件作為快取鍵（同一筆資料不同寫法共用結果）"""
+        info = self._extract_spc_info(query)
+        if self._check_required_spc_conditions(info):
+            return " ".join(query.split())
+        return "|".join(str(info[field]) for field in ("factory", "timestamp", "glass_id", "equipment_id", "chart_id"))
+    
+    def is_cacheable_result(self, result: str) -> bool:
+        return not any(marker in result for marker in self._TRANSIENT_MARKERS)
+    
     def _extract_spc_info(self, query: str) -> Dict[str, Any]:
         """從查詢中提取 SPC 相關資訊"""
         info = {
@@ -542,7 +558,8 @@ class SPCTool(BaseTool):
             messages.append(f"   時間範圍: {from_dt} ~ {to_dt}")
             
             # 步驟4: 實際發送 HTTP 請求
-            response1 = requests.get(url1, params=params1, timeout=30)
+            check_cancelled()
+            response1 = requests.get(url1, params=params1, timeout=remaining_time(30))
             if response1.status_code != 200:
                 messages.append(f"❌ API請求失敗: HTTP {response1.status_code}")
                 return {"success": False, "messages": messages}
@@ -580,7 +597,8 @@ class SPCTool(BaseTool):
             messages.append(f"   URL: {url1}")
             messages.append(f"   參數: pageSize=1, fromDT={from_dt}, toDT={to_dt}")
             
-            response2 = requests.get(url1, params=params2, timeout=30)
+            check_cancelled()
+            response2 = requests.get(url1, params=params2, timeout=remaining_time(30))
             if response2.status_code != 200:
                 messages.append(f"❌ 步驟6 API請求失敗: HTTP {response2.status_code}")
                 return {"success": False, "messages": messages}
@@ -595,7 +613,8 @@ class SPCTool(BaseTool):
             messages.append(f"🔍 步驟7: 查詢詳細TRX資料...")
             messages.append(f"   URL: {url3}")
             
-            response3 = requests.get(url3, params=params3, timeout=30)
+            check_cancelled()
+            response3 = requests.get(url3, params=params3, timeout=remaining_time(30))
             if response3.status_code != 200:
                 messages.append(f"❌ 步驟7 API請求失敗: HTTP {response3.status_code}")
                 return {"success": False, "messages": messages}
@@ -685,6 +704,7 @@ class SPCTool(BaseTool):
         
         try:
             # 使用萬用查詢 API
+            check_cancelled()
             result = execute_query(sql, "SPC", factory, limit=10)
             
             if result['success']:
@@ -733,6 +753,7 @@ class SPCTool(BaseTool):
         
         try:
             # 使用萬用查詢 API
+            check_cancelled()
             result = execute_query(sql, "MES", factory, limit=10)
             
             if result['success']:
@@ -798,6 +819,7 @@ class SPCTool(BaseTool):
                 
                 try:
                     # 使用萬用查詢 API 查詢符合條件的資料，不限制筆數
+                    check_cancelled()
                     matching_result = execute_query(sql_with_conditions, "MES", factory, limit=None)
                     
                     if matching_result['success']:
@@ -1032,6 +1054,7 @@ class SPCTool(BaseTool):
                 sql = f"SELECT * FROM {mes_schema}.{mlitem_table} WHERE {where_clause}"
                 
                 try:
+                    check_cancelled()
                     result = execute_query(sql, "MES", factory, limit=1)
                     if result['success'] and result['row_count'] > 0:
                         analysis.append(f"   ✅ DATA_GROUP '{data_group}' 在MES DB中存在")
@@ -0,0 +1,137 @@
+"""
+工具結果快取 - 依各工具宣告的快取策略（BaseTool.cache_ttl、cache_key）重用相同輸入的結果
+記憶體 LRU（程序內所有對話共用），可選擇以 SQLite 保存到磁碟（重新啟動後仍可使用）
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+import config
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tool_results (
+    tool TEXT NOT NULL,
+    key TEXT NOT NULL,
+    output TEXT NOT NULL,
+    expires REAL NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (tool, key)
+);
+CREATE INDEX IF NOT EXISTS idx_tool_results_last_access ON tool_results(last_access);
+"""
+
+class ToolResultCache:
+    """工具結果快取（記憶體 LRU + 可選的 SQLite）"""
+
+    def __init__(self, max_entries: Optional[int] = None, persist: Optional[bool] = None, db_path: Optional[str] = None):
+        self.max_entries = max_entries or getattr(config, "TOOL_CACHE_MAX_ENTRIES", 1000)
+        self.persist = getattr(config, "TOOL_CACHE_PERSIST", False) if persist is None else persist
+
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, float]]" = OrderedDict()  # (工具, 鍵) -> (輸出, 到期時間)
+        self._lock = threading.RLock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+        self._conn = None
+        if self.persist:
+            self.db_path = db_path or os.path.join(config.MODEL_PATH, "tool_cache.db")
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+            self._conn.commit()
+
+    def _count(self, tool: str, field: str):
+        stats = self._stats.setdefault(tool, {"hits": 0, "misses": 0})
+        stats[field] += 1
+
+    def get(self, tool: str, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get((tool, key))
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end((tool, key))
+                self._count(tool, "hits")
+                return entry[0]
+            if entry is not None:
+                del self._entries[(tool, key)]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT output, expires FROM tool_results WHERE tool = ? AND key = ? AND expires > ?", (tool, key, now)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute("UPDATE tool_results SET last_access = ? WHERE tool = ? AND key = ?", (now, tool, key))
+                    self._conn.commit()
+                    self._remember(tool, key, row[0], row[1])
+                    self._count(tool, "hits")
+                    return row[0]
+
+            self._count(tool, "misses")
+            return None
+
+    def _remember(self, tool: str, key: str, output: str, expires: float):
+        self._entries[(tool, key)] = (output, expires)
+        self._entries.move_to_end((tool, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def put(self, tool: str, key: str, output: str, ttl: float):
+        now = time.time()
+        expires = now + ttl
+        with self._lock:
+            self._remember(tool, key, output, expires)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO tool_results (tool, key, output, expires, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (tool, key, output, expires, now)
+                )
+                self._evict(now)
+                self._conn.commit()
+
+    def _evict(self, now: float):
+        """刪除磁碟上過期的項目，超過筆數上限時刪除最久未使用的項目"""
+        self._conn.execute("DELETE FROM tool_results WHERE expires <= ?", (now,))
+        excess = self._conn.execute("SELECT COUNT(*) FROM tool_results").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM tool_results WHERE rowid IN (SELECT rowid FROM tool_results ORDER BY last_access LIMIT ?)", (excess,)
+            )
+
+    def clear(self, tool: Optional[str] = None):
+        """清除快取（指定工具時只清除該工具，例如外部設定檔更新後）"""
+        with self._lock:
+            for cache_key in [k for k in self._entries if tool is None or k[0] == tool]:
+                del self._entries[cache_key]
+            if self._conn is not None:
+                if tool is None:
+                    self._conn.execute("DELETE FROM tool_results")
+                else:
+                    self._conn.execute("DELETE FROM tool_results WHERE tool = ?", (tool,))
+                self._conn.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各工具的命中率與目前快取筆數"""
+        with self._lock:
+            tools = {}
+            for tool, stats in self._stats.items():
+                lookups = stats["hits"] + stats["misses"]
+                tools[tool] = {**stats, "hit_rate": round(stats["hits"] / lookups, 3) if lookups else 0.0}
+            return {"entries": len(self._entries), "persist": self.persist, "tools": tools}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_tool_cache() -> ToolResultCache:
+    """獲取工具結果快取單例"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ToolResultCache()
+    return _cache
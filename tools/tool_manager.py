@@ -4,21 +4,22 @@
 
 import sys
 import os
-from typing import List, Dict, Any
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, Tuple, Optional
+import numpy as np
 from langchain_core.tools import tool, StructuredTool
 from pydantic import BaseModel, Field
 
 # 將專案根目錄加入 sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
 
-# 導入所有工具
-from tools.time_tool import TimeTool
-from tools.calculation_tool import CalculationTool
-from tools.spc_tool import SPCTool
-from tools.edc_query_tool import EDCQueryTool
-from tools.edc_format_tool import EDCFormatTool
-from tools.ip_edc_config_tool import IPEDCConfigTool
-from tools.spc_detail_viewer_tool import SPCDetailViewerTool
+from tools.base_tool import CancellationToken, ToolCancelledError, _current_token
+from tools.tool_registry import ToolRegistry
+from tools.tool_cache import get_tool_cache
 
 class ToolInput(BaseModel):
     query: str = Field(description="用戶的查詢內容")
@@ -29,51 +30,40 @@ class ToolManager:
     def __init__(self):
         """初始化工具管理器"""
         self.tools = self._load_all_tools()
-        print(f"🔧 工具管理器已載入 {len(self.tools)} 個工具")
+        # 每個工具各自的執行緒池（隔離：某個外部系統無回應時只佔用該工具的執行緒）
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        self._executors_lock = threading.Lock()
+        # 每個工具的執行延遲與結果統計
+        self._metrics: Dict[str, Dict[str, Any]] = {}
+        self._metrics_lock = threading.Lock()
+        # 載入失敗的工具與錯誤訊息（每個工具只記錄一次日誌）
+        self._load_errors: Dict[str, str] = {}
+        # 工具結果快取（程序內所有對話共用），依各工具的 cache_ttl / cache_key 策略使用
+        self.cache = get_tool_cache()
+        print(f"🔧 工具管理器已註冊 {len(self.tools)} 個工具（探索 {self.tools.discovery_ms} ms，首次使用時載入）")
     
-    def _load_all_tools(self) -> Dict[str, Any]:
-        """載入所有工具實例"""
-        tools = {}
-        
-        # 創建工具實例
-        time_tool = TimeTool()
-        calculation_tool = CalculationTool()
-        spc_tool = SPCTool()
-        edc_query_tool = EDCQueryTool()
-        edc_format_tool = EDCFormatTool()
-        ip_edc_config_tool = IPEDCConfigTool()
-        spc_detail_viewer_tool = SPCDetailViewerTool()
-        
-        # 註冊工具
-        tools[time_tool.get_name()] = time_tool
-        tools[calculation_tool.get_name()] = calculation_tool
-        tools[spc_tool.get_name()] = spc_tool
-        tools[edc_query_tool.get_name()] = edc_query_tool
-        tools[edc_format_tool.get_name()] = edc_format_tool
-        tools[ip_edc_config_tool.get_name()] = ip_edc_config_tool
-        tools[spc_detail_viewer_tool.get_name()] = spc_detail_viewer_tool
-        
-        return tools
+    def _load_all_tools(self) -> ToolRegistry:
+        """探索所有工具（tools/ 目錄與 entry points），實例在第一次使用時才建立"""
+        return ToolRegistry()
     
     def get_langchain_tools(self) -> List:
         """轉換為 LangChain 工具格式"""
         langchain_tools = []
         
-        for tool_name, tool_instance in self.tools.items():
+        for tool_name in self.tools:
             # 創建一個包裝函數來確保完整輸出
-            def create_tool_wrapper(tool_inst):
+            def create_tool_wrapper(name):
                 def wrapper(query: str) -> str:
-                    result = tool_inst.execute(query)
-                    # 確保回傳完整結果，不截斷
-                    return str(result)
+                    # 經由 ToolManager 執行（套用執行期限並在第一次呼叫時載入工具），確保回傳完整結果，不截斷
+                    return self.execute_tool(name, query)
                 return wrapper
             
             # 使用 StructuredTool 創建 LangChain 工具
             langchain_tool = StructuredTool(
-                name=tool_instance.get_name(),
-                description=tool_instance.get_description(),
+                name=tool_name,
+                description=self.tools.get_description(tool_name),
                 args_schema=ToolInput,
-                func=create_tool_wrapper(tool_instance),
+                func=create_tool_wrapper(tool_name),
                 return_direct=False  # 確保不直接返回，讓 Agent 可以進一步處理
             )
             langchain_tools.append(langchain_tool)
@@ -81,25 +71,203 @@ class ToolManager:
         return langchain_tools
     
     def get_tool_info(self) -> Dict[str, Dict[str, str]]:
-        """獲取所有工具的資訊"""
+        """獲取所有工具的資訊（不會載入工具）"""
         tool_info = {}
         
-        for tool_name, tool_instance in self.tools.items():
+        for tool_name in self.tools:
+            spec = self.tools.get_spec(tool_name)
             tool_info[tool_name] = {
-                "name": tool_instance.get_name(),
-                "description": tool_instance.get_description(),
-                "class": tool_instance.__class__.__name__
+                "name": tool_name,
+                "description": self.tools.get_description(tool_name),
+                "class": spec.class_name
             }
         
         return tool_info
     
+    def get_timeout(self, tool_name: str) -> float:
+        """工具的執行時間上限（秒）"""
+        return getattr(config, "TOOL_TIMEOUTS", {}).get(tool_name, getattr(config, "TOOL_TIMEOUT", 60))
+    
+    def _get_executor(self, tool_name: str) -> ThreadPoolExecutor:
+        executor = self._executors.get(tool_name)
+        if executor is None:
+            with self._executors_lock:
+                executor = self._executors.get(tool_name)
+                if executor is None:
+                    executor = ThreadPoolExecutor(
+                        max_workers=getattr(config, "TOOL_MAX_WORKERS_PER_TOOL", 4),
+                        thread_name_prefix=f"tool-{tool_name}"
+                    )
+                    self._executors[tool_name] = executor
+        return executor
+    
+    def _run_with_token(self, tool_inst, query: str, token: CancellationToken) -> str:
+        """在工具執行緒中執行，讓工具內的 check_cancelled()/remaining_time() 取得此次執行的期限"""
+        if token.cancelled:
+            # 排隊期間已逾時，不再執行
+            raise ToolCancelledError()
+        context_token = _current_token.set(token)
+        try:
+            return str(tool_inst.execute(query))
+        finally:
+            token.finished = time.monotonic()
+            _current_token.reset(context_token)
+    
+    def _submit(self, tool_name: str, query: str) -> Tuple[Future, CancellationToken, float]:
+        """送出工具呼叫，返回 (future, 取消旗標, 送出時間)；延遲從各呼叫自己的送出時間起算"""
+        started = time.monotonic()
+        token = CancellationToken(self.get_timeout(tool_name))
+        future = self._get_executor(tool_name).submit(self._run_with_token, self.tools[tool_name], query, token)
+        return future, token, started
+    
+    def _collect(self, tool_name: str, future: Future, token: CancellationToken, started: float) -> Dict[str, Any]:
+        """等待工具結果直到期限；逾時時取消（工具在下一個檢查點結束）並返回說明訊息"""
+        timeout = self.get_timeout(tool_name)
+        try:
+            output = future.result(timeout=token.remaining())
+            status = "ok"
+        except (FutureTimeoutError, ToolCancelledError):
+            token.cancel()
+            future.cancel()  # 尚在排隊時直接移除
+            status = "timeout"
+            output = (f"⏰ 工具 {tool_name} 執行逾時（超過 {timeout:g} 秒），已取消。"
+                      f"外部系統可能暫時無回應，請稍後重試；其他工具的結果不受影響。")
+            print(f"⏰ 工具 {tool_name} 執行逾時（{timeout:g} 秒），已取消")
+        except Exception as e:
+            status = "error"
+            output = f"❌ {tool_name} 執行錯誤：{str(e)}"
+        
+        # 已完成的工具以實際結束時間計算，不含等待其他工具結果的時間
+        finished = token.finished if status != "timeout" and token.finished is not None else time.monotonic()
+        elapsed_ms = (finished - started) * 1000
+        self._record(tool_name, status, elapsed_ms)
+        return {"tool": tool_name, "status": status, "output": output, "elapsed_ms": round(elapsed_ms, 1)}
+    
+    def _lookup_cache(self, tool_name: str, query: str) -> Tuple[Optional[str], float, Optional[Dict[str, Any]]]:
+        """
+        依工具的快取策略查詢快取
+        
+        Returns:
+            (快取鍵, 快取秒數, 命中時的結果)；工具不使用快取時快取鍵為 None
+        """
+        if not getattr(config, "TOOL_CACHE_ENABLED", True):
+            return None, 0, None
+        tool_inst = self.tools[tool_name]
+        ttl = getattr(config, "TOOL_CACHE_TTLS", {}).get(tool_name, tool_inst.cache_ttl)
+        key = tool_inst.cache_key(query) if ttl else None
+        if key is None:
+            return None, 0, None
+        
+        output = self.cache.get(tool_name, key)
+        if output is None:
+            return key, ttl, None
+        self._record(tool_name, "cached")
+        return key, ttl, {"tool": tool_name, "status": "ok", "output": output, "elapsed_ms": 0.0, "cached": True}
+    
+    def _store_cache(self, tool_name: str, key: Optional[str], ttl: float, result: Dict[str, Any]):
+        if key is not None and result["status"] == "ok" and self.tools[tool_name].is_cacheable_result(result["output"]):
+            self.cache.put(tool_name, key, result["output"], ttl)
+    
+    def _load_failed(self, tool_name: str, error: Exception) -> Dict[str, Any]:
+        """工具匯入或初始化失敗（第一次使用時才載入）：記錄一次日誌並返回錯誤結果，不中斷 Agent"""
+        with self._metrics_lock:
+            first = tool_name not in self._load_errors
+            self._load_errors[tool_name] = str(error)
+        if first:
+            print(f"❌ 工具 {tool_name} 載入失敗: {error}")
+        self._record(tool_name, "error")
+        return {"tool": tool_name, "status": "error", "output": f"❌ 無法載入工具 {tool_name}：{str(error)}", "elapsed_ms": 0.0}
+    
+    def run_tool(self, tool_name: str, query: str) -> Dict[str, Any]:
+        """
+        在工具的執行緒池中執行，套用執行期限與結果快取
+        
+        Returns:
+            {"tool", "status": "ok"|"timeout"|"error"|"not_found", "output", "elapsed_ms"}；快取命中時另有 "cached": True
+        """
+        if tool_name not in self.tools:
+            return {"tool": tool_name, "status": "not_found", "output": f"❌ 找不到工具: {tool_name}", "elapsed_ms": 0.0}
+        try:
+            # 查詢快取與送出都會在第一次使用時載入工具
+            key, ttl, cached = self._lookup_cache(tool_name, query)
+            if cached is not None:
+                return cached
+            future, token, started = self._submit(tool_name, query)
+        except Exception as e:
+            return self._load_failed(tool_name, e)
+        result = self._collect(tool_name, future, token, started)
+        self._store_cache(tool_name, key, ttl, result)
+        return result
+    
     def execute_tool(self, tool_name: str, query: str) -> str:
         """直接執行指定工具"""
-        if tool_name in self.tools:
-            return self.tools[tool_name].execute(query)
-        else:
-            return f"❌ 找不到工具: {tool_name}"
+        return self.run_tool(tool_name, query)["output"]
+    
+    def execute_tools(self, calls: List[Tuple[str, str]]) -> List[str]:
+        """
+        並行執行多個工具呼叫，每個呼叫各自套用執行期限與結果快取
+        
+        Args:
+            calls: [(工具名稱, 輸入), ...]
+            
+        Returns:
+            與 calls 順序相同的工具輸出；逾時或執行錯誤時為說明訊息，不中斷其他工具
+        """
+        pending = []
+        for name, query in calls:
+            if name not in self.tools:
+                pending.append(f"❌ 找不到工具: {name}")
+                continue
+            try:
+                key, ttl, cached = self._lookup_cache(name, query)
+                pending.append(cached["output"] if cached is not None else (key, ttl) + self._submit(name, query))
+            except Exception as e:
+                pending.append(self._load_failed(name, e)["output"])
+        
+        results = []
+        for (name, _), item in zip(calls, pending):
+            if isinstance(item, str):
+                results.append(item)
+                continue
+            key, ttl, future, token, started = item
+            # 期限與延遲都從各呼叫送出時起算，依序等待不會讓後面的工具多等，也不會計入前面工具的時間
+            result = self._collect(name, future, token, started)
+            self._store_cache(name, key, ttl, result)
+            results.append(result["output"])
+        return results
+    
+    def _record(self, tool_name: str, status: str, elapsed_ms: Optional[float] = None):
+        with self._metrics_lock:
+            metrics = self._metrics.setdefault(tool_name, {
+                "latencies": deque(maxlen=500), "ok": 0, "timeout": 0, "error": 0, "cached": 0
+            })
+            if elapsed_ms is not None:
+                metrics["latencies"].append(elapsed_ms)
+            metrics[status] += 1
+    
+    def get_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """每個工具的執行次數、快取命中、逾時與錯誤次數，以及實際執行的延遲分佈（最近 500 次）"""
+        with self._metrics_lock:
+            result = {}
+            for tool_name, metrics in self._metrics.items():
+                values = np.array(metrics["latencies"]) if metrics["latencies"] else np.zeros(1)
+                result[tool_name] = {
+                    "count": metrics["ok"] + metrics["timeout"] + metrics["error"] + metrics["cached"],
+                    "ok": metrics["ok"],
+                    "cached": metrics["cached"],
+                    "timeout": metrics["timeout"],
+                    "error": metrics["error"],
+                    "timeout_s": self.get_timeout(tool_name),
+                    "p50_ms": round(float(np.percentile(values, 50)), 1),
+                    "p95_ms": round(float(np.percentile(values, 95)), 1),
+                    "max_ms": round(float(values.max()), 1),
+                }
+            return result
     
     def list_tools(self) -> List[str]:
         """列出所有可用工具"""
         return list(self.tools.keys())
+    
+    def get_load_stats(self) -> Dict[str, Any]:
+        """工具探索與載入時間"""
+        return self.tools.get_load_stats()
@@ -0,0 +1,225 @@
+"""
+工具註冊表 - 探索可用工具並在第一次使用時才匯入與建立實例
+- 掃描 tools/ 目錄：以 AST 找出繼承 BaseTool 的類別及其名稱、描述（不匯入模組）
+- Python entry points（群組 TOOL_ENTRY_POINT_GROUP）：外部套件提供的工具
+新增工具只要在 tools/ 建立檔案（或在套件中宣告 entry point），不需修改 ToolManager
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ast
+import time
+import importlib
+import threading
+from collections.abc import Mapping
+from typing import Dict, Any, List, Optional, Callable, Iterator
+import config
+
+# tools/ 中不含工具類別的模組
+_NON_TOOL_MODULES = {"__init__", "base_tool", "tool_manager", "tool_registry", "tool_cache"}
+
+class ToolSpec:
+    """工具的探索結果：名稱、描述與建立實例的方式"""
+
+    def __init__(self, name: str, class_name: str, loader: Callable[[], type], source: str,
+                 module: Optional[str] = None, description: Optional[str] = None):
+        self.name = name
+        self.class_name = class_name
+        self.loader = loader            # 返回工具類別（匯入模組或載入 entry point）
+        self.source = source            # "module" 或 "entry_point"
+        self.module = module
+        self.description = description  # 無法靜態取得時為 None，建立實例後補上
+
+def _literal(node: ast.AST, class_attrs: Dict[str, Any]) -> Optional[str]:
+    """取得 return 的字串常數（或 self.<類別屬性>）"""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == "self":
+        value = class_attrs.get(node.attr)
+        return value if isinstance(value, str) else None
+    return None
+
+def _method_return(class_node: ast.ClassDef, method: str, class_attrs: Dict[str, Any]) -> Optional[str]:
+    for item in class_node.body:
+        if isinstance(item, ast.FunctionDef) and item.name == method:
+            returns = [n for n in ast.walk(item) if isinstance(n, ast.Return) and n.value is not None]
+            if len(returns) == 1:
+                return _literal(returns[0].value, class_attrs)
+    return None
+
+def scan_module(path: str) -> List[Dict[str, Optional[str]]]:
+    """
+    以 AST 找出模組中繼承 BaseTool 的類別
+
+    Returns:
+        [{"class_name", "name", "description"}]；name/description 無法靜態取得時為 None
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    found = []
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        bases = {base.id if isinstance(base, ast.Name) else getattr(base, "attr", None) for base in node.bases}
+        if "BaseTool" not in bases:
+            continue
+        class_attrs = {}
+        for item in node.body:
+            if isinstance(item, ast.Assign) and isinstance(item.value, ast.Constant):
+                for target in item.targets:
+                    if isinstance(target, ast.Name):
+                        class_attrs[target.id] = item.value.value
+        found.append({
+            "class_name": node.name,
+            "name": _method_return(node, "get_name", class_attrs),
+            "description": _method_return(node, "get_description", class_attrs),
+        })
+    return found
+
+def _import_loader(module: str, class_name: str) -> Callable[[], type]:
+    return lambda: getattr(importlib.import_module(module), class_name)
+
+class ToolRegistry(Mapping):
+    """
+    工具名稱 -> 工具實例 的唯讀對應；實例在第一次取用時才建立
+    （列出名稱與描述不會匯入工具模組）
+    """
+
+    def __init__(self, tools_dir: Optional[str] = None, entry_point_group: Optional[str] = None):
+        self.tools_dir = tools_dir or os.path.dirname(os.path.abspath(__file__))
+        self.entry_point_group = entry_point_group or getattr(config, "TOOL_ENTRY_POINT_GROUP", "autogen_mcp.tools")
+
+        self._specs: Dict[str, ToolSpec] = {}
+        self._instances: Dict[str, Any] = {}
+        self._load_stats: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.RLock()
+
+        started = time.perf_counter()
+        self._discover_modules()
+        self._discover_entry_points()
+        self._apply_order()
+        self.discovery_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    # ---- 探索 ----
+
+    def _register(self, spec: ToolSpec):
+        existing = self._specs.get(spec.name)
+        if existing is not None:
+            print(f"⚠️ 工具名稱重複：{spec.name}（{existing.class_name} 由 {spec.class_name} 取代）")
+        self._specs[spec.name] = spec
+
+    def _discover_modules(self):
+        for filename in sorted(os.listdir(self.tools_dir)):
+            module_name, ext = os.path.splitext(filename)
+            if ext != ".py" or module_name in _NON_TOOL_MODULES:
+                continue
+            module = f"tools.{module_name}"
+            try:
+                classes = scan_module(os.path.join(self.tools_dir, filename))
+            except (OSError, SyntaxError) as e:
+                print(f"⚠️ 無法掃描工具模組 {filename}: {e}")
+                continue
+
+            for found in classes:
+                loader = _import_loader(module, found["class_name"])
+                name = found["name"]
+                if name is None:
+                    # 名稱不是字串常數：只能建立實例取得；匯入或初始化失敗時略過此工具，不影響其他工具
+                    try:
+                        instance = self._instantiate(found["class_name"], loader)
+                    except Exception as e:
+                        print(f"❌ 無法載入工具 {found['class_name']}（{filename}）: {e}")
+                        continue
+                    name = instance.get_name()
+                    self._instances[name] = instance
+                self._register(ToolSpec(name, found["class_name"], loader, "module", module, found["description"]))
+
+    def _discover_entry_points(self):
+        try:
+            from importlib.metadata import entry_points
+            discovered = entry_points()
+            if hasattr(discovered, "select"):
+                points = discovered.select(group=self.entry_point_group)
+            else:
+                points = discovered.get(self.entry_point_group, [])
+        except Exception as e:
+            print(f"⚠️ 無法讀取工具 entry points: {e}")
+            return
+
+        # entry point 名稱即為工具名稱，值為 "套件.模組:類別"
+        for point in points:
+            self._register(ToolSpec(point.name, point.value.split(":")[-1], point.load, "entry_point", point.value))
+
+    def _apply_order(self):
+        """依 TOOL_ORDER 排列工具（決定 Agent 提示詞中的工具順序），未列出的工具維持探索順序"""
+        order = {name: i for i, name in enumerate(getattr(config, "TOOL_ORDER", []))}
+        names = sorted(self._specs, key=lambda name: order.get(name, len(order)))
+        self._specs = {name: self._specs[name] for name in names}
+
+    # ---- 載入 ----
+
+    def _instantiate(self, label: str, loader: Callable[[], type]):
+        """匯入並建立實例，記錄匯入與初始化時間"""
+        started = time.perf_counter()
+        tool_class = loader()
+        imported = time.perf_counter()
+        instance = tool_class()
+        initialized = time.perf_counter()
+
+        name = instance.get_name()
+        self._load_stats[name] = {
+            "import_ms": round((imported - started) * 1000, 1),
+            "init_ms": round((initialized - imported) * 1000, 1),
+        }
+        print(f"📦 載入工具 {name}（{label}，匯入 {self._load_stats[name]['import_ms']} ms，"
+              f"初始化 {self._load_stats[name]['init_ms']} ms）")
+        return instance
+
+    def __getitem__(self, name: str):
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        spec = self._specs[name]  # 未註冊的工具拋出 KeyError
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                instance = self._instantiate(spec.class_name, spec.loader)
+                self._instances[name] = instance
+        return instance
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._specs)
+
+    def __len__(self) -> int:
+        return len(self._specs)
+
+    def __contains__(self, name) -> bool:
+        return name in self._specs
+
+    # ---- 查詢 ----
+
+    def get_spec(self, name: str) -> ToolSpec:
+        return self._specs[name]
+
+    def get_description(self, name: str) -> str:
+        """工具描述；無法靜態取得時建立實例"""
+        spec = self._specs[name]
+        if spec.description is None:
+            spec.description = self[name].get_description()
+        return spec.description
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def get_load_stats(self) -> Dict[str, Any]:
+        """探索時間，以及各工具的來源、是否已載入、匯入與初始化時間"""
+        return {
+            "discovery_ms": self.discovery_ms,
+            "tools": {
+                name: {"source": spec.source, "loaded": name in self._instances, **self._load_stats.get(name, {})}
+                for name, spec in self._specs.items()
+            },
+        }
@@ -6,6 +6,8 @@
 import os
 import re
 import json
+import hashlib
+import mimetypes
 import shutil
 import tempfile
 from typing import List, Dict, Any
@@ -13,6 +15,7 @@ from pathlib import Path
 from docx import Document
 from PIL import Image
 import jieba
+import config
 
 def extract_text_from_document(file_path: str) -> Dict[str, Any]:
     """
@@ -23,40 +26,21 @@ def extract_text_from_document(file_path: str) -> Dict[str, Any]:
         file_path: 文檔路徑
         
     Returns:
-        包含標題、關鍵字、完整文字的字典
+        包含標題、關鍵字、完整文字、章節列表的字典
     """
     try:
         # 轉換 DOC 為 DOCX（如果需要）
         if file_path.lower().endswith('.doc'):
             file_path = auto_convert_doc_to_docx(file_path)
             if not file_path:
-                return {"title": "", "keywords": [], "full_text": ""}
+                return {"title": "", "keywords": [], "full_text": "", "sections": []}
         
         doc = Document(file_path)
-        
-        # 提取標題（第一個段落通常是標題）
-        title = ""
-        if doc.paragraphs:
-            title = doc.paragraphs[0].text.strip()
-        
-        # 提取全部文字
-        full_text = ""
-        for paragraph in doc.paragraphs:
-            if paragraph.text.strip():
-                full_text += paragraph.text + "\n"
-        
-        # 提取關鍵字（使用jieba分詞）
-        keywords = extract_keywords(full_text)
-        
-        return {
-            "title": title,
-            "keywords": keywords,
-            "full_text": full_text.strip()
-        }
+        return _extract_text_from_docx(doc)
         
     except Exception as e:
         print(f"提取文檔內容時發生錯誤: {e}")
-        return {"title": "", "keywords": [], "full_text": ""}
+        return {"title": "", "keywords": [], "full_text": "", "sections": []}
 
 def extract_images_from_document(file_path: str, output_dir: str) -> List[str]:
     """
@@ -80,30 +64,265 @@ def extract_images_from_document(file_path: str, output_dir: str) -> List[str]:
                 return []
         
         doc = Document(file_path)
-        image_paths = []
-        
-        # 從文檔中提取圖片
-        for rel in doc.part.rels.values():
-            if "image" in rel.target_ref:
-                img_data = rel.target_part.blob
-                
-                # 生成圖片檔名
-                filename = os.path.basename(file_path).replace('.docx', '')
-                img_filename = f"{filename}_img_{len(image_paths)+1}.png"
-                img_path = os.path.join(output_dir, img_filename)
-                
-                # 保存圖片
-                with open(img_path, 'wb') as f:
-                    f.write(img_data)
-                
-                image_paths.append(img_path)
-        
-        return image_paths
+        return _extract_images_from_docx(doc, file_path, output_dir)
         
     except Exception as e:
         print(f"提取圖片時發生錯誤: {e}")
         return []
 
+def extract_document(file_path: str, output_dir: str) -> Dict[str, Any]:
+    """
+    一次開啟文檔，同時提取文字、關鍵字與圖片
+    （供 DocumentProcessor 的多程序提取階段使用，避免同一檔案開啟兩次）
+    
+    Args:
+        file_path: 文檔路徑
+        output_dir: 圖片輸出目錄
+        
+    Returns:
+        包含標題、關鍵字、完整文字、章節列表、圖片路徑列表的字典
+    """
+    empty = {"title": "", "keywords": [], "full_text": "", "sections": [], "images": []}
+    
+    # 轉換 DOC 為 DOCX（如果需要）
+    if file_path.lower().endswith('.doc'):
+        file_path = auto_convert_doc_to_docx(file_path)
+        if not file_path:
+            return empty
+    
+    try:
+        doc = Document(file_path)
+    except Exception as e:
+        print(f"開啟文檔時發生錯誤: {e}")
+        return empty
+    
+    try:
+        result = _extract_text_from_docx(doc)
+    except Exception as e:
+        print(f"提取文檔內容時發生錯誤: {e}")
+        result = {"title": "", "keywords": [], "full_text": "", "sections": []}
+    
+    images_by_rid = {}
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        images_by_rid = _save_docx_images(doc, output_dir)
+    except Exception as e:
+        print(f"提取圖片時發生錯誤: {e}")
+    result["images"] = list(dict.fromkeys(images_by_rid.values()))
+    
+    # 章節內的圖片（文字塊依所屬章節取得對應圖片）
+    for section in result["sections"]:
+        section["images"] = list(dict.fromkeys(
+            images_by_rid[rel_id] for rel_id in section["image_rids"] if rel_id in images_by_rid
+        ))
+    
+    return result
+
+def _extract_text_from_docx(doc) -> Dict[str, Any]:
+    """從已開啟的 Document 提取標題、完整文字、章節與關鍵字"""
+    # 提取標題（第一個段落通常是標題）
+    title = ""
+    if doc.paragraphs:
+        title = doc.paragraphs[0].text.strip()
+    
+    # 依文件順序提取段落與表格（表格轉為 Markdown），保留章節結構
+    # 並記錄每個章節在完整文字中的起訖位置（供文字塊對應圖片）
+    sections = _extract_sections_from_docx(doc)
+    lines = []
+    position = 0
+    for section in sections:
+        section["start"] = position
+        for line in (section["heading"], section["text"]):
+            if line:
+                lines.append(line)
+                position += len(line) + 1
+        section["end"] = max(position - 1, section["start"])
+    full_text = "\n".join(lines)
+    
+    # 提取關鍵字（使用jieba分詞）
+    keywords = extract_keywords(full_text)
+    
+    return {
+        "title": title,
+        "keywords": keywords,
+        "full_text": full_text.strip(),
+        "sections": sections
+    }
+
+# 內嵌圖片的關聯 ID：DrawingML (a:blip/@r:embed) 與 DOC 轉檔常見的 VML (v:imagedata/@r:id)
+_IMAGE_RID_XPATH = (
+    ".//*[local-name()='blip']/@*[local-name()='embed']"
+    " | .//*[local-name()='imagedata']/@*[local-name()='id']"
+)
+
+def _heading_level(paragraph) -> int:
+    """依段落樣式判斷標題層級（Title 視為 1，非標題返回 0）"""
+    style_name = paragraph.style.name if paragraph.style is not None else ""
+    if style_name == "Title":
+        return 1
+    match = re.match(r'^(?:Heading|標題)\s*(\d)', style_name)
+    return int(match.group(1)) if match else 0
+
+def _list_level(paragraph) -> int:
+    """判斷段落是否為清單項目，返回縮排層級 + 1（非清單返回 0）"""
+    p_pr = paragraph._p.pPr
+    if p_pr is not None and p_pr.numPr is not None:
+        ilvl = p_pr.numPr.ilvl
+        return (ilvl.val if ilvl is not None else 0) + 1
+    style_name = paragraph.style.name if paragraph.style is not None else ""
+    return 1 if "List" in style_name else 0
+
+def _table_to_markdown(table) -> str:
+    """將 DOCX 表格轉為 Markdown 表格（第一列視為表頭）"""
+    rows = []
+    for row in table.rows:
+        cells = []
+        previous = None
+        for cell in row.cells:
+            # 合併儲存格會重複出現同一個 cell，只保留一次
+            if previous is not None and cell._tc is previous:
+                continue
+            previous = cell._tc
+            cells.append(" ".join(cell.text.split()).replace("|", "\\|"))
+        if any(cells):
+            rows.append(cells)
+    if not rows:
+        return ""
+    
+    width = max(len(cells) for cells in rows)
+    rows = [cells + [""] * (width - len(cells)) for cells in rows]
+    lines = ["| " + " | ".join(rows[0]) + " |", "|" + " --- |" * width]
+    lines.extend("| " + " | ".join(cells) + " |" for cells in rows[1:])
+    return "\n".join(lines)
+
+def _extract_sections_from_docx(doc) -> List[Dict[str, Any]]:
+    """
+    依文件順序將 DOCX 分為章節（以標題樣式為界）
+    
+    Returns:
+        章節列表，每筆含 heading（標題文字）、heading_path（由上層到本層的標題列表）、
+        text（本章節內文，清單項目以「- 」開頭，表格為 Markdown）、image_rids（章節內的圖片關聯 ID）
+    """
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+    
+    sections = []
+    heading_path: List[str] = []
+    current = {"heading": "", "heading_path": [], "lines": [], "image_rids": []}
+    
+    for child in doc.element.body.iterchildren():
+        tag = child.tag.rsplit('}', 1)[-1]
+        # 內嵌圖片（DrawingML 與舊版 VML）的關聯 ID，用於建立圖片與章節/文字塊的對應
+        image_rids = [str(rel_id) for rel_id in child.xpath(_IMAGE_RID_XPATH)] if tag in ('p', 'tbl') else []
+        if tag == 'p':
+            paragraph = Paragraph(child, doc)
+            text = paragraph.text.strip()
+            level = _heading_level(paragraph) if text else 0
+            if level:
+                if current["heading"] or current["lines"] or current["image_rids"]:
+                    sections.append(current)
+                heading_path = heading_path[:level - 1] + [text]
+                current = {"heading": text, "heading_path": list(heading_path), "lines": [], "image_rids": []}
+            current["image_rids"].extend(image_rids)
+            if not text or level:
+                continue
+            list_level = _list_level(paragraph)
+            current["lines"].append("  " * (list_level - 1) + "- " + text if list_level else text)
+        elif tag == 'tbl':
+            current["image_rids"].extend(image_rids)
+            markdown = _table_to_markdown(Table(child, doc))
+            if markdown:
+                current["lines"].append(markdown)
+    
+    if current["heading"] or current["lines"] or current["image_rids"]:
+        sections.append(current)
+    
+    return [
+        {
+            "heading": section["heading"],
+            "heading_path": section["heading_path"],
+            "text": "\n".join(section["lines"]),
+            "image_rids": list(dict.fromkeys(section["image_rids"]))
+        }
+        for section in sections
+    ]
+
+def _extract_images_from_docx(doc, file_path: str, output_dir: str) -> List[str]:
+    """從已開啟的 Document 提取圖片並存檔（內容相同的圖片只保存一次）"""
+    return list(dict.fromkeys(_save_docx_images(doc, output_dir).values()))
+
+def _save_docx_images(doc, output_dir: str) -> Dict[str, str]:
+    """
+    保存文檔中的圖片：以內容 SHA-256 命名並保留原始格式，已存在的圖片不重複寫入，
+    同時產生縮圖預覽（見 create_image_preview）
+    
+    Returns:
+        關聯 ID (rId) -> 圖片路徑
+    """
+    images_by_rid = {}
+    saved_parts = {}
+    
+    for rel_id, rel in doc.part.rels.items():
+        if rel.is_external or "image" not in rel.reltype:
+            continue
+        part = rel.target_part
+        # 同一張圖片可能被多個關聯引用
+        if id(part) in saved_parts:
+            images_by_rid[rel_id] = saved_parts[id(part)]
+            continue
+        
+        img_data = part.blob
+        digest = hashlib.sha256(img_data).hexdigest()[:32]
+        ext = os.path.splitext(str(part.partname))[1].lower() or mimetypes.guess_extension(part.content_type) or ".bin"
+        img_path = os.path.join(output_dir, f"{digest}{ext}")
+        
+        # 以內容雜湊命名，其他文檔已保存過的相同圖片直接沿用
+        if not os.path.exists(img_path):
+            tmp_path = f"{img_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(img_data)
+            os.replace(tmp_path, img_path)
+        create_image_preview(img_path)
+        
+        saved_parts[id(part)] = img_path
+        images_by_rid[rel_id] = img_path
+    
+    return images_by_rid
+
+def get_image_preview_path(image_path: str) -> str:
+    """圖片對應的縮圖預覽路徑（圖片目錄下的 thumbnails 子目錄）"""
+    base_name = os.path.splitext(os.path.basename(image_path))[0]
+    fmt = getattr(config, "IMAGE_PREVIEW_FORMAT", "WEBP").lower()
+    return os.path.join(os.path.dirname(image_path), "thumbnails", f"{base_name}.{fmt}")
+
+def create_image_preview(image_path: str) -> str:
+    """
+    產生縮圖預覽（已存在則直接返回）；PIL 無法開啟的格式（如 EMF/WMF）返回空字串
+    
+    Args:
+        image_path: 原始圖片路徑
+        
+    Returns:
+        預覽圖路徑
+    """
+    preview_path = get_image_preview_path(image_path)
+    if os.path.exists(preview_path):
+        return preview_path
+    
+    try:
+        with Image.open(image_path) as img:
+            img.thumbnail(tuple(getattr(config, "IMAGE_PREVIEW_SIZE", (800, 600))), Image.Resampling.LANCZOS)
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA")
+            os.makedirs(os.path.dirname(preview_path), exist_ok=True)
+            tmp_path = f"{preview_path}.{os.getpid()}.tmp"
+            img.save(tmp_path, getattr(config, "IMAGE_PREVIEW_FORMAT", "WEBP"), quality=getattr(config, "IMAGE_PREVIEW_QUALITY", 80))
+            os.replace(tmp_path, preview_path)
+        return preview_path
+    except Exception as e:
+        print(f"產生圖片預覽失敗 {os.path.basename(image_path)}: {e}")
+        return ""
+
 def auto_convert_doc_to_docx(doc_path: str, permanent: bool = False) -> str:
     """
     將 DOC 檔案轉換為 DOCX
@@ -132,55 +351,30 @@ def auto_convert_doc_to_docx(doc_path: str, permanent: bool = False) -> str:
         print(f"轉換 DOC 檔案時發生錯誤: {e}")
         return doc_path
 
-def chunk_text(text: str, chunk_size: int = 500, chunk_overlap: int = 50) -> List[str]:
+def chunk_text(text: str, chunk_size: int = 500, chunk_overlap: int = 50, method: str = None) -> List[str]:
     """
-    將文字分割成塊
+    將文字分割成塊（由 chunking 模組依分塊策略處理）
     
     Args:
-        text: 要分割的文字
-        chunk_size: 塊大小
-        chunk_overlap: 重疊大小
+        text: 要分割的文字（保留換行，段落資訊用於分塊）
+        chunk_size: 塊大小（token 數）
+        chunk_overlap: 重疊大小（token 數，以完整句子為單位）
+        method: 分塊策略（預設 config.CHUNKING_METHOD）
         
     Returns:
         文字塊列表
     """
-    if not text:
-        return []
+    from chunking import chunk_document  # 延遲載入，避免循環匯入
     
-    # 按句子分割
-    sentences = re.split(r'[。！？\n]', text)
-    chunks = []
-    current_chunk = ""
-    
-    for sentence in sentences:
-        sentence = sentence.strip()
-        if not sentence:
-            continue
-            
-        # 如果當前塊加上新句子超過大小限制
-        if len(current_chunk) + len(sentence) > chunk_size:
-            if current_chunk:
-                chunks.append(current_chunk.strip())
-                # 保留重疊部分
-                if chunk_overlap > 0:
-                    current_chunk = current_chunk[-chunk_overlap:]
-                else:
-                    current_chunk = ""
-        
-        current_chunk += sentence + "。"
-    
-    # 添加最後一塊
-    if current_chunk.strip():
-        chunks.append(current_chunk.strip())
-    
-    return chunks
+    return [chunk["text"] for chunk in chunk_document(text, method, chunk_size, chunk_overlap)]
 
-def clean_text(text: str) -> str:
+def clean_text(text: str, keep_structure: bool = False) -> str:
     """
     清理文字內容
     
     Args:
         text: 要清理的文字
+        keep_structure: 保留換行與 Markdown 符號（章節路徑、清單、表格）
         
     Returns:
         清理後的文字
@@ -188,6 +382,13 @@ def clean_text(text: str) -> str:
     if not text:
         return ""
     
+    if keep_structure:
+        # 只合併行內空白，保留換行與 Markdown 表格/清單符號
+        text = re.sub(r'[^\S\n]+', ' ', text)
+        text = re.sub(r' *\n(?: *\n)*', '\n', text)
+        text = re.sub(r'[^\u4e00-\u9fff\w\s，。！？；：「」『』（）\[\]{}.,;:!?()\-\'"|#>*/]+', '', text)
+        return text.strip()
+    
     # 移除多餘的空白字元
     text = re.sub(r'\s+', ' ', text)
     
@@ -196,6 +397,9 @@ def clean_text(text: str) -> str:
     
     return text.strip()
 
+# 中文停用詞（關鍵字提取與檢索分詞共用）
+STOPWORDS = {'的', '是', '在', '了', '有', '和', '與', '或', '但是', '然而', '因為', '所以'}
+
 def extract_keywords(text: str, max_keywords: int = 10) -> List[str]:
     """
     提取關鍵字
@@ -214,13 +418,12 @@ def extract_keywords(text: str, max_keywords: int = 10) -> List[str]:
     words = jieba.cut(text)
     
     # 過濾停用詞和短詞
-    stopwords = {'的', '是', '在', '了', '有', '和', '與', '或', '但是', '然而', '因為', '所以'}
     keywords = []
     
     for word in words:
         word = word.strip()
         if (len(word) > 1 and 
-            word not in stopwords and 
+            word not in STOPWORDS and 
             not word.isdigit() and
             not re.match(r'^[a-zA-Z]+$', word)):
             keywords.append(word)
@@ -230,6 +433,33 @@ def extract_keywords(text: str, max_keywords: int = 10) -> List[str]:
     
     return keywords
 
+def tokenize_for_search(text: str) -> List[str]:
+    """
+    檢索用分詞（BM25 倒排索引與查詢共用）
+    與 extract_keywords 使用相同的 jieba 分詞，但保留英文與數字詞，
+    以便精確比對 CHART 名稱、表名（如 HAMSPARA）與錯誤代碼
+    
+    Args:
+        text: 文字內容
+        
+    Returns:
+        詞語列表（保留重複，英文轉為小寫）
+    """
+    if not text:
+        return []
+    
+    tokens = []
+    for word in jieba.cut(text):
+        word = word.strip().lower()
+        if not word or word in STOPWORDS:
+            continue
+        # 略過純標點符號
+        if not re.search(r'[\w\u4e00-\u9fff]', word):
+            continue
+        tokens.append(word)
+    
+    return tokens
+
 def save_metadata(metadata: List[Dict], filepath: str):
     """
     保存元數據到JSON檔案